@@ -0,0 +1,76 @@
+from django import forms
+from django.conf import settings
+
+from . import pagination
+
+
+class SearchForm(forms.Form):
+    """
+    The filters accepted by the search endpoint, plus the `limit`/`offset`
+    paging parameters of the Annotator store protocol.
+    """
+    uri = forms.CharField(required=False, max_length=4096)
+    user_id = forms.IntegerField(required=False)
+    created_after = forms.DateTimeField(required=False)
+    created_before = forms.DateTimeField(required=False)
+    text = forms.CharField(required=False)
+    limit = forms.IntegerField(required=False, min_value=0)
+    offset = forms.IntegerField(required=False, min_value=0)
+
+    def clean_limit(self):
+        limit = self.cleaned_data['limit']
+        max_limit = getattr(settings, 'ANNOTATION_SEARCH_MAX_LIMIT', 1000)
+        if limit is None:
+            return getattr(settings, 'ANNOTATION_SEARCH_DEFAULT_LIMIT', 20)
+        return min(limit, max_limit)
+
+    def clean_offset(self):
+        return self.cleaned_data['offset'] or 0
+
+    def clean(self):
+        cleaned_data = super(SearchForm, self).clean()
+        unknown = sorted(set(self.data) - set(self.fields))
+        if unknown:
+            raise forms.ValidationError("Unknown search fields: %s" % ", ".join(unknown))
+        return cleaned_data
+
+    def filter(self, queryset):
+        data = self.cleaned_data
+        if data['uri']:
+            queryset = queryset.for_uri(data['uri'])
+        if data['user_id'] is not None:
+            queryset = queryset.filter(user_id=data['user_id'])
+        if data['created_after']:
+            queryset = queryset.filter(created__gte=data['created_after'])
+        if data['created_before']:
+            queryset = queryset.filter(created__lt=data['created_before'])
+        if data['text']:
+            queryset = queryset.filter(text__icontains=data['text'])
+        return queryset
+
+
+class IndexForm(forms.Form):
+    """
+    Paging parameters of the annotations index: the cursor returned in the
+    `Link` header of the previous page, the page size, and whether to
+    stream every remaining annotation instead of returning one page.
+    """
+    cursor = forms.CharField(required=False)
+    limit = forms.IntegerField(required=False, min_value=1)
+    stream = forms.BooleanField(required=False)
+
+    def clean_cursor(self):
+        cursor = self.cleaned_data['cursor']
+        if cursor:
+            try:
+                pagination.decode_cursor(cursor)
+            except pagination.InvalidCursor:
+                raise forms.ValidationError("Invalid cursor.")
+        return cursor or None
+
+    def clean_limit(self):
+        limit = self.cleaned_data['limit']
+        max_limit = getattr(settings, 'ANNOTATION_INDEX_MAX_PAGE_SIZE', 1000)
+        if limit is None:
+            return getattr(settings, 'ANNOTATION_INDEX_PAGE_SIZE', 100)
+        return min(limit, max_limit)
@@ -0,0 +1,52 @@
+import time
+
+from django.db import connection, transaction
+from django.core.management.base import BaseCommand
+
+from annotation.models import Annotation
+from annotation.serializers import AnnotationSerializer
+from conference import profiling
+
+
+RANGE = {"start": "/section[1]/p[2]", "end": "/section[1]/p[2]", "startOffset": 0, "endOffset": 42}
+
+
+class Command(BaseCommand):
+    help = ("Count the queries needed to create and to list annotations with and "
+            "without prefetching their ranges. Runs in a transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--annotations', type=int, default=1000)
+        parser.add_argument('--ranges', type=int, default=2, help="Ranges per annotation.")
+
+    def measure(self, label, func):
+        # unlike CaptureQueriesContext, not capped by the 9000 queries of
+        # the connection's query log
+        counter = profiling.QueryCounter()
+        stop = profiling.start_counting(connection, counter)
+        try:
+            start = time.time()
+            func()
+            elapsed = time.time() - start
+        finally:
+            stop()
+        self.stdout.write("%-32s %6d queries %9.1f ms" % (label, counter.queries, elapsed * 1000))
+
+    def handle(self, *args, **options):
+        uri = "http://bench.example.com/review/paper/0/"
+        data = {"text": "note", "quote": "quote", "uri": uri, "user_id": 1,
+                "user_username": "bench", "ranges": [RANGE] * options['ranges']}
+
+        def create():
+            for _ in range(options['annotations']):
+                serializer = AnnotationSerializer(data=data)
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+
+        with transaction.atomic():
+            self.measure("create %d" % options['annotations'], create)
+            annotations = Annotation.objects.for_uri(uri)
+            self.measure("list without prefetch", lambda: AnnotationSerializer(annotations.all(), many=True).data)
+            self.measure("list with prefetch",
+                         lambda: AnnotationSerializer(annotations.prefetch_related("ranges"), many=True).data)
+            transaction.set_rollback(True)
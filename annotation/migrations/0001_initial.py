@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-18 09:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Annotation',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('annotator_schema_version', models.CharField(default='v1.0', max_length=8)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('text', models.TextField()),
+                ('quote', models.TextField()),
+                ('uri', models.CharField(max_length=4096, null=True)),
+                ('user_id', models.IntegerField()),
+                ('user_username', models.CharField(max_length=128, null=True)),
+                ('consumer', models.CharField(default='thedatashed', max_length=64)),
+            ],
+            options={
+                'ordering': ('created',),
+            },
+        ),
+        migrations.CreateModel(
+            name='Range',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.CharField(max_length=128)),
+                ('end', models.CharField(max_length=128)),
+                ('startOffset', models.IntegerField()),
+                ('endOffset', models.IntegerField()),
+                ('annotation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ranges', to='annotation.Annotation')),
+            ],
+        ),
+    ]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-18 09:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conference', '0007_jobs'),
+        ('annotation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UriVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uri_hash', models.CharField(max_length=40, unique=True)),
+                ('version', models.IntegerField(default=0)),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='annotation',
+            name='paper',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='annotations', to='conference.Paper'),
+        ),
+        migrations.AddField(
+            model_name='annotation',
+            name='uri_hash',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+        migrations.AlterField(
+            model_name='annotation',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='annotation',
+            name='user_id',
+            field=models.IntegerField(db_index=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='annotation',
+            index_together=set([('uri_hash', 'created')]),
+        ),
+    ]
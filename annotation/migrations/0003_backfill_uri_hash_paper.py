@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import hashlib
+import re
+
+from django.db import migrations, transaction
+from django.utils.six.moves.urllib.parse import urlparse
+
+
+BATCH_SIZE = 1000
+
+# Annotation.hash_uri and Annotation.paper_id_for_uri when this migration
+# was written
+PAPER_URI_RE = re.compile(r"/review/paper/(\d+)/?$")
+
+
+def hash_uri(uri):
+    if uri is None:
+        return ""
+    return hashlib.sha1(uri.encode("utf-8")).hexdigest()
+
+
+def paper_id_for_uri(uri):
+    if not uri:
+        return None
+    match = PAPER_URI_RE.search(urlparse(uri).path)
+    return int(match.group(1)) if match else None
+
+
+def backfill(apps, schema_editor):
+    """
+    Sets the uri hash and the paper of the annotations stored before they
+    existed, a batch of primary keys per transaction so large tables aren't
+    locked for the whole migration.
+    """
+    Annotation = apps.get_model('annotation', 'Annotation')
+    Paper = apps.get_model('conference', 'Paper')
+    unhashed = Annotation.objects.filter(uri_hash="").order_by('pk')
+    last = None
+    while True:
+        batch = unhashed if last is None else unhashed.filter(pk__gt=last)
+        rows = list(batch.values_list('pk', 'uri')[:BATCH_SIZE])
+        if not rows:
+            break
+        last = rows[-1][0]
+        by_hash, by_paper = {}, {}
+        for pk, uri in rows:
+            by_hash.setdefault(hash_uri(uri), []).append(pk)
+            paper_id = paper_id_for_uri(uri)
+            if paper_id is not None:
+                by_paper.setdefault(paper_id, []).append(pk)
+        existing = Paper.objects.filter(pk__in=list(by_paper)).values_list('pk', flat=True)
+        with transaction.atomic():
+            for uri_hash, pks in by_hash.items():
+                if uri_hash:
+                    Annotation.objects.filter(pk__in=pks).update(uri_hash=uri_hash)
+            for paper_id in existing:
+                Annotation.objects.filter(pk__in=by_paper[paper_id]).update(paper=paper_id)
+
+
+class Migration(migrations.Migration):
+
+    # every batch commits on its own
+    atomic = False
+
+    dependencies = [
+        ('annotation', '0002_paper_uri_hash_versions'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import re
+
+from django.db import migrations, transaction
+
+
+BATCH_SIZE = 1000
+
+# Annotator stored the ranges of a paper relative to the <body> of its
+# review page, where the paper is rendered in the content column of
+# base12.html (/div[1]/div[1]/div[1]) after the page's own title, reviewer
+# notice (h4), paper title (h2) and event paragraph. Ranges are relative
+# to the #paper-body element now, i.e. to the paper's body, which is what
+# the write-back resolves them against. Flash messages shown above the
+# paper while annotating shifted its top-level divs too; that can't be told
+# from the stored paths, such ranges are converted as if there were none.
+PAGE_PREFIX = "/div[1]/div[1]/div[1]"
+PAGE_SIBLINGS = {'title': 1, 'h4': 1, 'h2': 1, 'p': 1}
+
+step_re = re.compile(r"^/([a-z][a-z0-9]*)\[(\d+)\](.*)$")
+
+
+def paper_body_path(path):
+    """
+    Returns the paper body relative path of the review page relative
+    ``path``, or None if it doesn't point into the paper.
+    """
+    if not path.startswith(PAGE_PREFIX + "/"):
+        return None
+    match = step_re.match(path[len(PAGE_PREFIX):])
+    if match is None:
+        return None
+    tag, index, rest = match.groups()
+    index = int(index) - PAGE_SIBLINGS.get(tag, 0)
+    if index < 1:
+        # the page's title or event paragraph
+        return None
+    return "/%s[%d]%s" % (tag, index, rest)
+
+
+def convert_ranges(apps, schema_editor):
+    Range = apps.get_model('annotation', 'Range')
+    ranges = Range.objects.filter(annotation__paper__isnull=False).order_by('pk')
+    last = 0
+    while True:
+        rows = list(ranges.filter(pk__gt=last).values_list('pk', 'start', 'end')[:BATCH_SIZE])
+        if not rows:
+            break
+        last = rows[-1][0]
+        with transaction.atomic():
+            for pk, start, end in rows:
+                new_start, new_end = paper_body_path(start), paper_body_path(end)
+                if new_start is not None and new_end is not None:
+                    Range.objects.filter(pk=pk).update(start=new_start, end=new_end)
+
+
+class Migration(migrations.Migration):
+
+    # every batch commits on its own
+    atomic = False
+
+    dependencies = [
+        ('annotation', '0003_backfill_uri_hash_paper'),
+    ]
+
+    operations = [
+        migrations.RunPython(convert_ranges, migrations.RunPython.noop),
+    ]
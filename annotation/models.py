@@ -1,26 +1,117 @@
+import hashlib
+import re
 import uuid
 from django.db import models
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.six.moves.urllib.parse import urlparse
 
+# path of the page papers are annotated on (the paper_review url), whatever
+# the host or the prefix the site is deployed under
+PAPER_URI_RE = re.compile(r"/review/paper/(\d+)/?$")
+
+# sent with the annotations inserted by bulk_create(), which sends no
+# post_save, once their ranges are saved too
+annotations_bulk_created = Signal(providing_args=["annotations"])
+
+
+class AnnotationQuerySet(models.QuerySet):
+
+    def for_uri(self, uri):
+        return self.filter(uri_hash=Annotation.hash_uri(uri), uri=uri)
+
+    def for_uris(self, uris):
+        return self.filter(uri_hash__in=[Annotation.hash_uri(uri) for uri in uris], uri__in=uris)
 
 
 class Annotation(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4)
     annotator_schema_version = models.CharField(max_length=8, default="v1.0")
-    created = models.DateTimeField(auto_now_add=True)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
     updated = models.DateTimeField(auto_now=True)
     text = models.TextField()
     quote = models.TextField()
     # TODO: These should not be blank; `django-rest-framework` seems
     #     to require it...
     uri = models.CharField(max_length=4096, blank=False, null=True)
-    user_id = models.IntegerField()
+    # `uri` is too long to index on every backend, lookups go through its hash
+    uri_hash = models.CharField(max_length=40, blank=True, editable=False)
+    user_id = models.IntegerField(db_index=True)
     user_username = models.CharField(max_length=128, blank=False, null=True)
     # user = models.CharField(max_length=128, blank=False, null=True)
     consumer = models.CharField(max_length=64, default="thedatashed")
+    # set from `uri` on save, see `paper_id_for_uri`
+    paper = models.ForeignKey('conference.Paper', related_name="annotations", null=True, blank=True,
+                              editable=False, on_delete=models.SET_NULL)
+
+    objects = AnnotationQuerySet.as_manager()
 
     class Meta:
         ordering = ('created',)
+        index_together = (('uri_hash', 'created'),)
+
+    @staticmethod
+    def hash_uri(uri):
+        if uri is None:
+            return ""
+        return hashlib.sha1(uri.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def paper_id_for_uri(uri):
+        """
+        Returns the id of the paper whose review page is ``uri``, or None.
+        """
+        if not uri:
+            return None
+        match = PAPER_URI_RE.search(urlparse(uri).path)
+        return int(match.group(1)) if match else None
+
+    def link_paper(self):
+        paper_id = self.paper_id_for_uri(self.uri)
+        if paper_id != self.paper_id:
+            Paper = self._meta.get_field('paper').related_model
+            self.paper_id = paper_id if Paper.objects.filter(pk=paper_id).exists() else None
+
+    @classmethod
+    def link_papers(cls, annotations):
+        """
+        Sets the uri hash and the paper of unsaved ``annotations`` with one
+        query, for bulk_create().
+        """
+        paper_ids = [cls.paper_id_for_uri(annotation.uri) for annotation in annotations]
+        Paper = cls._meta.get_field('paper').related_model
+        existing = set(Paper.objects.filter(pk__in=set(paper_ids) - set([None])).values_list('pk', flat=True))
+        for annotation, paper_id in zip(annotations, paper_ids):
+            annotation.uri_hash = cls.hash_uri(annotation.uri)
+            annotation.paper_id = paper_id if paper_id in existing else None
+
+    def cache_ranges(self, ranges):
+        """
+        Makes ``self.ranges.all()`` return ``ranges`` without a query, the
+        way prefetch_related('ranges') does.
+        """
+        queryset = self.ranges.all()
+        queryset._result_cache = list(ranges)
+        queryset._prefetch_done = True
+        if not hasattr(self, '_prefetched_objects_cache'):
+            self._prefetched_objects_cache = {}
+        self._prefetched_objects_cache['ranges'] = queryset
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Annotation, cls).from_db(db, field_names, values)
+        # the uri stored in the database, whose version changes too when an
+        # annotation is moved to another uri
+        instance._loaded_uri = instance.__dict__.get('uri')
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.uri_hash = self.hash_uri(self.uri)
+        self.link_paper()
+        super(Annotation, self).save(*args, **kwargs)
 
     # def save(self, *args, **kwargs):
     #     print args
@@ -36,3 +127,45 @@ class Range(models.Model):
     startOffset = models.IntegerField()
     endOffset = models.IntegerField()
     annotation = models.ForeignKey(Annotation, related_name="ranges")
+
+
+class UriVersion(models.Model):
+    """
+    Counts the changes to the annotations of a uri, so clients can tell
+    with a conditional GET whether the annotations of a paper changed.
+    """
+    uri_hash = models.CharField(max_length=40, unique=True)
+    version = models.IntegerField(default=0)
+    updated = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def bump(cls, uri):
+        uri_hash = Annotation.hash_uri(uri)
+        changes = {'version': F('version') + 1, 'updated': timezone.now()}
+        if not cls.objects.filter(uri_hash=uri_hash).update(**changes):
+            _, created = cls.objects.get_or_create(uri_hash=uri_hash, defaults={'version': 1})
+            if not created:
+                cls.objects.filter(uri_hash=uri_hash).update(**changes)
+
+    @classmethod
+    def current(cls, uri):
+        try:
+            return cls.objects.get(uri_hash=Annotation.hash_uri(uri))
+        except cls.DoesNotExist:
+            return cls(uri_hash=Annotation.hash_uri(uri), version=0, updated=None)
+
+
+def annotation_changed(sender, instance, **kwargs):
+    UriVersion.bump(instance.uri)
+    loaded_uri = getattr(instance, '_loaded_uri', instance.uri)
+    if loaded_uri != instance.uri:
+        UriVersion.bump(loaded_uri)
+    instance._loaded_uri = instance.uri
+
+def annotations_created(sender, annotations, **kwargs):
+    for uri in set(annotation.uri for annotation in annotations):
+        UriVersion.bump(uri)
+
+post_save.connect(annotation_changed, sender=Annotation)
+post_delete.connect(annotation_changed, sender=Annotation)
+annotations_bulk_created.connect(annotations_created, sender=Annotation)
@@ -0,0 +1,78 @@
+"""
+Keyset pagination over annotations ordered by ``(created, id)``.
+
+Cursors are opaque to clients: the ``created`` timestamp and ``id`` of the
+last annotation of a page, base64 encoded. Pages never use OFFSET, so
+fetching a page costs the same wherever it is in the store.
+"""
+import base64
+import uuid
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.renderers import JSONRenderer
+
+from .serializers import AnnotationSerializer
+
+
+ORDERING = ("created", "id")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(annotation):
+    raw = "%s|%s" % (annotation.created.isoformat(), annotation.id)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    try:
+        created, pk = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+    except (TypeError, ValueError):
+        raise InvalidCursor(cursor)
+    try:
+        created = parse_datetime(created)
+        pk = uuid.UUID(pk)
+    except ValueError:
+        raise InvalidCursor(cursor)
+    if created is None:
+        raise InvalidCursor(cursor)
+    return created, pk
+
+def after(queryset, created, pk):
+    return queryset.filter(Q(created__gt=created) | Q(created=created, id__gt=pk))
+
+
+def page(queryset, cursor, limit):
+    """
+    Returns the annotations following ``cursor`` (None for the first page)
+    and the cursor of the next page, None if this is the last one.
+    """
+    queryset = queryset.order_by(*ORDERING).prefetch_related("ranges")
+    if cursor:
+        queryset = after(queryset, *decode_cursor(cursor))
+    annotations = list(queryset[:limit + 1])
+    if len(annotations) > limit:
+        return annotations[:limit], encode_cursor(annotations[limit - 1])
+    return annotations, None
+
+
+def stream_json(queryset, chunk_size, cursor=None):
+    """
+    Yields a JSON array of the serialized annotations of ``queryset``,
+    ``chunk_size`` annotations at a time.
+    """
+    renderer = JSONRenderer()
+    yield b"["
+    first = True
+    while True:
+        annotations, cursor = page(queryset, cursor, chunk_size)
+        if annotations:
+            rendered = renderer.render(AnnotationSerializer(annotations, many=True).data)
+            # strip the brackets around the chunk
+            yield (b"" if first else b",") + rendered[1:-1]
+            first = False
+        if cursor is None:
+            break
+    yield b"]"
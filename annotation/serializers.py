@@ -1,12 +1,45 @@
+from django.db import transaction
 from rest_framework import serializers
-from .models import Range, Annotation
+from .models import Range, Annotation, annotations_bulk_created
+
+
+RANGE_FIELDS = ("start", "end", "startOffset", "endOffset",)
 
 
 class RangeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Range
-        fields = ("start", "end", "startOffset", "endOffset",)
+        fields = RANGE_FIELDS
+
+
+def range_key(data):
+    return tuple(data[field] for field in RANGE_FIELDS)
+
+
+class AnnotationListSerializer(serializers.ListSerializer):
+
+    @transaction.atomic
+    def create(self, validated_data):
+        """
+        Inserts all the annotations, and then all their ranges, with one
+        bulk insert each.
+        """
+        annotations, ranges = [], []
+        for data in validated_data:
+            ranges_data = data.pop("ranges")
+            annotation = Annotation(**data)
+            annotation_ranges = [Range(annotation=annotation, **range_data) for range_data in ranges_data]
+            annotation.cache_ranges(annotation_ranges)
+            annotations.append(annotation)
+            ranges.extend(annotation_ranges)
+        Annotation.link_papers(annotations)
+        # the uuid primary keys are set on instantiation, so the ranges
+        # already point at their annotation
+        Annotation.objects.bulk_create(annotations)
+        Range.objects.bulk_create(ranges)
+        annotations_bulk_created.send(sender=Annotation, annotations=annotations)
+        return annotations
 
 
 class AnnotationSerializer(serializers.ModelSerializer):
@@ -14,23 +47,48 @@ class AnnotationSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Annotation
+        list_serializer_class = AnnotationListSerializer
         fields = ("id", "annotator_schema_version", "created", "updated", "text", "quote", "uri", "user_id", "user_username", "consumer", "ranges",)
 
+    @transaction.atomic
     def create(self, validated_data):
         ranges_data = validated_data.pop("ranges")
-        print ranges_data
         annotation = Annotation.objects.create(**validated_data)
-        for range_data in ranges_data:
-            Range.objects.create(annotation=annotation, **range_data)
+        ranges = [Range(annotation=annotation, **range_data) for range_data in ranges_data]
+        Range.objects.bulk_create(ranges)
+        annotation.cache_ranges(ranges)
         return annotation
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ranges_data = validated_data.pop("ranges")
-        print ranges_data
+        ranges_data = validated_data.pop("ranges", None)
         for field in validated_data.keys():
             setattr(instance, field, validated_data[field])
         instance.save()
-        # TODO: Support UPDATE for Ranges...
-#        for range_data in ranges_data:
-#            Range.objects.create(annotation=annotation, **range_data)
+        if ranges_data is not None:
+            self.replace_ranges(instance, ranges_data)
         return instance
+
+    def replace_ranges(self, instance, ranges_data):
+        """
+        Makes the ranges of ``instance`` match ``ranges_data``, leaving the
+        rows that didn't change alone.
+        """
+        existing = {}
+        # not instance.ranges, which may be cached ranges without their pks
+        for range_ in Range.objects.filter(annotation=instance):
+            existing.setdefault(range_key(range_.__dict__), []).append(range_)
+        ranges, new = [], []
+        for range_data in ranges_data:
+            same = existing.get(range_key(range_data))
+            if same:
+                ranges.append(same.pop())
+            else:
+                range_ = Range(annotation=instance, **range_data)
+                ranges.append(range_)
+                new.append(range_)
+        stale = [range_.pk for same in existing.values() for range_ in same]
+        if stale:
+            Range.objects.filter(pk__in=stale).delete()
+        Range.objects.bulk_create(new)
+        instance.cache_ranges(ranges)
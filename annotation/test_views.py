@@ -1,15 +1,22 @@
+import base64
+import importlib
 import json
+from django.apps import apps
+from django.contrib.auth.models import AnonymousUser, User
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import TestCase
 from django.test.client import RequestFactory
-from urllib.parse import urljoin
-from annotation import views
+from django.test.utils import CaptureQueriesContext
+from django.utils.six.moves.urllib.parse import parse_qsl, urljoin
+from annotation import models, serializers, views
 
 
 class IndexTest(TestCase):
 
     def setUp(self):
         self.factory = RequestFactory()
+        self.user = User.objects.create_user("reviewer")
         self.index_create_url = reverse("index_create")
         self.read_update_delete_url = reverse("read_update_delete",
                                               kwargs={"pk": None})
@@ -32,6 +39,7 @@ class IndexTest(TestCase):
         request = self.factory.post(self.index_create_url,
                                     data=json.dumps(self.annotation),
                                     content_type="application/json")
+        request.user = self.user
         response = views.index_create(request)
         return response
         
@@ -43,8 +51,12 @@ class IndexTest(TestCase):
         self.assertEquals(0, len(content))
 
         response = self.create_annotation()
-        self.assertEquals(303, response.status_code)
+        self.assertEquals(201, response.status_code)
         self.assertTrue(response.has_header("Location"))
+        content = json.loads(response.content.decode("utf-8"))
+        for key in self.annotation.keys():
+            self.assertEquals(self.annotation.get(key), content.get(key))
+        self.assertEquals("reviewer", content["user_username"])
 
         request = self.factory.get(self.index_create_url)
         response = views.index_create(request)
@@ -65,3 +77,326 @@ class IndexTest(TestCase):
         for key in self.annotation.keys():
             self.assertEquals(content.get(key), self.annotation.get(key))
 
+
+    def test_writes_return_the_annotation(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.create_annotation()
+        # the ranges in the response aren't read back
+        self.assertFalse([query for query in queries if query["sql"].startswith('SELECT "annotation_range"')])
+        pk = json.loads(response.content.decode("utf-8"))["id"]
+        self.annotation["text"] = "Edited"
+        self.annotation["ranges"].append({"start": "/p[1]", "end": "/p[1]", "startOffset": 1, "endOffset": 2})
+        self.annotation["user_id"] = self.user.pk
+        request = self.factory.put(self.index_create_url, data=json.dumps(self.annotation),
+                                   content_type="application/json")
+        request.user = self.user
+        response = views.read_update_delete(request, pk)
+        self.assertEquals(200, response.status_code)
+        content = json.loads(response.content.decode("utf-8"))
+        self.assertEquals("Edited", content["text"])
+        self.assertEquals(self.annotation["ranges"], content["ranges"])
+
+    def test_invalid_writes_are_rejected(self):
+        for body in ("{not json", "[]", json.dumps({"text": "no ranges"})):
+            request = self.factory.post(self.index_create_url, data=body, content_type="application/json")
+            request.user = self.user
+            response = views.index_create(request)
+            self.assertEquals(400, response.status_code)
+            self.assertIn("errors", json.loads(response.content.decode("utf-8")))
+        pk = json.loads(self.create_annotation().content.decode("utf-8"))["id"]
+        request = self.factory.put(self.index_create_url, data=json.dumps({"text": "no ranges"}),
+                                   content_type="application/json")
+        request.user = self.user
+        response = views.read_update_delete(request, pk)
+        self.assertEquals(400, response.status_code)
+        self.assertIn("ranges", json.loads(response.content.decode("utf-8"))["errors"])
+
+    def test_only_owners_and_staff_change_an_annotation(self):
+        pk = json.loads(self.create_annotation().content.decode("utf-8"))["id"]
+        other = User.objects.create_user("other")
+        self.annotation["user_id"] = other.pk
+        for user in (other, AnonymousUser()):
+            request = self.factory.put(self.index_create_url, data=json.dumps(self.annotation),
+                                       content_type="application/json")
+            request.user = user
+            self.assertEquals(403, views.read_update_delete(request, pk).status_code)
+            request = self.factory.delete(self.index_create_url)
+            request.user = user
+            self.assertEquals(403, views.read_update_delete(request, pk).status_code)
+
+        other.is_staff = True
+        request = self.factory.put(self.index_create_url, data=json.dumps(self.annotation),
+                                   content_type="application/json")
+        request.user = other
+        response = views.read_update_delete(request, pk)
+        self.assertEquals(200, response.status_code)
+        self.assertEquals(self.user.pk, json.loads(response.content.decode("utf-8"))["user_id"])
+        request = self.factory.delete(self.index_create_url)
+        request.user = other
+        self.assertEquals(204, views.read_update_delete(request, pk).status_code)
+
+
+class SearchTest(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.search_url = reverse("search")
+        for n in range(5):
+            models.Annotation.objects.create(text="note %d" % n, quote="quote", user_id=n % 2,
+                                             uri="http://example.com/%d/" % (n % 2))
+
+    def search(self, **params):
+        response = views.search(self.factory.get(self.search_url, params))
+        return response.status_code, json.loads(response.content.decode("utf-8"))
+
+    def test_filters_and_pagination(self):
+        status, content = self.search(uri="http://example.com/0/", limit=2)
+        self.assertEqual(200, status)
+        self.assertEqual(3, content["total"])
+        self.assertEqual(["note 0", "note 2"], [row["text"] for row in content["rows"]])
+
+        status, content = self.search(uri="http://example.com/0/", limit=2, offset=2)
+        self.assertEqual(["note 4"], [row["text"] for row in content["rows"]])
+
+        status, content = self.search(user_id=1, text="NOTE 3")
+        self.assertEqual(1, content["total"])
+
+    def test_unknown_field_is_rejected(self):
+        status, content = self.search(quote__startswith="q")
+        self.assertEqual(400, status)
+
+
+class AnnotationSerializerTest(TestCase):
+
+    def setUp(self):
+        self.data = {"text": "note", "quote": "quote", "uri": "http://example.com", "user_id": 1,
+                     "ranges": [{"start": "/p[%d]" % n, "end": "/p[%d]" % n, "startOffset": 0, "endOffset": 5}
+                                for n in range(3)]}
+
+    def save(self, data, instance=None):
+        serializer = serializers.AnnotationSerializer(instance, data=data)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        return serializer.save()
+
+    def test_update_replaces_changed_ranges_only(self):
+        annotation = self.save(self.data)
+        kept = annotation.ranges.get(start="/p[0]").pk
+        self.data["ranges"] = self.data["ranges"][:1] + [
+            {"start": "/p[9]", "end": "/p[9]", "startOffset": 1, "endOffset": 2}]
+        self.save(self.data, annotation)
+        ranges = models.Range.objects.filter(annotation=annotation).order_by("start")
+        self.assertEqual(["/p[0]", "/p[9]"], [r.start for r in ranges])
+        self.assertEqual(kept, ranges[0].pk)
+
+
+class IndexPaginationTest(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.index_create_url = reverse("index_create")
+        for n in range(5):
+            models.Annotation.objects.create(text="note %d" % n, quote="quote", user_id=1,
+                                             uri="http://example.com")
+
+    def get(self, **params):
+        return views.index_create(self.factory.get(self.index_create_url, params))
+
+    def test_cursor_pages(self):
+        texts, params = [], {"limit": 2}
+        while True:
+            response = self.get(**params)
+            texts.extend(row["text"] for row in json.loads(response.content.decode("utf-8")))
+            if not response.has_header("Link"):
+                break
+            query = response["Link"].split("?", 1)[1].split(">", 1)[0]
+            params = dict(parse_qsl(query))
+        self.assertEqual(["note %d" % n for n in range(5)], texts)
+
+    def test_stream(self):
+        with self.settings(ANNOTATION_STREAM_CHUNK_SIZE=2):
+            response = self.get(stream="1")
+            content = json.loads(b"".join(response.streaming_content).decode("utf-8"))
+        self.assertEqual(["note %d" % n for n in range(5)], [row["text"] for row in content])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(400, self.get(cursor="nonsense").status_code)
+        forged = base64.urlsafe_b64encode(b"2016-01-01T00:00:00|1 OR 1=1").decode("ascii")
+        self.assertEqual(400, self.get(cursor=forged).status_code)
+
+
+class ConditionalGetTest(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.uri = "http://example.com/review/paper/1/"
+        self.annotation = models.Annotation.objects.create(text="note", quote="quote", user_id=1, uri=self.uri)
+
+    def search(self, **headers):
+        request = self.factory.get(reverse("search"), {"uri": self.uri}, **headers)
+        return views.search(request)
+
+    def test_search_not_modified_until_annotations_change(self):
+        etag = self.search()["ETag"]
+        self.assertEqual(304, self.search(HTTP_IF_NONE_MATCH=etag).status_code)
+
+        models.Annotation.objects.create(text="other", quote="quote", user_id=1, uri="http://example.com/")
+        self.assertEqual(304, self.search(HTTP_IF_NONE_MATCH=etag).status_code)
+
+        models.Annotation.objects.create(text="another", quote="quote", user_id=1, uri=self.uri)
+        response = self.search(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response["ETag"])
+
+    def test_moving_an_annotation_changes_both_uris(self):
+        other = "http://example.com/review/paper/2/"
+        versions = models.UriVersion.current(self.uri).version, models.UriVersion.current(other).version
+        annotation = models.Annotation.objects.get(pk=self.annotation.pk)
+        annotation.uri = other
+        annotation.save()
+        self.assertEqual((versions[0] + 1, versions[1] + 1),
+                         (models.UriVersion.current(self.uri).version, models.UriVersion.current(other).version))
+
+        # and back, with the instance that was just saved
+        annotation.uri = self.uri
+        annotation.save()
+        self.assertEqual((versions[0] + 2, versions[1] + 2),
+                         (models.UriVersion.current(self.uri).version, models.UriVersion.current(other).version))
+
+    def test_read_not_modified(self):
+        url = reverse("read_update_delete", kwargs={"pk": self.annotation.pk})
+        response = views.read_update_delete(self.factory.get(url), str(self.annotation.pk))
+        request = self.factory.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(304, views.read_update_delete(request, str(self.annotation.pk)).status_code)
+
+
+class PaperLinkTest(TestCase):
+
+    def setUp(self):
+        from conference.models import Event, Paper
+        user = User.objects.create_user("author")
+        event = Event.objects.create(name="Test Event", acronym="TE")
+        self.paper = Paper.objects.create(title="Paper", abstract="abstract", event=event, submited_by=user,
+                                          paper_file="papers/paper.html")
+
+    def test_paper_is_parsed_from_the_uri(self):
+        for host in ("http://127.0.0.1:8000", "https://example.com/wsgi"):
+            annotation = models.Annotation.objects.create(
+                text="note", quote="quote", user_id=1, uri="%s/review/paper/%d/" % (host, self.paper.pk))
+            self.assertEqual(self.paper.pk, annotation.paper_id)
+        for uri in ("http://example.com/", "http://example.com/review/paper/%d/" % (self.paper.pk + 1)):
+            self.assertIsNone(models.Annotation.objects.create(text="note", quote="quote", user_id=1, uri=uri).paper_id)
+        self.assertEqual(2, self.paper.annotations.count())
+
+    def test_backfill(self):
+        migration = importlib.import_module("annotation.migrations.0003_backfill_uri_hash_paper")
+        uri = "http://example.com/review/paper/%d/" % self.paper.pk
+        for _ in range(3):
+            models.Annotation.objects.create(text="note", quote="quote", user_id=1, uri=uri)
+        models.Annotation.objects.update(paper=None, uri_hash="")
+        migration.backfill(apps, None)
+        self.assertEqual(3, self.paper.annotations.count())
+        self.assertEqual(3, models.Annotation.objects.for_uri(uri).count())
+
+
+class BatchTest(TestCase):
+
+    def setUp(self):
+        from conference.models import Event, Paper
+        self.user = User.objects.create_user("reviewer", password="secret")
+        event = Event.objects.create(name="Test Event", acronym="TE")
+        self.paper = Paper.objects.create(title="Paper", abstract="abstract", event=event, submited_by=self.user,
+                                          paper_file="papers/paper.html")
+        self.uri = "http://example.com/review/paper/%d/" % self.paper.pk
+        self.client.login(username="reviewer", password="secret")
+        self.existing = [models.Annotation.objects.create(text="old", quote="quote", user_id=self.user.pk,
+                                                          user_username="reviewer", uri=self.uri)
+                         for _ in range(2)]
+
+    def annotation(self, text):
+        return {"text": text, "quote": "quote", "uri": self.uri,
+                "ranges": [{"start": "/p[1]", "end": "/p[1]", "startOffset": 0, "endOffset": 5}]}
+
+    def post(self, operations):
+        response = self.client.post(reverse("batch"), json.dumps(operations), content_type="application/json")
+        return response.status_code, json.loads(response.content.decode("utf-8"))
+
+    def test_operations_are_applied_in_one_request(self):
+        version = models.UriVersion.current(self.uri).version
+        operations = [{"action": "create", "annotation": self.annotation("new %d" % n)} for n in range(50)]
+        operations += [
+            {"action": "update", "id": str(self.existing[0].pk),
+             "annotation": dict(self.annotation("updated"), user_id=self.user.pk + 1, user_username="chair")},
+            {"action": "delete", "id": self.existing[1].pk.hex},
+        ]
+        # the same with 5 creates: the creates are two bulk inserts, the
+        # rest is the update, the delete, the session and the signals
+        with self.assertNumQueries(32):
+            status, content = self.post(operations)
+        self.assertEqual(200, status)
+        results = content["results"]
+        self.assertEqual([201] * 50 + [200, 204], [result["status"] for result in results])
+        self.assertEqual("new 7", results[7]["annotation"]["text"])
+        self.assertEqual(self.annotation("x")["ranges"], results[7]["annotation"]["ranges"])
+        self.assertEqual("reviewer", results[7]["annotation"]["user_username"])
+        self.assertEqual("updated", results[50]["annotation"]["text"])
+        self.assertEqual((self.user.pk, "reviewer"),
+                         (results[50]["annotation"]["user_id"], results[50]["annotation"]["user_username"]))
+        self.assertEqual(str(self.existing[1].pk), results[51]["id"])
+
+        self.assertEqual(51, self.paper.annotations.count())
+        self.assertEqual(50, models.Range.objects.filter(annotation__text__startswith="new").count())
+        self.assertGreater(models.UriVersion.current(self.uri).version, version)
+
+    def test_invalid_batch_applies_nothing(self):
+        status, content = self.post([
+            {"action": "create", "annotation": self.annotation("new")},
+            {"action": "create", "annotation": {"text": "no ranges"}},
+            {"action": "delete", "id": "00000000-0000-0000-0000-000000000000"},
+            {"action": "delete", "id": "not a uuid"},
+            {"action": "rename"},
+        ])
+        self.assertEqual(400, status)
+        self.assertEqual([424, 400, 404, 400, 400], [result["status"] for result in content["results"]])
+        self.assertIn("ranges", content["results"][1]["errors"])
+        self.assertEqual(2, models.Annotation.objects.count())
+
+    def test_only_owners_and_staff_change_annotations(self):
+        other = User.objects.create_user("other", password="secret")
+        self.client.login(username="other", password="secret")
+        status, content = self.post([
+            {"action": "create", "annotation": self.annotation("new")},
+            {"action": "update", "id": str(self.existing[0].pk), "annotation": self.annotation("mine now")},
+            {"action": "delete", "id": str(self.existing[1].pk)},
+        ])
+        self.assertEqual(400, status)
+        self.assertEqual([424, 403, 403], [result["status"] for result in content["results"]])
+        self.assertEqual(["old", "old"], sorted(models.Annotation.objects.values_list("text", flat=True)))
+
+        other.is_staff = True
+        other.save()
+        status, content = self.post([
+            {"action": "update", "id": str(self.existing[0].pk), "annotation": self.annotation("moderated")},
+            {"action": "delete", "id": str(self.existing[1].pk)},
+        ])
+        self.assertEqual([200, 204], [result["status"] for result in content["results"]])
+        self.assertEqual(self.user.pk, content["results"][0]["annotation"]["user_id"])
+        self.assertEqual(["moderated"], list(models.Annotation.objects.values_list("text", flat=True)))
+
+    def test_requires_a_list_and_a_user(self):
+        self.assertEqual(400, self.post({"action": "create"})[0])
+        self.assertEqual(400, self.post([])[0])
+        self.client.logout()
+        self.assertEqual(403, self.client.post(reverse("batch"), "[]", content_type="application/json").status_code)
+
+
+class PaperBodyRangesMigrationTest(TestCase):
+
+    def test_review_page_paths_become_paper_body_paths(self):
+        migration = importlib.import_module("annotation.migrations.0004_paper_body_ranges")
+        self.assertEqual("/section[2]/p[3]", migration.paper_body_path("/div[1]/div[1]/div[1]/section[2]/p[3]"))
+        self.assertEqual("/p[1]", migration.paper_body_path("/div[1]/div[1]/div[1]/p[2]"))
+        self.assertEqual("/div[1]/em[1]", migration.paper_body_path("/div[1]/div[1]/div[1]/div[1]/em[1]"))
+        # the page's own paper title and event paragraph
+        self.assertIsNone(migration.paper_body_path("/div[1]/div[1]/div[1]/h2[1]/a[1]"))
+        self.assertIsNone(migration.paper_body_path("/div[1]/div[1]/div[1]/p[1]"))
+        self.assertIsNone(migration.paper_body_path("/section[1]/p[1]"))
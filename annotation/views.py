@@ -1,13 +1,23 @@
+import hashlib
+import uuid
+
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse, HttpResponseForbidden
+from django.db import transaction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.utils.http import urlencode
 from django.shortcuts import get_object_or_404
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from django.views.generic import TemplateView
+from rest_framework.exceptions import ParseError
 from rest_framework.renderers import JSONRenderer
 from rest_framework.parsers import JSONParser
-from django.contrib.auth.models import User
 
+from . import forms
 from . import models
+from . import pagination
 from . import serializers
 
 class JSONResponse(HttpResponse):
@@ -20,6 +30,71 @@ class JSONResponse(HttpResponse):
         super(JSONResponse, self).__init__(content, **kwargs)
 
 
+def get_uri_version(request, uri):
+    # the ETag and Last-Modified functions share one lookup per request
+    if not hasattr(request, "_uri_versions"):
+        request._uri_versions = {}
+    if uri not in request._uri_versions:
+        request._uri_versions[uri] = models.UriVersion.current(uri)
+    return request._uri_versions[uri]
+
+def get_annotation(request, pk):
+    if getattr(request, "_annotation", None) is None:
+        request._annotation = get_object_or_404(models.Annotation, pk=pk)
+    return request._annotation
+
+def make_etag(version, *parts):
+    key = ":".join([version.uri_hash, str(version.version)] + list(parts))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def search_etag(request):
+    if request.method != "GET" or not request.GET.get("uri"):
+        return None
+    version = get_uri_version(request, request.GET["uri"])
+    return make_etag(version, urlencode(sorted(request.GET.lists()), doseq=True))
+
+def search_last_modified(request):
+    if request.method != "GET" or not request.GET.get("uri"):
+        return None
+    return get_uri_version(request, request.GET["uri"]).updated
+
+def annotation_etag(request, pk):
+    if request.method != "GET":
+        return None
+    annotation = get_annotation(request, pk)
+    return make_etag(get_uri_version(request, annotation.uri), str(annotation.pk))
+
+def annotation_last_modified(request, pk):
+    if request.method != "GET":
+        return None
+    return get_uri_version(request, get_annotation(request, pk).uri).updated
+
+
+def can_change(user, annotation):
+    # users only update and delete their own annotations, staff any of them
+    return user.is_authenticated() and (annotation.user_id == user.id or user.is_staff)
+
+
+def with_owner(data, annotation):
+    # an update keeps the owner, whoever the client says it is
+    return dict(data, user_id=annotation.user_id, user_username=annotation.user_username)
+
+
+def parse_body(request, expected, field):
+    """
+    Returns the JSON body of ``request`` and None, or None and a 400
+    response if the body isn't JSON of the ``expected`` type.
+    """
+    try:
+        data = JSONParser().parse(request)
+    except ParseError as e:
+        return None, JSONResponse({"errors": {field: [str(e.detail)]}}, status=400)
+    if not isinstance(data, expected):
+        return None, JSONResponse({"errors": {field: ["Expected a JSON %s." % (
+            "list" if expected is list else "object")]}}, status=400)
+    return data, None
+
+
 def root(request):
     return JSONResponse({"name": "The DataShed Annotation Store.", "version": "0.0.1"})
 
@@ -27,59 +102,183 @@ def root(request):
 @csrf_exempt
 def index_create(request):
     if request.method == "GET":
-        annotations = models.Annotation.objects.all()
+        form = forms.IndexForm(request.GET)
+        if not form.is_valid():
+            return JSONResponse({"errors": form.errors}, status=400)
+        cursor, limit = form.cleaned_data["cursor"], form.cleaned_data["limit"]
+        if form.cleaned_data["stream"]:
+            chunk_size = getattr(settings, "ANNOTATION_STREAM_CHUNK_SIZE", 500)
+            chunks = pagination.stream_json(models.Annotation.objects.all(), chunk_size, cursor)
+            return StreamingHttpResponse(chunks, content_type="application/json")
+        annotations, next_cursor = pagination.page(models.Annotation.objects.all(), cursor, limit)
         serializer = serializers.AnnotationSerializer(annotations, many=True)
-        return JSONResponse(serializer.data)
+        response = JSONResponse(serializer.data)
+        if next_cursor:
+            response["Link"] = '<%s?%s>; rel="next"' % (
+                request.path, urlencode({"cursor": next_cursor, "limit": limit}))
+        return response
     elif request.method == "POST":
-        user = User.objects.get(id=request.user.id)
-        data = JSONParser().parse(request)
-        data['user_id'] = user.id
-        data['user_username'] = user.username
+        if not request.user.is_authenticated():
+            return HttpResponseForbidden()
+        data, error = parse_body(request, dict, "annotation")
+        if error is not None:
+            return error
+        data['user_id'] = request.user.id
+        data['user_username'] = request.user.username
         serializer = serializers.AnnotationSerializer(data=data)
-
-        if serializer.is_valid():
-            serializer.save()
-            response = HttpResponse(status=303)
-            response["Location"] = reverse("read_update_delete",
-                                           kwargs={"pk": serializer.data["id"]})
-            return response
+        if not serializer.is_valid():
+            return JSONResponse({"errors": serializer.errors}, status=400)
+        serializer.save()
+        # the ranges are the saved objects, they aren't queried again
+        response = JSONResponse(serializer.data, status=201)
+        response["Location"] = reverse("read_update_delete", kwargs={"pk": serializer.data["id"]})
+        return response
     else:
         return HttpResponseForbidden()
 
 
 @csrf_exempt
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=annotation_etag, last_modified_func=annotation_last_modified)
 def read_update_delete(request, pk):
     if request.method == "GET":
-        annotation = get_object_or_404(models.Annotation, pk=pk)
+        annotation = get_annotation(request, pk)
         serializer = serializers.AnnotationSerializer(annotation)
         # print(serializer.data)
         return JSONResponse(serializer.data, status=200)
     elif request.method == "PUT":
         annotation = get_object_or_404(models.Annotation, pk=pk)
-        data = JSONParser().parse(request)
-        serializer = serializers.AnnotationSerializer(annotation, data=data)
-
-        if serializer.is_valid():
-            serializer.save()
-            response = HttpResponse(status=303)
-            response["Location"] = reverse("read_update_delete",
-                                           kwargs={"pk": serializer.data["id"]})
-            return response
-
+        if not can_change(request.user, annotation):
+            return HttpResponseForbidden()
+        data, error = parse_body(request, dict, "annotation")
+        if error is not None:
+            return error
+        serializer = serializers.AnnotationSerializer(annotation, data=with_owner(data, annotation))
+        if not serializer.is_valid():
+            return JSONResponse({"errors": serializer.errors}, status=400)
+        serializer.save()
+        return JSONResponse(serializer.data, status=200)
     elif request.method == "DELETE":
         annotation = get_object_or_404(models.Annotation, pk=pk)
+        if not can_change(request.user, annotation):
+            return HttpResponseForbidden()
         annotation.delete()
         return HttpResponse(status=204)
     else:
         return HttpResponseForbidden()
 
 
+BATCH_ACTIONS = ("create", "update", "delete")
+
+
+def parse_operation(operation, seen):
+    """
+    Returns the ``(status, errors)`` of a malformed batch operation, or
+    None. The id of updates and deletes is normalized.
+    """
+    if not isinstance(operation, dict) or operation.get("action") not in BATCH_ACTIONS:
+        return 400, {"action": ["Must be one of %s." % ", ".join(BATCH_ACTIONS)]}
+    if operation["action"] != "delete" and not isinstance(operation.get("annotation"), dict):
+        return 400, {"annotation": ["This field is required."]}
+    if operation["action"] != "create":
+        try:
+            operation["id"] = str(uuid.UUID(str(operation.get("id"))))
+        except ValueError:
+            return 400, {"id": ["Must be a valid UUID."]}
+        if operation["id"] in seen:
+            return 400, {"id": ["Already changed by another operation of this batch."]}
+        seen.add(operation["id"])
+    return None
+
+
+@csrf_exempt
+def batch(request):
+    """
+    Applies a list of operations in one transaction:
+
+        [{"action": "create", "annotation": {...}},
+         {"action": "update", "id": "...", "annotation": {...}},
+         {"action": "delete", "id": "..."}]
+
+    and returns ``{"results": [...]}`` with one result per operation, in
+    order: its status (201, 200 or 204) and the saved annotation. Users
+    other than staff only update and delete their own annotations. If any
+    operation is invalid nothing is applied, the response is a 400 and the
+    results hold the errors (status 400, 403 or 404) of the invalid
+    operations and a 424 for the others.
+    """
+    if request.method != "POST" or not request.user.is_authenticated():
+        return HttpResponseForbidden()
+    operations, error = parse_body(request, list, "batch")
+    if error is not None:
+        return error
+    max_size = getattr(settings, "ANNOTATION_BATCH_MAX_SIZE", 1000)
+    if not 0 < len(operations) <= max_size:
+        return JSONResponse({"errors": {"batch": ["Expected a list of 1 to %d operations." % max_size]}},
+                            status=400)
+
+    seen = set()
+    errors = [parse_operation(operation, seen) for operation in operations]
+    existing = dict((str(pk), annotation) for pk, annotation in
+                    models.Annotation.objects.in_bulk(list(seen)).items())
+
+    creates, updates = [], {}
+    for i, operation in enumerate(operations):
+        if errors[i] is not None:
+            continue
+        if operation["action"] == "create":
+            data = dict(operation["annotation"], user_id=request.user.id, user_username=request.user.username)
+            creates.append((i, data))
+        elif operation["id"] not in existing:
+            errors[i] = 404, {"id": ["Not found."]}
+        elif not can_change(request.user, existing[operation["id"]]):
+            errors[i] = 403, {"id": ["Not one of your annotations."]}
+        elif operation["action"] == "update":
+            annotation = existing[operation["id"]]
+            serializer = serializers.AnnotationSerializer(annotation, data=with_owner(operation["annotation"], annotation))
+            if serializer.is_valid():
+                updates[i] = serializer
+            else:
+                errors[i] = 400, serializer.errors
+    create_serializer = serializers.AnnotationSerializer(data=[data for _, data in creates], many=True)
+    if creates and not create_serializer.is_valid():
+        for (i, _), item_errors in zip(creates, create_serializer.errors):
+            if item_errors:
+                errors[i] = 400, item_errors
+
+    if any(errors):
+        results = [{"status": 424} if error is None else {"status": error[0], "errors": error[1]}
+                   for error in errors]
+        return JSONResponse({"results": results}, status=400)
+
+    results = [None] * len(operations)
+    with transaction.atomic():
+        if creates:
+            for (i, _), annotation in zip(creates, create_serializer.save()):
+                results[i] = {"status": 201, "annotation": serializers.AnnotationSerializer(annotation).data}
+        for i, serializer in sorted(updates.items()):
+            serializer.save()
+            results[i] = {"status": 200, "annotation": serializer.data}
+        deletes = [(i, operation["id"]) for i, operation in enumerate(operations) if operation["action"] == "delete"]
+        if deletes:
+            models.Annotation.objects.filter(pk__in=[pk for _, pk in deletes]).delete()
+        for i, pk in deletes:
+            results[i] = {"status": 204, "id": pk}
+    return JSONResponse({"results": results})
+
+
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=search_etag, last_modified_func=search_last_modified)
 def search(request):
     if request.method == "GET":
-        query = {k: v for k, v in request.GET.items()}
-        annotations = models.Annotation.objects.filter(**query)
-        serializer = serializers.AnnotationSerializer(annotations, many=True)
-        return JSONResponse({"total": len(serializer.data), "rows": serializer.data})
+        form = forms.SearchForm(request.GET)
+        if not form.is_valid():
+            return JSONResponse({"errors": form.errors}, status=400)
+        annotations = form.filter(models.Annotation.objects.all()).order_by("created", "id")
+        offset, limit = form.cleaned_data["offset"], form.cleaned_data["limit"]
+        page = annotations.prefetch_related("ranges")[offset:offset + limit]
+        serializer = serializers.AnnotationSerializer(page, many=True)
+        return JSONResponse({"total": annotations.count(), "rows": serializer.data})
     else:
         return HttpResponseForbidden()
 
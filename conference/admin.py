@@ -1,5 +1,5 @@
 from django.contrib import admin
-from conference.models import Event, Paper, Profile, Review, Reviewer, Author, PC_Member, Chair
+from conference.models import Event, Paper, Profile, Review, Reviewer, Author, PC_Member, Chair, Job
 
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth import get_user_model
@@ -32,6 +32,10 @@ class ChairAdmin(admin.ModelAdmin):
 class PC_MemberAdmin(admin.ModelAdmin):
 	list_display = ('user', 'event')
 
+class JobAdmin(admin.ModelAdmin):
+	list_display = ('id', 'kind', 'event', 'status', 'progress', 'attempts', 'message', 'created', 'finished')
+	list_filter = ('status', 'kind')
+
 admin.site.register(Event, EventAdmin)
 admin.site.register(Paper, PaperAdmin)
 admin.site.register(Review, ReviewAdmin)
@@ -41,3 +45,4 @@ admin.site.register(Reviewer, ReviewerAdmin)
 admin.site.register(Author, AuthorAdmin)
 admin.site.register(Chair, ChairAdmin)
 admin.site.register(PC_Member, PC_MemberAdmin)
+admin.site.register(Job, JobAdmin)
@@ -5,3 +5,8 @@ from django.apps import AppConfig
 
 class ConferenceConfig(AppConfig):
     name = 'conference'
+
+    def ready(self):
+        # connects the role cache, event stats, fragment cache and search
+        # index handlers
+        from conference import roles, stats, fragment_cache, search
@@ -0,0 +1,257 @@
+"""
+Incremental event archives.
+
+The reviews and annotations of every paper of an event are packed as JSON
+into their own small tar segment under ``MEDIA_ROOT/<acronym>/archive/``. A
+manifest records the content hash of every paper (its file, reviews and
+annotations) and the size and mtime of its file, so closing the event again
+only re-packs the papers that changed. Downloads assemble the archive on the
+fly: a tar header, the paper file itself (the copy written back when the
+event was closed, see conference/writeback.py, if it's up to date) and the
+paper's segment, for every paper, followed by the tar end-of-archive
+marker. The paper files are never
+copied and the whole archive never exists on disk or in memory; since every
+part has a known size, any byte range of it can be served.
+"""
+import hashlib
+import json
+import os
+import tarfile
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import JSONRenderer
+
+from annotation.models import Annotation
+from annotation.serializers import AnnotationSerializer
+from conference.models import Paper, Review
+from conference.writeback import output_path
+
+
+CHUNK_SIZE = 64 * 1024
+BLOCK_SIZE = tarfile.BLOCKSIZE
+END_OF_ARCHIVE = tarfile.NUL * (BLOCK_SIZE * 2)
+
+
+def event_dir(event):
+    return os.path.join(settings.MEDIA_ROOT, event.acronym)
+
+def segment_dir(event):
+    return os.path.join(event_dir(event), "archive")
+
+def manifest_path(event):
+    return os.path.join(segment_dir(event), "manifest.json")
+
+
+def tar_header(name, size, mtime):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(mtime)
+    return info.tobuf(tarfile.GNU_FORMAT)
+
+def tar_padding(size):
+    remainder = size % BLOCK_SIZE
+    return tarfile.NUL * (BLOCK_SIZE - remainder) if remainder else b""
+
+def tar_member(name, data, mtime):
+    return tar_header(name, len(data), mtime) + data + tar_padding(len(data))
+
+def to_json(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True, indent=2).encode("utf-8")
+
+
+def paper_contents(event):
+    """
+    Yields ``(paper, reviews_json, annotations_json)`` for every paper of
+    ``event`` using one query each for papers, reviews and annotations.
+    """
+    papers = list(Paper.objects.filter(event=event).order_by('id'))
+
+    reviews = {}
+    for review in Review.objects.filter(event=event).select_related('reviewer').order_by('id'):
+        reviews.setdefault(review.paper_id, []).append({
+            'reviewer': review.reviewer.username,
+            'decision': review.get_decision_display(),
+            'rate': review.rate,
+            'comment': review.comment,
+            'review_date': review.review_date,
+        })
+
+    annotations = {}
+    for annotation in Annotation.objects.filter(paper__event=event).prefetch_related('ranges'):
+        annotations.setdefault(annotation.paper_id, []).append(annotation)
+
+    for paper in papers:
+        serialized = AnnotationSerializer(annotations.get(paper.pk, []), many=True).data
+        yield paper, to_json(reviews.get(paper.pk, [])), JSONRenderer().render(serialized)
+
+
+def archived_file(paper):
+    """
+    Returns the name (relative to MEDIA_ROOT) of the file archived for
+    ``paper``: its written back copy, unless the paper file is newer.
+    """
+    annotated = output_path(paper.paper_file.path)
+    try:
+        if os.stat(annotated).st_mtime >= os.stat(paper.paper_file.path).st_mtime:
+            return output_path(paper.paper_file.name)
+    except OSError:
+        pass
+    return paper.paper_file.name
+
+
+def paper_hash(paper, name, reviews_json, annotations_json):
+    stat = os.stat(os.path.join(settings.MEDIA_ROOT, name))
+    digest = hashlib.sha1()
+    digest.update(to_json([paper.title, paper.status, paper.decided_by_id,
+                           name, stat.st_mtime, stat.st_size]))
+    digest.update(reviews_json)
+    digest.update(annotations_json)
+    return digest.hexdigest()
+
+
+def write_segment(path, event, paper, reviews_json, annotations_json):
+    prefix = "%s/papers/%s" % (event.acronym, paper.pk)
+    now = time.time()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as out:
+        out.write(tar_member(prefix + "/reviews.json", reviews_json, now))
+        out.write(tar_member(prefix + "/annotations.json", annotations_json, now))
+    os.rename(tmp_path, path)
+
+
+def load_manifest(event):
+    try:
+        with open(manifest_path(event)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def build_event_archive(event, progress=None):
+    """
+    Brings the segments of ``event`` up to date and returns the manifest.
+    Papers whose content hash didn't change since the last build are not
+    re-packed. ``progress(done, total)`` is called after every paper.
+    """
+    directory = segment_dir(event)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    previous = (load_manifest(event) or {}).get('papers', {})
+
+    papers = {}
+    decisions = []
+    packed = 0
+    total = Paper.objects.filter(event=event).count() if progress else 0
+    for paper, reviews_json, annotations_json in paper_contents(event):
+        name = archived_file(paper)
+        digest = paper_hash(paper, name, reviews_json, annotations_json)
+        segment = "%s-%s.tar" % (paper.pk, digest)
+        path = os.path.join(directory, segment)
+        entry = previous.get(str(paper.pk))
+        if entry is None or entry['hash'] != digest or not os.path.exists(path):
+            write_segment(path, event, paper, reviews_json, annotations_json)
+            packed += 1
+        stat = os.stat(os.path.join(settings.MEDIA_ROOT, name))
+        papers[str(paper.pk)] = {'hash': digest, 'segment': segment, 'segment_size': os.path.getsize(path),
+                                 'file': name, 'file_size': stat.st_size,
+                                 'file_mtime': stat.st_mtime}
+        decisions.append({'id': paper.pk, 'title': paper.title, 'status': paper.get_status_display()})
+        if progress:
+            progress(len(papers), total)
+
+    manifest = {
+        'built': time.time(),
+        'packed': packed,
+        'event': to_json({'name': event.name, 'acronym': event.acronym, 'papers': decisions}).decode("utf-8"),
+        'papers': papers,
+    }
+
+    tmp_path = manifest_path(event) + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.rename(tmp_path, manifest_path(event))
+
+    keep = set(entry['segment'] for entry in papers.values())
+    for name in os.listdir(directory):
+        if name.endswith(".tar") and name not in keep:
+            os.remove(os.path.join(directory, name))
+    return manifest
+
+
+def file_path(entry):
+    return os.path.join(settings.MEDIA_ROOT, entry['file'])
+
+def is_current(event, manifest):
+    """
+    Tells whether the paper files and segments of ``manifest`` are still
+    the ones it was built from, so its size and content are right.
+    """
+    directory = segment_dir(event)
+    for entry in manifest['papers'].values():
+        if 'file' not in entry:
+            # built before paper files were streamed from their own location
+            return False
+        try:
+            stat = os.stat(file_path(entry))
+        except OSError:
+            return False
+        if stat.st_size != entry['file_size'] or stat.st_mtime != entry['file_mtime']:
+            return False
+        if not os.path.exists(os.path.join(directory, entry['segment'])):
+            return False
+    return True
+
+
+def archive_parts(event, manifest):
+    """
+    Returns the parts of the archive in order, either bytes or ``(path,
+    size)`` of a file.
+    """
+    parts = [tar_member("%s/event.json" % event.acronym, manifest['event'].encode("utf-8"), manifest['built'])]
+    directory = segment_dir(event)
+    for key in sorted(manifest['papers'], key=int):
+        entry = manifest['papers'][key]
+        name = "%s/papers/%s/%s" % (event.acronym, key, os.path.basename(entry['file']))
+        parts.append(tar_header(name, entry['file_size'], entry['file_mtime']))
+        parts.append((file_path(entry), entry['file_size']))
+        parts.append(tar_padding(entry['file_size']))
+        parts.append((os.path.join(directory, entry['segment']), entry['segment_size']))
+    parts.append(END_OF_ARCHIVE)
+    return parts
+
+def part_size(part):
+    return part[1] if isinstance(part, tuple) else len(part)
+
+def archive_size(event, manifest):
+    return sum(part_size(part) for part in archive_parts(event, manifest))
+
+def stream_event_archive(event, manifest, start=0, end=None):
+    """
+    Yields the bytes ``start`` to ``end`` (inclusive, the last byte by
+    default) of the tar archive described by ``manifest``.
+    """
+    chunk_size = getattr(settings, 'DOWNLOAD_CHUNK_SIZE', CHUNK_SIZE)
+    offset = 0
+    for part in archive_parts(event, manifest):
+        size = part_size(part)
+        first = max(start - offset, 0)
+        last = size if end is None else min(end + 1 - offset, size)
+        offset += size
+        if first >= last:
+            if end is not None and offset > end:
+                break
+            continue
+        if not isinstance(part, tuple):
+            yield part[first:last]
+            continue
+        with open(part[0], 'rb') as f:
+            f.seek(first)
+            remaining = last - first
+            while remaining > 0:
+                data = f.read(min(chunk_size, remaining))
+                if not data:
+                    raise IOError("%s is shorter than the archive manifest says" % part[0])
+                remaining -= len(data)
+                yield data
@@ -0,0 +1,226 @@
+"""
+Benchmark suite of the review workflow, run by the ``benchmark`` management
+command.
+
+generate() fills the database with a synthetic conference: events chaired
+by one user, papers with RASH HTML files, reviewers who are PC members of
+every event with a review on each of their papers, and annotations spread
+over the paragraphs of every paper. Benchmark then drives the hot endpoints
+through the Django test client and records, per scenario, the status codes,
+the number and time of SQL queries, the p50/p95/max latency and the peak
+resident memory of the process.
+
+Results are plain dicts, stored as JSON by the command so two runs (e.g.
+of two commits) can be compared with compare().
+"""
+import json
+import os
+import random
+import resource
+import time
+from collections import Counter, OrderedDict
+
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client
+
+from annotation.models import Annotation, Range
+from conference import jobs, profiling
+from conference.management.commands.bench_paper_cache import synthetic_paper
+from conference.management.commands.bench_writeback import synthetic_annotations
+from conference.models import Chair, Event, Paper, PC_Member, Review, Reviewer
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def peak_rss():
+    # kilobytes on Linux, bytes on OS X
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def review_uri(paper):
+    return "http://testserver" + reverse("paper_review", kwargs={"pk": paper.pk})
+
+
+def generate(owner, reviewers, media_root, events=2, papers=10, reviewers_per_paper=3, annotations=100,
+             paper_size=64 * 1024, seed=0):
+    """
+    Creates ``events`` events chaired by ``owner`` with ``papers`` papers
+    each, written under ``media_root``. Every paper gets
+    ``reviewers_per_paper`` of the ``reviewers`` users, a review by each of
+    them and ``annotations`` annotations. Returns the events and the papers.
+    """
+    rand = random.Random(seed)
+    prefix = "bench-%s" % owner.pk
+    directory = os.path.join(media_root, "papers")
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    content = synthetic_paper(paper_size)
+
+    created_events, created_papers = [], []
+    for e in range(events):
+        event = Event.objects.create(name="%s event %d" % (prefix, e), acronym="%s-%d" % (prefix, e))
+        Chair.objects.create(user=owner, event=event)
+        for reviewer in reviewers:
+            PC_Member.objects.create(user=reviewer, event=event)
+        created_events.append(event)
+        for p in range(papers):
+            name = "%s-%d-%d.html" % (prefix, e, p)
+            with open(os.path.join(directory, name), "w") as f:
+                f.write(content)
+            paper = Paper.objects.create(title="%s paper %d %d" % (prefix, e, p), abstract="Synthetic paper.",
+                                         event=event, submited_by=owner, paper_file="papers/" + name)
+            for reviewer in rand.sample(reviewers, min(reviewers_per_paper, len(reviewers))):
+                Reviewer.objects.create(user=reviewer, paper=paper)
+                Review.objects.create(paper=paper, event=event, reviewer=reviewer, comment="Review of %s" % name,
+                                      decision=rand.choice(Review.DECISION_CHOICES)[0],
+                                      rate=rand.choice(Review.RATE_CHOICES)[0])
+            created_papers.append(paper)
+            add_annotations(paper, owner, annotations, seed=rand.random())
+    return created_events, created_papers
+
+
+def add_annotations(paper, user, count, seed=0):
+    uri = review_uri(paper)
+    annotations, ranges = [], []
+    for spec in synthetic_annotations(paper.paper_file.path, count, seed=seed):
+        annotation = Annotation(text=spec['text'], quote="", uri=uri, uri_hash=Annotation.hash_uri(uri),
+                                user_id=user.pk, user_username=user.username, paper=paper)
+        annotations.append(annotation)
+        ranges.extend(Range(annotation=annotation, start=start, startOffset=start_offset, end=end,
+                            endOffset=end_offset)
+                      for start, start_offset, end, end_offset in spec['ranges'])
+    Annotation.objects.bulk_create(annotations)
+    Range.objects.bulk_create(ranges)
+
+
+class Benchmark(object):
+    """
+    Drives the endpoints as ``user`` (the chair of every generated event)
+    and collects the results of each scenario in ``results``.
+    """
+
+    def __init__(self, user, events, papers, repeat=20):
+        self.client = Client()
+        self.client.force_login(user)
+        self.user = user
+        self.events = events
+        self.papers = papers
+        self.repeat = repeat
+        self.results = OrderedDict()
+
+    def measure(self, name, request, repeat=None):
+        """
+        Calls ``request(i)`` ``repeat`` times, it returns a response or, for
+        work done outside a request, None.
+        """
+        repeat = repeat or self.repeat
+        rss_before = peak_rss()
+        timings, sql_timings, queries, statuses = [], [], [], Counter()
+        for i in range(repeat):
+            counter = profiling.QueryCounter()
+            stop = profiling.start_counting(connection, counter)
+            try:
+                start = time.time()
+                response = request(i)
+                if response is not None and response.streaming:
+                    # a download isn't served until its body is
+                    for _ in response.streaming_content:
+                        pass
+                timings.append(time.time() - start)
+            finally:
+                stop()
+            sql_timings.append(counter.time)
+            queries.append(counter.queries)
+            statuses[response.status_code if response is not None else "-"] += 1
+        self.results[name] = {
+            'requests': repeat,
+            'status': dict((str(status), count) for status, count in statuses.items()),
+            'queries': {'min': min(queries), 'max': max(queries), 'mean': float(sum(queries)) / repeat},
+            'sql_ms': sum(sql_timings) * 1000 / repeat,
+            'p50_ms': percentile(timings, 0.5) * 1000,
+            'p95_ms': percentile(timings, 0.95) * 1000,
+            'max_ms': max(timings) * 1000,
+            'peak_rss_kb': peak_rss(),
+            'rss_growth_kb': peak_rss() - rss_before,
+        }
+        return self.results[name]
+
+    def paper(self, i):
+        return self.papers[i % len(self.papers)]
+
+    def event(self, i):
+        return self.events[i % len(self.events)]
+
+    def annotation_payload(self, paper, text):
+        return json.dumps({
+            "text": text, "quote": "quote", "uri": review_uri(paper),
+            # Annotator sends the whole annotation back on update
+            "user_id": self.user.pk, "user_username": self.user.username,
+            "ranges": [{"start": "/section[1]/p[1]", "end": "/section[1]/p[1]", "startOffset": 0,
+                        "endOffset": 10}],
+        })
+
+    def run_close_job(self, i):
+        event = self.event(i)
+        # the job queued by the close request
+        job = jobs.enqueue('close_event', key=jobs.close_event_key(event), event=event, event_id=event.pk)
+        jobs.run(job.pk)
+
+    def run(self):
+        client = self.client
+        self.measure("home", lambda i: client.get(reverse("home")))
+        self.measure("events", lambda i: client.get(reverse("events")))
+        self.measure("event detail", lambda i: client.get(self.event(i).get_absolute_url()))
+        self.measure("paper detail", lambda i: client.get(self.paper(i).get_absolute_url()))
+        self.measure("paper review", lambda i: client.get(reverse("paper_review", kwargs={"pk": self.paper(i).pk})))
+        self.measure("annotation search", lambda i: client.get(
+            reverse("search"), {"uri": review_uri(self.paper(i)), "limit": 100}))
+
+        created = []
+
+        def create(i):
+            response = client.post(reverse("index_create"), self.annotation_payload(self.paper(i), "new %d" % i),
+                                   content_type="application/json")
+            created.append(response["Location"].rstrip("/").rsplit("/", 1)[-1])
+            return response
+        self.measure("annotation create", create)
+        self.measure("annotation read", lambda i: client.get(
+            reverse("read_update_delete", kwargs={"pk": created[i % len(created)]})))
+        self.measure("annotation update", lambda i: client.put(
+            reverse("read_update_delete", kwargs={"pk": created[i % len(created)]}),
+            self.annotation_payload(self.paper(i), "updated %d" % i), content_type="application/json"))
+        self.measure("annotation delete", lambda i: client.delete(
+            reverse("read_update_delete", kwargs={"pk": created[i]})), repeat=len(created))
+
+        # every event is closed once: the request, then the write-back and
+        # archive job it queues, run in this process
+        closing = len(self.events)
+        self.measure("event close", lambda i: client.get(
+            reverse("event_close", kwargs={"pk": self.event(i).pk})), repeat=closing)
+        self.measure("event close job", self.run_close_job, repeat=closing)
+        self.measure("event download", lambda i: client.get(reverse("event_download", kwargs={"pk": self.event(i).pk})))
+        return self.results
+
+
+def compare(previous, current, threshold=1.2):
+    """
+    Returns ``(scenario, message)`` for every scenario of ``current`` that
+    runs more queries than in ``previous``, or whose p95 latency grew by
+    more than ``threshold`` times.
+    """
+    regressions = []
+    for name, result in current['scenarios'].items():
+        before = previous['scenarios'].get(name)
+        if before is None:
+            continue
+        if result['queries']['max'] > before['queries']['max']:
+            regressions.append((name, "queries %d -> %d" % (before['queries']['max'], result['queries']['max'])))
+        if before['p95_ms'] and result['p95_ms'] > before['p95_ms'] * threshold:
+            regressions.append((name, "p95 %.1f ms -> %.1f ms" % (before['p95_ms'], result['p95_ms'])))
+    return regressions
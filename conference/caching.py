@@ -0,0 +1,20 @@
+"""
+Whether a cache backend can hold data across requests.
+
+The role, fragment and user lookup caches are invalidated by model signals,
+which only reach the cache of the process that saved the model. With the
+default LocMemCache (no CACHES setting) every process has its own cache and
+the other processes would keep serving stale entries, so these caches are
+only used with a backend shared by every process (memcached, redis, the
+database or file based caches).
+"""
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def is_shared(alias=DEFAULT_CACHE_ALIAS):
+    return not isinstance(caches[alias], PROCESS_LOCAL_BACKENDS)
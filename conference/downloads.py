@@ -0,0 +1,79 @@
+"""
+Streaming downloads with HTTP Range, If-Range and If-Modified-Since
+support.
+
+The content is produced by a ``read(start, end)`` generator, so it doesn't
+have to be a file: an event archive is assembled on the fly from the paper
+files and their review/annotation segments (see conference/archive.py).
+That is also why there is no X-Sendfile mode, the front web server has no
+single file to send. A single byte range is served as a 206 so interrupted
+downloads can resume.
+"""
+import re
+
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.static import was_modified_since
+
+
+range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    Returns the ``(start, end)`` byte positions (inclusive) requested by a
+    single-range Range header, None if the header should be ignored, or
+    raises ValueError if the range can't be satisfied.
+    """
+    match = range_re.match(header.strip())
+    if not match:
+        # malformed and multi-range requests get the whole content
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Unsatisfiable range %r" % header)
+    return start, end
+
+
+def serve_stream(request, read, size, mtime, content_type, filename=None):
+    """
+    Returns a response streaming ``size`` bytes of content last modified at
+    ``mtime``. ``read(start, end)`` yields the bytes ``start`` to ``end``
+    (inclusive) of the content.
+    """
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), mtime, size):
+        return HttpResponseNotModified()
+
+    byte_range = None
+    if 'HTTP_RANGE' in request.META:
+        # a range of a different version of the content is useless, the
+        # whole content is sent instead
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range is None or parse_http_date_safe(if_range) == int(mtime):
+            try:
+                byte_range = parse_range(request.META['HTTP_RANGE'], size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */%d' % size
+                return response
+
+    if byte_range is None:
+        response = StreamingHttpResponse(read(0, size - 1), content_type=content_type)
+        response['Content-Length'] = str(size)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(read(start, end), content_type=content_type, status=206)
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(mtime)
+    if filename:
+        response['Content-Disposition'] = 'attachment; filename=%s' % filename
+    return response
@@ -1,4 +1,7 @@
 from django import forms
+from django.conf import settings
+
+from conference import lookup, search
 from conference.models import Event, Paper, Profile, Review
 
 
@@ -22,3 +25,48 @@ class ReviewForm(forms.ModelForm):
         model = Review
 
         fields = ['decision', 'rate', 'comment']
+
+class UserLookupForm(forms.Form):
+    """
+    Parameters of the user lookup endpoint: the prefix to search, the
+    cursor of the page and its size, and optionally the event whose PC
+    members the search is restricted to and the paper whose reviewers are
+    left out.
+    """
+    q = forms.CharField(required=False, max_length=250)
+    cursor = forms.CharField(required=False)
+    limit = forms.IntegerField(required=False, min_value=1)
+    event = forms.IntegerField(required=False)
+    paper = forms.IntegerField(required=False)
+
+    def clean_q(self):
+        return self.cleaned_data['q'].strip()
+
+    def clean_cursor(self):
+        cursor = self.cleaned_data['cursor']
+        if not cursor:
+            return None
+        try:
+            return lookup.decode_cursor(cursor)
+        except lookup.InvalidCursor:
+            raise forms.ValidationError("Invalid cursor.")
+
+    def clean_limit(self):
+        limit = self.cleaned_data['limit']
+        max_limit = getattr(settings, 'USER_LOOKUP_MAX_PAGE_SIZE', 100)
+        if limit is None:
+            return getattr(settings, 'USER_LOOKUP_PAGE_SIZE', 20)
+        return min(limit, max_limit)
+
+
+class SearchForm(forms.Form):
+    """
+    Full-text search, optionally restricted to an event and to kinds of
+    documents, see conference/search.py.
+    """
+    q = forms.CharField(max_length=250)
+    event = forms.IntegerField(required=False)
+    kind = forms.MultipleChoiceField(choices=search.KIND_CHOICES, required=False)
+
+    def clean_q(self):
+        return self.cleaned_data['q'].strip()
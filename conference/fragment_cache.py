@@ -0,0 +1,176 @@
+"""
+Cache of rendered template fragments for the listings every logged-in user
+hits (home page, events page, the papers table of an event).
+
+A fragment is stored under a key made of its name, the current version of
+every namespace it depends on and, for role-specific sections, the user.
+Saving or deleting an Event, Paper, Profile (and the rows shown next to
+them) bumps the version of the affected namespaces, so stale fragments are
+never read again and simply expire. Namespaces are either global
+('events', 'papers', 'profiles', 'reviews') or scoped to one event
+('event:<id>') or, for its reviewers, one paper ('paper:<id>').
+
+Fragments are only cached when the cache is shared by every process (see
+conference/caching.py): the signals bump the versions in the cache of the
+saving process only. User saves bump 'profiles' too, since fragments show
+usernames, except for the last_login update of every login.
+
+Hits and misses are counted per fragment name in every process; see
+counters().
+
+    FRAGMENT_CACHE = {
+        'CACHE_ALIAS': 'default',
+        'TIMEOUT': 600,
+    }
+"""
+import hashlib
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db.models.signals import post_save, post_delete
+
+from conference.caching import is_shared
+from conference.models import Event, Paper, Profile, Review, Reviewer, Chair, PC_Member
+
+
+DEFAULTS = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 600,
+}
+
+_counters = defaultdict(lambda: {'hits': 0, 'misses': 0})
+_counters_lock = threading.Lock()
+
+
+def get_setting(name):
+    return getattr(settings, 'FRAGMENT_CACHE', {}).get(name, DEFAULTS[name])
+
+def get_cache():
+    return caches[get_setting('CACHE_ALIAS')]
+
+def is_enabled():
+    return bool(get_setting('TIMEOUT')) and is_shared(get_setting('CACHE_ALIAS'))
+
+
+def version_key(namespace):
+    return "fragment_version:%s" % namespace
+
+def new_version():
+    # a version key evicted from the cache must not come back as a version
+    # some old fragment was stored under
+    return int(time.time() * 1000)
+
+def get_versions(namespaces):
+    cache = get_cache()
+    keys = dict((version_key(namespace), namespace) for namespace in namespaces)
+    versions = cache.get_many(list(keys))
+    for key in set(keys) - set(versions):
+        cache.add(key, new_version(), None)
+        versions[key] = cache.get(key)
+    return [versions[version_key(namespace)] for namespace in namespaces]
+
+def bump(*namespaces):
+    if not is_shared(get_setting('CACHE_ALIAS')):
+        # nothing versioned by these namespaces is cached
+        return
+    cache = get_cache()
+    for namespace in namespaces:
+        try:
+            cache.incr(version_key(namespace))
+        except ValueError:
+            cache.set(version_key(namespace), new_version(), None)
+
+
+def event_namespace(event_id):
+    return "event:%s" % event_id
+
+def paper_namespace(paper_id):
+    return "paper:%s" % paper_id
+
+
+def fragment_key(name, namespaces, vary_on=()):
+    parts = [name] + ["%s=%s" % pair for pair in zip(namespaces, get_versions(namespaces))]
+    parts += [str(value) for value in vary_on]
+    return "fragment:%s:%s" % (name, hashlib.md5(":".join(parts).encode("utf-8")).hexdigest())
+
+
+def count(name, outcome):
+    with _counters_lock:
+        _counters[name][outcome] += 1
+
+def counters():
+    """
+    Returns ``{fragment name: {'hits': n, 'misses': n}}`` for this process.
+    """
+    with _counters_lock:
+        return dict((name, dict(counts)) for name, counts in _counters.items())
+
+def reset_counters():
+    with _counters_lock:
+        _counters.clear()
+
+
+def get_or_render(name, namespaces, render, vary_on=()):
+    """
+    Returns the cached fragment ``name`` or stores the output of ``render()``.
+    """
+    if not is_enabled():
+        return render()
+    cache = get_cache()
+    key = fragment_key(name, list(namespaces), vary_on)
+    content = cache.get(key)
+    if content is not None:
+        count(name, 'hits')
+        return content
+    count(name, 'misses')
+    content = render()
+    cache.set(key, content, get_setting('TIMEOUT'))
+    return content
+
+
+# invalidation
+
+def event_changed(sender, instance, **kwargs):
+    bump('events', event_namespace(instance.pk))
+
+def paper_changed(sender, instance, **kwargs):
+    bump('papers', event_namespace(instance.event_id))
+
+def profile_changed(sender, instance, **kwargs):
+    bump('profiles')
+
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= set(['last_login']):
+        return
+    bump('profiles')
+
+def review_changed(sender, instance, **kwargs):
+    bump('reviews', event_namespace(instance.event_id))
+
+def event_member_changed(sender, instance, **kwargs):
+    bump(event_namespace(instance.event_id))
+
+def reviewer_changed(sender, instance, **kwargs):
+    bump(paper_namespace(instance.paper_id))
+    event_id = Paper.objects.filter(pk=instance.paper_id).values_list('event_id', flat=True).first()
+    if event_id is not None:
+        bump(event_namespace(event_id))
+
+HANDLERS = (
+    (Event, event_changed),
+    (Paper, paper_changed),
+    (Profile, profile_changed),
+    (User, user_changed),
+    (Review, review_changed),
+    (Chair, event_member_changed),
+    (PC_Member, event_member_changed),
+    (Reviewer, reviewer_changed),
+)
+
+for model, handler in HANDLERS:
+    post_save.connect(handler, sender=model, dispatch_uid="fragments_%s_saved" % model.__name__)
+    post_delete.connect(handler, sender=model, dispatch_uid="fragments_%s_deleted" % model.__name__)
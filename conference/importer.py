@@ -0,0 +1,346 @@
+"""
+Bulk import of users and events from the pre-load JSON files.
+
+Users and events are referenced by "Name <email>" keys. The files are read
+incrementally, and every batch of entries is imported in one transaction:
+the referenced users are resolved against the database with one query, and
+the missing users, profiles, events, chairs, PC members, papers, authors
+and reviewers are created with bulk_create instead of one INSERT (plus the
+create_profile signal) per row. Time spent in every phase is reported so
+slow imports can be diagnosed.
+"""
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import count, islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils.text import slugify
+
+from conference.models import (Event, Paper, Profile, Author, Reviewer, Chair, PC_Member,
+                               update_event_readiness)
+from conference import fragment_cache, search
+from conference.roles import invalidate_roles
+from conference.stats import rebuild_event_stats
+
+
+DEFAULT_BATCH_SIZE = 500
+CHUNK_SIZE = 64 * 1024
+
+identity_re = re.compile(r'^\s*(.*?)\s*<\s*([^>\s]+)\s*>\s*$')
+
+SEX = {'female': Profile.FEMALE, 'male': Profile.MALE}
+
+
+def iter_json(f, chunk_size=CHUNK_SIZE):
+    """
+    Yields the items of the top-level array of the JSON document in ``f``,
+    or the ``(key, value)`` pairs of its top-level object, reading the file
+    ``chunk_size`` characters at a time.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    eof = False
+
+    def fill():
+        data = f.read(chunk_size)
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        return data
+
+    def next_char(buffer, eof):
+        while True:
+            stripped = buffer.lstrip()
+            if stripped or eof:
+                return stripped, eof
+            data = fill()
+            buffer, eof = stripped + data, not data
+
+    def decode(buffer, eof):
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer)
+                # a number cut by the end of the buffer would decode short
+                if end < len(buffer) or eof:
+                    return value, buffer[end:], eof
+            except ValueError:
+                if eof:
+                    raise
+            data = fill()
+            buffer, eof = buffer + data, not data
+
+    buffer, eof = next_char(buffer, eof)
+    if not buffer or buffer[0] not in "[{":
+        raise ValueError("Expected a JSON array or object")
+    is_object, closing = buffer[0] == "{", "]}"[buffer[0] == "{"]
+    buffer = buffer[1:]
+    while True:
+        buffer, eof = next_char(buffer, eof)
+        if not buffer:
+            raise ValueError("Unterminated JSON document")
+        if buffer[0] == closing:
+            return
+        if buffer[0] == ",":
+            buffer = buffer[1:]
+            continue
+        if is_object:
+            key, buffer, eof = decode(buffer, eof)
+            buffer, eof = next_char(buffer, eof)
+            if not buffer.startswith(":"):
+                raise ValueError("Expected ':' after %r" % key)
+            buffer, eof = next_char(buffer[1:], eof)
+            value, buffer, eof = decode(buffer, eof)
+            yield key, value
+        else:
+            value, buffer, eof = decode(buffer, eof)
+            yield value
+
+
+def username_candidates(email, max_length):
+    """
+    Yields the usernames ``email`` can get, in order of preference: its
+    local part, the whole email, then the local part with a number.
+    """
+    local = email.split("@")[0]
+    yield local[:max_length]
+    yield email[:max_length]
+    for n in count(2):
+        suffix = "-%d" % n
+        yield local[:max_length - len(suffix)] + suffix
+
+
+def parse_identity(key):
+    """
+    Splits a "Name <email>" key into ``(name, email)``.
+    """
+    match = identity_re.match(key)
+    if not match:
+        raise ValueError("Expected 'Name <email>', got %r" % key)
+    return match.group(1), match.group(2).lower()
+
+
+class Importer(object):
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+        self.batch_size = batch_size
+        # called with the fraction of the file read and the counts after
+        # every batch
+        self.progress = progress
+        self.timings = OrderedDict()
+        self.counts = OrderedDict()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.time() - start
+
+    def count(self, name, n):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def report(self):
+        lines = ["%-12s %8.3f s" % (name, seconds) for name, seconds in self.timings.items()]
+        lines += ["%-12s %8d" % (name, n) for name, n in self.counts.items()]
+        return "\n".join(lines)
+
+    def read(self, path):
+        size = os.path.getsize(path)
+        with open(path) as f:
+            items = iter_json(f)
+            while True:
+                with self.phase("parse"):
+                    batch = list(islice(items, self.batch_size))
+                if not batch:
+                    return
+                yield batch
+                if self.progress:
+                    self.progress(float(f.tell()) / max(size, 1), self.counts)
+
+    def resolve_users(self, identities):
+        """
+        Returns a dict mapping the email of every ``(name, email, details)``
+        identity to its user, creating the users (and their profiles) that
+        don't exist yet.
+        """
+        with self.phase("resolve"):
+            emails = set(email for _, email, _ in identities)
+            users = dict((user.email.lower(), user) for user in User.objects.filter(email__in=emails))
+        missing = OrderedDict()
+        for name, email, details in identities:
+            if email not in users and email not in missing:
+                missing[email] = (name, details)
+        if not missing:
+            return users
+
+        with self.phase("users"):
+            usernames = self.unique_usernames(missing)
+            new_users = []
+            for email, (name, details) in missing.items():
+                first_name, _, last_name = name.partition(" ")
+                password = details.get("pass")
+                new_users.append(User(
+                    username=usernames[email], email=email,
+                    first_name=details.get("given_name", first_name)[:30],
+                    last_name=details.get("family_name", last_name)[:30],
+                    password=make_password(password) if password else make_password(None),
+                ))
+            User.objects.bulk_create(new_users)
+            created = list(User.objects.filter(email__in=list(missing)))
+            self.count("users", len(created))
+
+        with self.phase("profiles"):
+            Profile.objects.bulk_create([
+                Profile(user=user, first_name=user.first_name, last_name=user.last_name,
+                        sex=SEX.get(missing[user.email.lower()][1].get("sex"), Profile.NONE))
+                for user in created
+            ])
+            self.count("profiles", len(created))
+
+        users.update((user.email.lower(), user) for user in created)
+        return users
+
+    def unique_usernames(self, emails):
+        """
+        Returns a dict mapping each of ``emails`` to a username that neither
+        an existing user nor another of ``emails`` has, with one query per
+        round of collisions.
+        """
+        max_length = User._meta.get_field('username').max_length
+        candidates = dict((email, username_candidates(email, max_length)) for email in emails)
+        pending = OrderedDict((email, next(candidates[email])) for email in emails)
+        usernames, taken = {}, set()
+        while pending:
+            taken.update(User.objects.filter(username__in=set(pending.values())).values_list('username', flat=True))
+            colliding = OrderedDict()
+            for email, username in pending.items():
+                if username in taken:
+                    colliding[email] = next(candidates[email])
+                else:
+                    taken.add(username)
+                    usernames[email] = username
+            pending = colliding
+        return usernames
+
+    def import_users(self, path):
+        for batch in self.read(path):
+            with transaction.atomic():
+                identities = []
+                for key, details in batch:
+                    name, email = parse_identity(key)
+                    identities.append((name, details.get("email", email).lower(), details))
+                self.resolve_users(identities)
+        # bulk_create doesn't send the signals that invalidate the listings
+        fragment_cache.bump('profiles')
+        return self
+
+    def import_events(self, path):
+        event_ids = []
+        for batch in self.read(path):
+            with transaction.atomic():
+                event_ids += self.import_event_batch(batch)
+        fragment_cache.bump('events', 'papers', 'profiles', 'reviews',
+                            *[fragment_cache.event_namespace(event_id) for event_id in event_ids])
+        return self
+
+    def import_event_batch(self, batch):
+        identities = {}
+        for data in batch:
+            keys = data.get("chairs", []) + data.get("pc_members", [])
+            for submission in data.get("submissions", []):
+                keys += submission.get("authors", []) + submission.get("reviewers", [])
+            for key in keys:
+                name, email = parse_identity(key)
+                identities[email] = (name, email, {})
+        users = self.resolve_users(list(identities.values()))
+
+        def user(key):
+            return users[parse_identity(key)[1]]
+
+        with self.phase("events"):
+            acronyms = [data["acronym"] for data in batch]
+            existing = set(Event.objects.filter(acronym__in=acronyms).values_list('acronym', flat=True))
+            Event.objects.bulk_create([
+                Event(name=data["conference"], acronym=data["acronym"], slug=slugify(data["conference"])[0:99])
+                for data in batch if data["acronym"] not in existing
+            ])
+            events = dict((event.acronym, event) for event in Event.objects.filter(acronym__in=acronyms))
+            self.count("events", len(events) - len(existing))
+
+        with self.phase("members"):
+            event_ids = [event.pk for event in events.values()]
+            chairs = set(Chair.objects.filter(event_id__in=event_ids).values_list('event_id', 'user_id'))
+            pc_members = set(PC_Member.objects.filter(event_id__in=event_ids).values_list('event_id', 'user_id'))
+            new_chairs, new_pc_members = [], []
+            for data in batch:
+                event = events[data["acronym"]]
+                for key in data.get("chairs", []):
+                    pair = (event.pk, user(key).pk)
+                    if pair not in chairs:
+                        chairs.add(pair)
+                        new_chairs.append(Chair(event_id=pair[0], user_id=pair[1]))
+                for key in data.get("pc_members", []):
+                    pair = (event.pk, user(key).pk)
+                    if pair not in pc_members:
+                        pc_members.add(pair)
+                        new_pc_members.append(PC_Member(event_id=pair[0], user_id=pair[1]))
+            Chair.objects.bulk_create(new_chairs)
+            PC_Member.objects.bulk_create(new_pc_members)
+            invalidate_roles(member.user_id for member in new_chairs + new_pc_members)
+            self.count("chairs", len(new_chairs))
+            self.count("pc_members", len(new_pc_members))
+
+        with self.phase("papers"):
+            submissions = OrderedDict()
+            for data in batch:
+                for submission in data.get("submissions", []):
+                    if submission.get("authors"):
+                        submissions[slugify(submission["title"])[0:50]] = (events[data["acronym"]], submission)
+            existing = set(Paper.objects.filter(slug__in=list(submissions)).values_list('slug', flat=True))
+            new = OrderedDict((slug, value) for slug, value in submissions.items() if slug not in existing)
+            Paper.objects.bulk_create([
+                Paper(title=submission["title"][:250], slug=slug, abstract="", event=event,
+                      submited_by=user(submission["authors"][0]),
+                      paper_file="papers/%s" % submission["url"],
+                      reviewer_count=len(set(submission.get("reviewers", []))))
+                for slug, (event, submission) in new.items()
+            ])
+            papers = dict((paper.slug, paper) for paper in Paper.objects.filter(slug__in=list(new)))
+            authors, reviewers = [], []
+            for slug, (event, submission) in new.items():
+                paper = papers[slug]
+                for key in OrderedDict.fromkeys(submission["authors"]):
+                    authors.append(Author(paper=paper, user=user(key)))
+                for key in OrderedDict.fromkeys(submission.get("reviewers", [])):
+                    reviewers.append(Reviewer(paper=paper, user=user(key)))
+            Author.objects.bulk_create(authors)
+            Reviewer.objects.bulk_create(reviewers)
+            invalidate_roles(member.user.pk for member in authors + reviewers)
+            for event in set(event for event, _ in new.values()):
+                update_event_readiness(event.pk)
+            self.count("papers", len(papers))
+            self.count("reviewers", len(reviewers))
+
+        with self.phase("stats"):
+            # bulk_create doesn't send the signals that maintain EventStats
+            for event in events.values():
+                rebuild_event_stats(event.pk)
+
+        with self.phase("search"):
+            # nor the ones that update the search index; the text of the
+            # files is indexed by a background job
+            search.index_documents([search.paper_document(paper) for paper in papers.values()])
+            search.queue_paper_text([paper.pk for paper in papers.values()])
+
+        return [event.pk for event in events.values()]
+
+
+def default_path(kind):
+    return "%s/pre_load_data/%s.json" % (settings.MEDIA_ROOT, kind)
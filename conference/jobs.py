@@ -0,0 +1,222 @@
+"""
+Database-backed queue of background jobs.
+
+Views enqueue a job and return immediately; the ``run_jobs`` management
+command claims queued jobs and runs them in a pool of worker processes.
+
+* A job is claimed with a conditional UPDATE (QUEUED -> RUNNING), so any
+  number of workers can poll the same table.
+* Every job runs in its own process. ``run_jobs`` refreshes the heartbeat
+  of its jobs every JOB_HEARTBEAT_INTERVAL seconds while their process is
+  alive, however long a handler goes without reporting progress with
+  ``job.report(percent, message)`` (which refreshes it too).
+* A job whose process exits without recording an outcome (killed, out of
+  memory) is failed by ``run_jobs`` right away. RUNNING jobs whose heartbeat
+  is older than JOB_STALE_AFTER seconds lost their ``run_jobs`` altogether
+  and are failed by any other worker.
+* A failing job is retried up to ``max_attempts`` times, waiting
+  JOB_RETRY_DELAY * 2 ** (attempt - 1) seconds between attempts. A job lost
+  with its process counts as an attempt too, so a job that keeps killing
+  its worker ends up FAILED.
+* Enqueueing with an idempotency key returns the queued or running job with
+  the same key instead of adding another one.
+
+Handlers are registered with the ``@handler('kind')`` decorator and called
+with the job and the keyword arguments it was enqueued with.
+"""
+import json
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from conference import search
+from conference.archive import build_event_archive
+from conference.importer import Importer
+from conference.models import Event, Job
+from conference.writeback import write_back_event
+
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def handler(kind):
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(kind, key=None, event=None, max_attempts=None, **kwargs):
+    """
+    Queues a ``kind`` job called with ``kwargs`` and returns it, or returns
+    the pending job enqueued with the same ``key``.
+    """
+    if kind not in HANDLERS:
+        raise ValueError("Unknown job kind: %r" % kind)
+    if key is not None:
+        pending = Job.objects.filter(active_key=key).first()
+        if pending is not None:
+            return pending
+    job = Job(kind=kind, args=json.dumps(kwargs), event=event, key=key or "", active_key=key,
+              max_attempts=max_attempts or setting('JOB_MAX_ATTEMPTS', 3))
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        # enqueued concurrently with the same key
+        return Job.objects.get(active_key=key)
+    return job
+
+
+def record_failure(job, error, message="Failed"):
+    """
+    Counts a failed attempt of the running ``job``: queues it again after the
+    retry delay, or marks it FAILED after ``max_attempts``. Returns the new
+    status, or None if the job wasn't running anymore.
+    """
+    attempts = job.attempts + 1
+    running = Job.objects.filter(pk=job.pk, status=Job.RUNNING)
+    if attempts < job.max_attempts:
+        delay = setting('JOB_RETRY_DELAY', 30) * 2 ** (attempts - 1)
+        updated = running.update(
+            status=Job.QUEUED, attempts=attempts, error=error,
+            run_after=timezone.now() + timedelta(seconds=delay),
+            message="%s, retrying in %d s" % (message, delay))
+        return Job.QUEUED if updated else None
+    updated = running.update(
+        status=Job.FAILED, attempts=attempts, error=error, active_key=None,
+        finished=timezone.now(), message=message)
+    return Job.FAILED if updated else None
+
+
+def heartbeat(job_ids):
+    """
+    Refreshes the heartbeat of the running jobs ``job_ids``, whose processes
+    are alive.
+    """
+    if job_ids:
+        Job.objects.filter(pk__in=list(job_ids), status=Job.RUNNING).update(heartbeat=timezone.now())
+
+
+def process_exited(job_id, exitcode):
+    """
+    Fails the job ``job_id`` if its process exited while it was still
+    running. Returns the new status, or None if the job recorded its outcome.
+    """
+    job = Job.objects.filter(pk=job_id, status=Job.RUNNING).first()
+    if job is None:
+        return None
+    return record_failure(job, "Worker process exited with code %s" % exitcode, "Worker process died")
+
+
+def requeue_stale():
+    """
+    Fails the running jobs whose heartbeat stopped, their worker is gone.
+    Returns how many there were.
+    """
+    stale = timezone.now() - timedelta(seconds=setting('JOB_STALE_AFTER', 600))
+    count = 0
+    for job in Job.objects.filter(status=Job.RUNNING, heartbeat__lt=stale):
+        if record_failure(job, "No heartbeat since %s" % job.heartbeat, "Its worker stopped") is not None:
+            count += 1
+    return count
+
+
+def claim():
+    """
+    Marks the next runnable job as RUNNING and returns its id, or None.
+    """
+    now = timezone.now()
+    candidates = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).order_by('run_after', 'id')
+    for job_id in candidates.values_list('id', flat=True)[:10]:
+        claimed = Job.objects.filter(pk=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING, started=now, heartbeat=now, error="")
+        if claimed:
+            return job_id
+    return None
+
+
+def run(job_id):
+    """
+    Runs the claimed job ``job_id`` and records its outcome. Returns the
+    final status.
+    """
+    job = Job.objects.get(pk=job_id)
+    try:
+        HANDLERS[job.kind](job, **json.loads(job.args))
+    except Exception:
+        logger.exception("Job %s failed", job)
+        return record_failure(job, traceback.format_exc())
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.DONE, attempts=job.attempts + 1, active_key=None, progress=100,
+        finished=timezone.now())
+    return Job.DONE
+
+
+def run_next():
+    """
+    Claims and runs one job in this process, returns its id or None.
+    """
+    job_id = claim()
+    if job_id is not None:
+        run(job_id)
+    return job_id
+
+
+# handlers
+
+def close_event_key(event):
+    return "close_event:%s" % event.pk
+
+def archive_key(event):
+    return "build_archive:%s" % event.pk
+
+
+@handler('close_event')
+def close_event(job, event_id):
+    event = Event.objects.get(pk=event_id)
+    job.report(0, "Writing annotations, reviews and decisions into copies of the paper files")
+    write_back_event(event, progress=lambda done, total: job.report(
+        50 * done // max(total, 1), "Wrote back %d of %d papers" % (done, total)))
+    job.report(50, "Building the event archive")
+    build_event_archive(event, progress=lambda done, total: job.report(
+        50 + 50 * done // max(total, 1), "Archived %d of %d papers" % (done, total)))
+
+
+@handler('build_archive')
+def build_archive(job, event_id):
+    event = Event.objects.get(pk=event_id)
+    build_event_archive(event, progress=lambda done, total: job.report(
+        100 * done // max(total, 1), "Archived %d of %d papers" % (done, total)))
+
+
+@handler('index_paper_text')
+def index_paper_text(job, paper_ids):
+    search.index_paper_text(paper_ids, progress=lambda done, total: job.report(
+        100 * done // max(total, 1), "Indexed the text of %d of %d papers" % (done, total)))
+
+
+@handler('import_users')
+def import_users(job, path):
+    importer = Importer(progress=lambda fraction, counts: job.report(
+        100 * fraction, "Imported %(users)d users" % dict({'users': 0}, **counts)))
+    importer.import_users(path)
+    job.report(100, importer.report().replace("\n", "; "))
+
+
+@handler('import_events')
+def import_events(job, path):
+    importer = Importer(progress=lambda fraction, counts: job.report(
+        100 * fraction, "Imported %(events)d events, %(papers)d papers" % dict({'events': 0, 'papers': 0}, **counts)))
+    importer.import_events(path)
+    job.report(100, importer.report().replace("\n", "; "))
@@ -0,0 +1,119 @@
+"""
+Prefix search of users by username, first or last name for the user
+pickers (PC members, chairs, reviewers) and the user directory.
+
+Each field is searched by its own ``istartswith`` query, ordered by the
+unique username and cut at one page, so every query can be answered from
+an index; the three result sets are merged in Python. On PostgreSQL that
+is an UPPER() pattern index (see migration 0006). SQLite has no expression
+index LIKE can use, so there each query walks the username index in order
+and stops after a page of matches: fine for thousands of users, slower the
+rarer the matches are among millions.
+
+Pages are keyset paginated on the username: the cursor is the last
+username of the previous page. Searches can be restricted to the PC members
+of an event and exclude the reviewers of a paper (the reviewer picker).
+When the default cache is shared by every process (see
+conference/caching.py), result pages are cached under the current version
+of the 'profiles' fragment namespace (and of the event and paper they
+depend on), so user and membership changes show up immediately.
+"""
+import base64
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+from conference import fragment_cache
+from conference.caching import is_shared
+from conference.models import PC_Member, Reviewer
+
+
+FIELDS = ('username', 'profile__first_name', 'profile__last_name')
+VALUES = ('id', 'username', 'profile__first_name', 'profile__last_name')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(username):
+    return base64.urlsafe_b64encode(username.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    try:
+        username = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+    except (TypeError, ValueError):
+        raise InvalidCursor(cursor)
+    if not username:
+        raise InvalidCursor(cursor)
+    return username
+
+
+def search_users(query, after=None, limit=20, event_id=None, paper_id=None):
+    """
+    Returns the page of users matching ``query`` that follows the username
+    ``after``, and the cursor of the next page (or None), restricted to the
+    PC members of ``event_id`` and excluding the reviewers of ``paper_id``
+    if given.
+    """
+    users = User.objects.all()
+    if event_id is not None:
+        users = users.filter(id__in=PC_Member.objects.filter(event_id=event_id).values('user_id'))
+    if paper_id is not None:
+        users = users.exclude(id__in=Reviewer.objects.filter(paper_id=paper_id).values('user_id'))
+    if after is not None:
+        users = users.filter(username__gt=after)
+    users = users.order_by('username')
+
+    if query:
+        rows = {}
+        for field in FIELDS:
+            for row in users.filter(**{field + '__istartswith': query}).values(*VALUES)[:limit + 1]:
+                rows[row['id']] = row
+        rows = sorted(rows.values(), key=lambda row: row['username'])[:limit + 1]
+    else:
+        rows = list(users.values(*VALUES)[:limit + 1])
+
+    next_cursor = encode_cursor(rows[limit - 1]['username']) if len(rows) > limit else None
+    results = [{
+        'id': row['id'],
+        'username': row['username'],
+        'first_name': row['profile__first_name'] or "",
+        'last_name': row['profile__last_name'] or "",
+    } for row in rows[:limit]]
+    return results, next_cursor
+
+
+def cache_key(query, after, limit, event_id, paper_id):
+    namespaces = ['profiles']
+    if event_id is not None:
+        namespaces.append(fragment_cache.event_namespace(event_id))
+    if paper_id is not None:
+        namespaces.append(fragment_cache.paper_namespace(paper_id))
+    parts = [query.lower(), after or "", str(limit), str(event_id), str(paper_id)]
+    parts += [str(version) for version in fragment_cache.get_versions(namespaces)]
+    return "user_lookup:%s" % hashlib.md5("\x00".join(parts).encode("utf-8")).hexdigest()
+
+
+def cache_timeout():
+    # the versions are bumped in the fragment cache, which must be shared too
+    if not is_shared() or not is_shared(fragment_cache.get_setting('CACHE_ALIAS')):
+        return 0
+    return getattr(settings, 'USER_LOOKUP_CACHE_TIMEOUT', 60)
+
+
+def lookup_users(query, after=None, limit=20, event_id=None, paper_id=None):
+    """
+    search_users() through the result cache.
+    """
+    timeout = cache_timeout()
+    if not timeout:
+        return search_users(query, after, limit, event_id, paper_id)
+    key = cache_key(query, after, limit, event_id, paper_id)
+    page = cache.get(key)
+    if page is None:
+        page = search_users(query, after, limit, event_id, paper_id)
+        cache.set(key, page, timeout)
+    return page
@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from conference import paper_cache, rendition
+
+
+PARAGRAPH = ("<p>RASH papers are written in a restricted subset of HTML; this paragraph "
+             "has <em>emphasis</em>, a <a href=\"#ref%(n)d\">reference</a> and some "
+             "<code>inline code</code> so the parser has a realistic amount of markup "
+             "to deal with.</p>\n")
+
+def synthetic_paper(size):
+    parts = ["<html><head><title>Synthetic paper</title></head><body>\n"]
+    written, n = 0, 0
+    while written < size:
+        section = "<section id=\"sec%d\"><h1>Section %d</h1>\n%s</section>\n" % (
+            n, n, "".join(PARAGRAPH % {'n': n * 20 + i} for i in range(20)))
+        parts.append(section)
+        written += len(section)
+        n += 1
+    parts.append("</body></html>\n")
+    return "".join(parts)
+
+
+class Command(BaseCommand):
+    help = ("Compare building a paper rendition (parse), reading it from disk (cold) "
+            "and from the in-memory cache (warm).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=float, nargs='+', default=[1, 4, 8],
+                            help="Paper sizes in megabytes.")
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for n, megabytes in enumerate(options['sizes']):
+                path = os.path.join(tmpdir, "paper%d.html" % n)
+                with open(path, 'w') as f:
+                    f.write(synthetic_paper(int(megabytes * 1024 * 1024)))
+                parse, cold, warm = [], [], []
+                for _ in range(options['repeat']):
+                    start = time.time()
+                    rendition.build_rendition(path)
+                    parse.append(time.time() - start)
+                    paper_cache.get_backend().clear()
+                    start = time.time()
+                    paper_cache.get_body(n, path)
+                    cold.append(time.time() - start)
+                    start = time.time()
+                    paper_cache.get_body(n, path)
+                    warm.append(time.time() - start)
+                self.stdout.write("%6.1f MB  parse %8.2f ms  cold %8.2f ms  warm %8.3f ms" % (
+                    megabytes, min(parse) * 1000, min(cold) * 1000, min(warm) * 1000))
+        finally:
+            shutil.rmtree(tmpdir)
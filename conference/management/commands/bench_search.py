@@ -0,0 +1,111 @@
+import bisect
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from conference import search
+from conference.models import Event, Paper
+
+
+def vocabulary(size, rand):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < size:
+        words.add("".join(rand.choice(letters) for _ in range(rand.randint(3, 10))))
+    return sorted(words)
+
+
+class Zipf(object):
+    """
+    Draws words with the frequency of the n-th word proportional to 1/n,
+    roughly like natural language.
+    """
+
+    def __init__(self, words, rand):
+        self.words = words
+        self.rand = rand
+        self.cumulative, total = [], 0.0
+        for n in range(1, len(words) + 1):
+            total += 1.0 / n
+            self.cumulative.append(total)
+
+    def text(self, length):
+        top = self.cumulative[-1]
+        return " ".join(self.words[bisect.bisect(self.cumulative, self.rand.random() * top)]
+                        for _ in range(length))
+
+
+class Command(BaseCommand):
+    help = ("Index a synthetic corpus of papers, reviews and annotations and time full-text "
+            "queries against it. Runs in a transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--papers', type=int, default=10000)
+        parser.add_argument('--words', type=int, default=1000, help="Words of text per paper.")
+        parser.add_argument('--reviews', type=int, default=3, help="Reviews per paper.")
+        parser.add_argument('--annotations', type=int, default=5, help="Annotations per paper.")
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def timed(self, label, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.time()
+            result = func()
+            timings.append(time.time() - start)
+        timings.sort()
+        self.stdout.write("%-28s %5d hits  p50 %8.2f ms  p95 %8.2f ms" % (
+            label, len(result), timings[len(timings) // 2] * 1000,
+            timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000))
+
+    def handle(self, *args, **options):
+        if not search.supported():
+            raise CommandError("Full-text search isn't supported on this database.")
+        rand = random.Random(0)
+        words = vocabulary(20000, rand)
+        zipf = Zipf(words, rand)
+
+        with transaction.atomic():
+            search.create_index()
+            user = User.objects.create_user("bench-search")
+            events = [Event.objects.create(name="Bench %d" % n, acronym="BS%d" % n) for n in range(10)]
+            Paper.objects.bulk_create([
+                Paper(title=zipf.text(8), abstract="", event=events[n % len(events)], submited_by=user,
+                      slug="bench-%d" % n, paper_file="papers/bench-%d.html" % n)
+                for n in range(options['papers'])])
+            papers = list(Paper.objects.filter(submited_by=user).values_list('pk', 'title'))
+
+            start, documents, batch = time.time(), 0, []
+            for paper_id, title in papers:
+                batch.append((search.PAPER, paper_id, paper_id, title, zipf.text(150)))
+                batch.append((search.PAPER_TEXT, paper_id, paper_id, "", zipf.text(options['words'])))
+                for n in range(options['reviews']):
+                    batch.append((search.REVIEW, "%s-%d" % (paper_id, n), paper_id, "", zipf.text(60)))
+                for n in range(options['annotations']):
+                    batch.append((search.ANNOTATION, "%s-%d" % (paper_id, n), paper_id, "", zipf.text(20)))
+                if len(batch) >= 1000:
+                    search.index_documents(batch)
+                    documents += len(batch)
+                    batch = []
+            search.index_documents(batch)
+            documents += len(batch)
+            elapsed = time.time() - start
+            self.stdout.write("Indexed %d documents of %d papers in %.1f s (%.0f documents/s)" % (
+                documents, len(papers), elapsed, documents / elapsed))
+
+            paper_id, title = papers[len(papers) // 2]
+            self.timed("reindex one paper", lambda: search.index_documents(
+                [(search.PAPER, paper_id, paper_id, title, zipf.text(150))]) or [], options['repeat'])
+            queries = (
+                ("frequent word", words[0], {}),
+                ("common word", words[100], {}),
+                ("rare word", words[5000], {}),
+                ("two words", "%s %s" % (words[10], words[200]), {}),
+                ("frequent word, one event", words[0], {'event_id': events[0].pk}),
+                ("common word, chair of 1", words[100], {'chair_events': set([events[0].pk])}),
+            )
+            for label, query, kwargs in queries:
+                self.timed(label, lambda: search.search(query, **kwargs), options['repeat'])
+            transaction.set_rollback(True)
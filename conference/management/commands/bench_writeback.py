@@ -0,0 +1,91 @@
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from lxml import html
+
+from conference import writeback
+from conference.management.commands.bench_paper_cache import synthetic_paper
+
+
+def paragraphs(path):
+    body = html.parse(path).getroot().find("body")
+    return [("/section[%d]/p[%d]" % (s + 1, p + 1), len(paragraph.text_content()))
+            for s, section in enumerate(body.findall("section"))
+            for p, paragraph in enumerate(section.findall("p"))]
+
+
+def synthetic_annotations(path, count, seed=0):
+    rand = random.Random(seed)
+    targets = paragraphs(path)
+    annotations = []
+    for n in range(count):
+        i = rand.randrange(len(targets))
+        start, length = targets[i]
+        start_offset = rand.randrange(length)
+        if rand.random() < 0.2 and i + 1 < len(targets):
+            # some ranges run into the next paragraph
+            end, end_length = targets[i + 1]
+            end_offset = rand.randrange(end_length)
+        else:
+            end, end_offset = start, rand.randrange(start_offset, length) + 1
+        annotations.append({'id': "a%d" % n, 'quote': "", 'text': "Comment %d" % n, 'user': "bench",
+                            'ranges': [(start, start_offset, end, end_offset)]})
+    return annotations
+
+
+class Command(BaseCommand):
+    help = ("Time writing annotations back into synthetic papers, by number of annotations "
+            "and serially against in parallel.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=float, default=1, help="Paper size in megabytes.")
+        parser.add_argument('--annotations', type=int, nargs='+', default=[250, 500, 1000, 2000])
+        parser.add_argument('--papers', type=int, default=8,
+                            help="Papers of 1000 annotations for the serial/parallel comparison.")
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        tmpdir = tempfile.mkdtemp()
+        paper = synthetic_paper(int(options['size'] * 1024 * 1024))
+        try:
+            path = os.path.join(tmpdir, "paper.html")
+            for count in options['annotations']:
+                timings = []
+                for _ in range(options['repeat']):
+                    with open(path, 'w') as f:
+                        f.write(paper)
+                    annotations = synthetic_annotations(path, count)
+                    start = time.time()
+                    highlighted, unresolved = writeback.write_back(path, annotations, "Accepted", [])
+                    timings.append(time.time() - start)
+                self.stdout.write("%6d annotations  %8.2f ms  %6.3f ms/annotation  (%d unresolved)" % (
+                    count, min(timings) * 1000, min(timings) * 1000 / count, unresolved))
+
+            jobs = []
+            for n in range(options['papers']):
+                path = os.path.join(tmpdir, "paper%d.html" % n)
+                with open(path, 'w') as f:
+                    f.write(paper)
+                jobs.append((path, synthetic_annotations(path, 1000, seed=n), "Accepted", []))
+            start = time.time()
+            for job in jobs:
+                writeback.write_back_job(job)
+            serial = time.time() - start
+            pool = multiprocessing.Pool(options['workers'])
+            try:
+                start = time.time()
+                list(pool.imap_unordered(writeback.write_back_job, jobs))
+                parallel = time.time() - start
+            finally:
+                pool.close()
+                pool.join()
+            self.stdout.write("%d papers  serial %6.2f papers/s  %d workers %6.2f papers/s" % (
+                len(jobs), len(jobs) / serial, options['workers'], len(jobs) / parallel))
+        finally:
+            shutil.rmtree(tmpdir)
@@ -0,0 +1,95 @@
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+
+from conference import benchmark
+
+
+def git_commit():
+    with open(os.devnull, "w") as devnull:
+        try:
+            return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+                                           stderr=devnull).strip().decode("ascii")
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+
+class Command(BaseCommand):
+    help = ("Generate a synthetic conference and time the hot endpoints of the review workflow "
+            "through the test client. Runs in a transaction that is rolled back; the results are "
+            "written as JSON and can be compared with a previous run.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=3)
+        parser.add_argument('--papers', type=int, default=20, help="Papers per event.")
+        parser.add_argument('--reviewers', type=int, default=10, help="PC members of every event.")
+        parser.add_argument('--reviewers-per-paper', type=int, default=3)
+        parser.add_argument('--annotations', type=int, default=100, help="Annotations per paper.")
+        parser.add_argument('--paper-size', type=int, default=64, help="Paper size in kilobytes.")
+        parser.add_argument('--repeat', type=int, default=20, help="Requests per scenario.")
+        parser.add_argument('--output', help="File the JSON results are written to.")
+        parser.add_argument('--compare', help="JSON results of a previous run to compare with.")
+        parser.add_argument('--threshold', type=float, default=1.2,
+                            help="p95 latency ratio reported as a regression.")
+
+    def handle(self, *args, **options):
+        previous = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    previous = json.load(f)
+            except (IOError, ValueError) as e:
+                raise CommandError("Can't read %s: %s" % (options['compare'], e))
+
+        media_root = tempfile.mkdtemp()
+        try:
+            with transaction.atomic(), override_settings(MEDIA_ROOT=media_root, ALLOWED_HOSTS=['testserver'],
+                                                         DEBUG=False, WRITEBACK_WORKERS=1):
+                start = time.time()
+                owner = User.objects.create_user("bench-%d" % int(time.time() * 1000))
+                reviewers = [User.objects.create_user("%s-reviewer-%d" % (owner.username, n))
+                             for n in range(options['reviewers'])]
+                events, papers = benchmark.generate(
+                    owner, reviewers, media_root, events=options['events'], papers=options['papers'],
+                    reviewers_per_paper=options['reviewers_per_paper'], annotations=options['annotations'],
+                    paper_size=options['paper_size'] * 1024)
+                generated = time.time() - start
+                scenarios = benchmark.Benchmark(owner, events, papers, repeat=options['repeat']).run()
+                transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(media_root)
+
+        results = {
+            'commit': git_commit(),
+            'date': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'options': dict((name, options[name]) for name in (
+                'events', 'papers', 'reviewers', 'reviewers_per_paper', 'annotations', 'paper_size', 'repeat')),
+            'generate_s': generated,
+            'scenarios': scenarios,
+        }
+        self.stdout.write("Generated %d events, %d papers in %.1f s" % (len(events), len(papers), generated))
+        for name, result in scenarios.items():
+            self.stdout.write("%-20s %4d req  %s  queries %4d  p50 %8.1f ms  p95 %8.1f ms  peak %7d kB" % (
+                name, result['requests'], ",".join(sorted(result['status'])), result['queries']['max'],
+                result['p50_ms'], result['p95_ms'], result['peak_rss_kb']))
+        if options['output']:
+            with open(options['output'], "w") as f:
+                json.dump(results, f, indent=2)
+        if previous is not None:
+            regressions = benchmark.compare(previous, results, options['threshold'])
+            for name, message in regressions:
+                self.stdout.write("REGRESSION %s: %s" % (name, message))
+            if not regressions:
+                self.stdout.write("No regressions against %s" % (previous.get('commit') or options['compare']))
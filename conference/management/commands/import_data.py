@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from conference.importer import Importer, default_path, DEFAULT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Import users and events from the pre-load JSON files in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', default=default_path('users'), help="Users JSON file.")
+        parser.add_argument('--events', default=default_path('events'), help="Events JSON file.")
+        parser.add_argument('--skip-users', action='store_true')
+        parser.add_argument('--skip-events', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        importer = Importer(options['batch_size'])
+        if not options['skip_users']:
+            importer.import_users(options['users'])
+        if not options['skip_events']:
+            importer.import_events(options['events'])
+        self.stdout.write(importer.report())
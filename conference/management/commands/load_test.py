@@ -0,0 +1,121 @@
+import json
+import multiprocessing
+import time
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client, override_settings
+
+from annotation.models import Annotation
+from conference.models import Event, Paper
+
+
+def percentile(timings, fraction):
+    if not timings:
+        return 0.0
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+def worker(user, request, deadline, results):
+    """
+    Repeats ``request(client)`` until ``deadline`` and puts the latency of
+    every successful response, and the failures counted by status code or
+    exception, on ``results``.
+    """
+    client = Client()
+    client.force_login(user)
+    timings, errors = [], Counter()
+    try:
+        while time.time() < deadline:
+            start = time.time()
+            try:
+                status = request(client).status_code
+            except Exception as e:
+                status = "%s: %s" % (e.__class__.__name__, e)
+            if status in (200, 201):
+                timings.append(time.time() - start)
+            else:
+                errors[status] += 1
+    finally:
+        connection.close()
+        results.put((request.__name__, timings, errors))
+
+
+class Command(BaseCommand):
+    help = ("Measure the throughput of concurrent annotation creates and event page views "
+            "against the configured database (run it once per PAREA_DB profile).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4, help="Clients creating annotations.")
+        parser.add_argument('--readers', type=int, default=4, help="Clients viewing the event page.")
+        parser.add_argument('--duration', type=float, default=10, help="Seconds to run.")
+
+    def describe_database(self):
+        settings_dict = connection.settings_dict
+        description = "%s (CONN_MAX_AGE=%s" % (connection.vendor, settings_dict['CONN_MAX_AGE'])
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute("PRAGMA journal_mode")
+                description += ", journal_mode=%s" % cursor.fetchone()[0]
+            elif connection.vendor == 'postgresql':
+                cursor.execute("SHOW statement_timeout")
+                description += ", statement_timeout=%s" % cursor.fetchone()[0]
+        return description + ")"
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user("load-test-%d" % int(time.time() * 1000))
+        event = Event.objects.create(name="Load test", acronym="LT%d" % user.pk)
+        paper = Paper.objects.create(title="Load test paper %d" % user.pk, abstract="abstract", event=event,
+                                     submited_by=user, paper_file="papers/load-test.html")
+        uri = "http://127.0.0.1:8000" + reverse("paper_review", kwargs={"pk": paper.pk})
+        annotation = json.dumps({
+            "text": "load test", "quote": "quote", "uri": uri,
+            "ranges": [{"start": "/section[1]/p[%d]" % n, "end": "/section[1]/p[%d]" % n,
+                        "startOffset": 0, "endOffset": 10} for n in (1, 2)],
+        })
+        event_url = event.get_absolute_url()
+        create_url = reverse("index_create")
+
+        def create(client):
+            return client.post(create_url, annotation, content_type="application/json")
+
+        def view(client):
+            return client.get(event_url)
+
+        self.stdout.write("Database: %s" % self.describe_database())
+        try:
+            # one process per client, each with its own connection, like the
+            # workers of a WSGI server
+            connection.close()
+            results = multiprocessing.Queue()
+            deadline = time.time() + options['duration']
+            with override_settings(ALLOWED_HOSTS=['testserver'], DEBUG=False):
+                processes = [multiprocessing.Process(target=worker, args=(user, request, deadline, results))
+                             for request, count in ((create, options['writers']), (view, options['readers']))
+                             for _ in range(count)]
+                for process in processes:
+                    process.start()
+                outcomes = [results.get() for _ in processes]
+                for process in processes:
+                    process.join()
+
+            for label, name in (("create annotation", "create"), ("view event", "view")):
+                mine = [outcome for outcome in outcomes if outcome[0] == name]
+                if not mine:
+                    continue
+                timings = [timing for _, worker_timings, _ in mine for timing in worker_timings]
+                errors = sum((worker_errors for _, _, worker_errors in mine), Counter())
+                self.stdout.write("%-18s %2d clients %8.1f req/s  p50 %7.1f ms  p95 %7.1f ms  %d errors" % (
+                    label, len(mine), len(timings) / options['duration'],
+                    percentile(timings, 0.5) * 1000, percentile(timings, 0.95) * 1000,
+                    sum(errors.values())))
+                for error, count in errors.most_common():
+                    self.stdout.write("    %6d  %s" % (count, error))
+        finally:
+            Annotation.objects.filter(paper=paper).delete()
+            event.delete()
+            user.delete()
@@ -0,0 +1,56 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from conference import rendition
+from conference.models import Paper
+
+
+def process(job):
+    path, compressed = job
+    try:
+        rendition.build_rendition(path, compressed)
+        return path, None
+    except Exception as e:
+        return path, "%s: %s" % (type(e).__name__, e)
+
+
+class Command(BaseCommand):
+    help = "Build the sanitized renditions of existing papers in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=int, help="Only process the papers of this event id.")
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                            help="Number of worker processes.")
+        parser.add_argument('--force', action='store_true',
+                            help="Rebuild renditions that are still up to date.")
+        parser.add_argument('--gzip', action='store_true', default=None,
+                            help="Compress the renditions (default: RENDITION_GZIP).")
+
+    def handle(self, *args, **options):
+        papers = Paper.objects.all()
+        if options['event']:
+            papers = papers.filter(event_id=options['event'])
+        paths = []
+        for paper in papers.only('paper_file').iterator():
+            path = paper.paper_file.path
+            if options['force'] or not rendition.is_fresh(path):
+                paths.append(path)
+        # the workers only touch files, they must not share the connection
+        connection.close()
+
+        start = time.time()
+        failed = 0
+        pool = multiprocessing.Pool(max(1, options['workers']))
+        try:
+            for path, error in pool.imap_unordered(process, [(path, options['gzip']) for path in paths]):
+                if error:
+                    failed += 1
+                    self.stderr.write("%s: %s" % (path, error))
+        finally:
+            pool.close()
+            pool.join()
+        self.stdout.write("Processed %d papers in %.1f s, %d failed." % (
+            len(paths) - failed, time.time() - start, failed))
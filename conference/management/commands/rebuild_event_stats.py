@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from conference.models import Event
+from conference.stats import rebuild_all_event_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the dashboard statistics (EventStats) of every event."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=int, help="Only rebuild the stats of this event id.")
+
+    def handle(self, *args, **options):
+        events = Event.objects.all()
+        if options['event']:
+            events = events.filter(pk=options['event'])
+        rebuild_all_event_stats(events)
+        self.stdout.write("Rebuilt stats for %d events." % events.count())
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from conference.models import Event, Paper, rebuild_review_counters, update_event_readiness
+
+
+class Command(BaseCommand):
+    help = "Recompute paper reviewer/review counters, paper status and event closure readiness."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=int, help="Only rebuild the papers of this event id.")
+
+    def handle(self, *args, **options):
+        papers = Paper.objects.all()
+        events = Event.objects.all()
+        if options['event']:
+            papers = papers.filter(event_id=options['event'])
+            events = events.filter(pk=options['event'])
+        rebuild_review_counters(papers)
+        for event_id in events.values_list('id', flat=True):
+            update_event_readiness(event_id)
+        self.stdout.write("Rebuilt review counters for %d papers." % papers.count())
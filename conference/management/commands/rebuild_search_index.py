@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from conference import search
+
+
+class Command(BaseCommand):
+    help = "Recreate the full-text search index from every paper, review and annotation."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if not search.supported():
+            self.stderr.write("Full-text search isn't supported on this database.")
+            return
+        count = search.rebuild(options['batch_size'])
+        self.stdout.write("Indexed %d documents." % count)
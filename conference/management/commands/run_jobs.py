@@ -0,0 +1,65 @@
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from conference import jobs
+from conference.models import Job
+
+
+def run_job(job_id):
+    try:
+        jobs.run(job_id)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (event closure, imports, archives) in worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'JOB_WORKERS', 2),
+                            help="Number of jobs run at the same time.")
+        parser.add_argument('--poll', type=float, default=getattr(settings, 'JOB_POLL_INTERVAL', 1.0),
+                            help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the queue is empty instead of polling.")
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        heartbeat_interval = getattr(settings, 'JOB_HEARTBEAT_INTERVAL', 60)
+        last_heartbeat = 0
+        running = {}
+        try:
+            while True:
+                for job_id, process in list(running.items()):
+                    if not process.is_alive():
+                        process.join()
+                        del running[job_id]
+                        # a process killed before recording the outcome of
+                        # its job leaves it RUNNING
+                        jobs.process_exited(job_id, process.exitcode)
+                        job = Job.objects.get(pk=job_id)
+                        self.stdout.write("Job %s: %s" % (job_id, job.get_status_display()))
+                if running and time.time() - last_heartbeat >= heartbeat_interval:
+                    jobs.heartbeat(running)
+                    last_heartbeat = time.time()
+                jobs.requeue_stale()
+                if len(running) < workers:
+                    claimed = jobs.claim()
+                    if claimed is not None:
+                        # one process per job rather than a pool: pool workers are
+                        # daemonic and couldn't start the write-back workers
+                        connection.close()
+                        process = multiprocessing.Process(target=run_job, args=(claimed,))
+                        process.start()
+                        running[claimed] = process
+                        continue
+                if not running and options['once']:
+                    break
+                time.sleep(options['poll'] if not running else min(options['poll'], 0.1))
+        finally:
+            for process in running.values():
+                process.join()
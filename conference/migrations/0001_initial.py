@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-18 08:46
+from __future__ import unicode_literals
+
+import conference.models
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Author',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Chair',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Event',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('slug', models.SlugField(max_length=100, unique=True)),
+                ('acronym', models.CharField(max_length=50, unique=True)),
+                ('create_date', models.DateTimeField(auto_now_add=True)),
+                ('event_status', models.IntegerField(choices=[(0, b'Open'), (1, b'Closed')], default=0)),
+                ('chairs', models.ManyToManyField(related_name='chairs', through='conference.Chair', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Paper',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=250)),
+                ('slug', models.SlugField(unique=True)),
+                ('abstract', models.TextField(max_length=500)),
+                ('decided_at', models.DateTimeField(editable=False, null=True)),
+                ('locked', models.BooleanField(default=False)),
+                ('paper_file', models.FileField(upload_to=conference.models.content_file_name)),
+                ('submit_date', models.DateTimeField(auto_now_add=True)),
+                ('status', models.IntegerField(choices=[(0, b'Under Review'), (1, b'Awaiting Decision'), (2, b'Accepted'), (3, b'Rejected')], default=0)),
+                ('authors', models.ManyToManyField(related_name='authors', through='conference.Author', to=settings.AUTH_USER_MODEL)),
+                ('decided_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='decided_by', to=settings.AUTH_USER_MODEL)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='conference.Event')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PC_Member',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='conference.Event')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'PC Member',
+                'verbose_name_plural': 'PC Members',
+            },
+        ),
+        migrations.CreateModel(
+            name='Profile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_name', models.CharField(max_length=250)),
+                ('last_name', models.CharField(max_length=250)),
+                ('sex', models.IntegerField(choices=[(0, b'None'), (1, b'Female'), (2, b'Male')], default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Review',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('decision', models.IntegerField(choices=[(0, b'Not Sure'), (1, b'Accept'), (2, b'Reject')], default=0)),
+                ('rate', models.IntegerField(choices=[(0, b'None'), (1, b'Awful'), (2, b'Bad'), (3, b'Medium'), (4, b'Good'), (5, b'Awesome')], default=3)),
+                ('comment', models.CharField(max_length=500)),
+                ('review_date', models.DateTimeField(auto_now_add=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='conference.Event')),
+                ('paper', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='conference.Paper')),
+                ('reviewer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Reviewer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('paper', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='conference.Paper')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='paper',
+            name='reviewers',
+            field=models.ManyToManyField(related_name='reviewers', through='conference.Reviewer', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='paper',
+            name='submited_by',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submited_by', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='pc_members',
+            field=models.ManyToManyField(related_name='pc_members', through='conference.PC_Member', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='chair',
+            name='event',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='conference.Event'),
+        ),
+        migrations.AddField(
+            model_name='chair',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='author',
+            name='paper',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='conference.Paper'),
+        ),
+        migrations.AddField(
+            model_name='author',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+MEMBERSHIPS = (
+    ('Chair', 'event'),
+    ('PC_Member', 'event'),
+    ('Reviewer', 'paper'),
+    ('Author', 'paper'),
+)
+
+
+def dedupe_memberships(apps, schema_editor):
+    """
+    Keeps the oldest row of every duplicated (user, event/paper) membership
+    so the unique constraints of the next migration can be added.
+    """
+    for model_name, target in MEMBERSHIPS:
+        model = apps.get_model('conference', model_name)
+        duplicates = (model.objects.values('user', target)
+                      .annotate(keep=Min('id'), rows=Count('id'))
+                      .filter(rows__gt=1))
+        for duplicate in duplicates:
+            model.objects.filter(user=duplicate['user'], **{target: duplicate[target]}) \
+                         .exclude(id=duplicate['keep']).delete()
+
+    # the review tracker counted the duplicated reviewers too
+    Paper = apps.get_model('conference', 'Paper')
+    Reviewer = apps.get_model('conference', 'Reviewer')
+    counts = Reviewer.objects.values('paper').annotate(rows=Count('id'))
+    for count in counts:
+        Paper.objects.filter(pk=count['paper']).update(reviewer_count=count['rows'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conference', '0002_review_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_memberships, migrations.RunPython.noop),
+    ]
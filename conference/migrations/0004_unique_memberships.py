@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-18 08:46
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conference', '0003_dedupe_memberships'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='author',
+            unique_together=set([('paper', 'user')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='chair',
+            unique_together=set([('event', 'user')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pc_member',
+            unique_together=set([('event', 'user')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='reviewer',
+            unique_together=set([('paper', 'user')]),
+        ),
+    ]
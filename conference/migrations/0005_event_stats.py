@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-18 08:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conference', '0004_unique_memberships'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventStats',
+            fields=[
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='conference.Event')),
+                ('under_review', models.IntegerField(default=0)),
+                ('awaiting_decision', models.IntegerField(default=0)),
+                ('accepted', models.IntegerField(default=0)),
+                ('rejected', models.IntegerField(default=0)),
+                ('reviews', models.IntegerField(default=0)),
+                ('rated_reviews', models.IntegerField(default=0)),
+                ('rate_sum', models.IntegerField(default=0)),
+                ('not_sure', models.IntegerField(default=0)),
+                ('accept', models.IntegerField(default=0)),
+                ('reject', models.IntegerField(default=0)),
+                ('reviewer_assignments', models.IntegerField(default=0)),
+                ('reviewers', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Event stats',
+            },
+        ),
+    ]
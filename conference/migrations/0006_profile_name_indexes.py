@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-18 08:54
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+# istartswith is UPPER(column) LIKE UPPER(%s) on PostgreSQL, which only an
+# expression index with the pattern operator class can answer. On SQLite it
+# is a LIKE no index can answer, see conference/lookup.py
+UPPER_INDEXES = (
+    ('conference_profile_first_name_upper_like', 'conference_profile', 'first_name'),
+    ('conference_profile_last_name_upper_like', 'conference_profile', 'last_name'),
+    ('auth_user_username_upper_like', 'auth_user', 'username'),
+)
+
+
+def create_upper_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in UPPER_INDEXES:
+        schema_editor.execute('CREATE INDEX %s ON %s (UPPER(%s) varchar_pattern_ops)' % (name, table, column))
+
+
+def drop_upper_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in UPPER_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS %s' % name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0007_alter_validators_add_error_messages'),
+        ('conference', '0005_event_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='first_name',
+            field=models.CharField(db_index=True, max_length=250),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='last_name',
+            field=models.CharField(db_index=True, max_length=250),
+        ),
+        migrations.RunPython(create_upper_indexes, drop_upper_indexes),
+    ]
@@ -1,7 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models.signals import post_save
+from django.db.models import Count, F, Q, Sum, Case, When, IntegerField
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal
 from django.core.urlresolvers import reverse
 from django.utils.text import slugify
 from django.conf import settings
@@ -14,6 +16,15 @@ from datetime import datetime
 def content_file_name(instance, filename):
     return 'papers/{0}'.format(filename)
 
+# sent when a paper moves from status ``old`` to ``new``
+paper_status_changed = Signal(providing_args=['paper_id', 'event_id', 'old', 'new'])
+
+def untracked_fields(instance):
+    # fields kept up to date by signal handlers with UPDATE statements are
+    # left out of ordinary saves, so a stale instance can't overwrite them
+    return [f.name for f in instance._meta.concrete_fields
+            if not f.primary_key and f.name not in instance.TRACKED_FIELDS]
+
 class Event(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=100, unique=True)
@@ -30,6 +41,9 @@ class Event(models.Model):
         (CLOSED, 'Closed'),
     )
     event_status = models.IntegerField(choices=EVENT_CHOICES, default=OPEN)
+    # maintained by update_event_readiness whenever a paper is saved or deleted
+    ready_to_be_closed = models.BooleanField(default=False, editable=False)
+    TRACKED_FIELDS = ('ready_to_be_closed',)
 
     def __str__(self):
         return self.name
@@ -37,6 +51,8 @@ class Event(models.Model):
     def save(self, *args, **kwargs):
         if not self.id:
             self.slug = slugify(self.name)[0:99]
+        if not self._state.adding and 'update_fields' not in kwargs:
+            kwargs['update_fields'] = untracked_fields(self)
         super(Event, self).save(*args, **kwargs)
 
     def get_absolute_url(self):
@@ -80,13 +96,35 @@ class Paper(models.Model):
     )
     status = models.IntegerField(choices=STATUS_CHOICES, default=UNDER_REVIEW)
 
+    # maintained by the review-completion tracker below, never by Paper.save
+    reviewer_count = models.IntegerField(default=0, editable=False)
+    review_count = models.IntegerField(default=0, editable=False)
+    TRACKED_FIELDS = ('reviewer_count', 'review_count')
+
     def __str__(self):
         return "%s submitted for: %s" %(self.title, self.event)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Paper, cls).from_db(db, field_names, values)
+        # the stored file, the search index reindexes the text of a new one
+        instance._loaded_paper_file = instance.__dict__.get('paper_file')
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.id:
             self.slug = slugify(self.title)
+        old = None
+        if not self._state.adding:
+            if 'update_fields' not in kwargs:
+                kwargs['update_fields'] = untracked_fields(self)
+            # the tracker changes the status with UPDATEs, so the loaded
+            # value can't be trusted
+            old = Paper.objects.filter(pk=self.pk).values_list('status', flat=True).first()
         super(Paper, self).save(*args, **kwargs)
+        if old is not None and old != self.status:
+            paper_status_changed.send(sender=Paper, paper_id=self.pk, event_id=self.event_id,
+                                      old=old, new=self.status)
 
     def get_absolute_url(self):
         return reverse("paper_detail", kwargs={"pk": str(self.id), "slug": self.slug})
@@ -148,14 +186,20 @@ class Review(models.Model):
 class Author(models.Model):
     user = models.ForeignKey(User)
     paper = models.ForeignKey(Paper)
+    class Meta:
+        unique_together = ('paper', 'user')
 
 class Reviewer(models.Model):
     user = models.ForeignKey(User)
     paper = models.ForeignKey(Paper)
+    class Meta:
+        unique_together = ('paper', 'user')
 
 class Chair(models.Model):
     user = models.ForeignKey(User)
     event = models.ForeignKey(Event)
+    class Meta:
+        unique_together = ('event', 'user')
 
 class PC_Member(models.Model):
     user = models.ForeignKey(User)
@@ -163,11 +207,129 @@ class PC_Member(models.Model):
     class Meta:
         verbose_name = 'PC Member'
         verbose_name_plural = 'PC Members'
+        unique_together = ('event', 'user')
+
+class EventStats(models.Model):
+    """
+    Dashboard numbers of an event, kept up to date by the handlers in
+    conference/stats.py so pages can show them without scanning papers and
+    reviews.
+    """
+    event = models.OneToOneField(Event, related_name='stats', primary_key=True)
+
+    under_review = models.IntegerField(default=0)
+    awaiting_decision = models.IntegerField(default=0)
+    accepted = models.IntegerField(default=0)
+    rejected = models.IntegerField(default=0)
+
+    reviews = models.IntegerField(default=0)
+    rated_reviews = models.IntegerField(default=0)
+    rate_sum = models.IntegerField(default=0)
+    not_sure = models.IntegerField(default=0)
+    accept = models.IntegerField(default=0)
+    reject = models.IntegerField(default=0)
+
+    reviewer_assignments = models.IntegerField(default=0)
+    reviewers = models.IntegerField(default=0)
+
+    STATUS_FIELDS = {
+        Paper.UNDER_REVIEW: 'under_review',
+        Paper.AWAITING_DECISION: 'awaiting_decision',
+        Paper.ACCEPTED: 'accepted',
+        Paper.REJECTED: 'rejected',
+    }
+    DECISION_FIELDS = {
+        Review.NOTSURE: 'not_sure',
+        Review.ACCEPT: 'accept',
+        Review.REJECT: 'reject',
+    }
+
+    class Meta:
+        verbose_name_plural = 'Event stats'
+
+    def __str__(self):
+        return "Stats of %s" % self.event_id
+
+    @property
+    def papers(self):
+        return self.under_review + self.awaiting_decision + self.accepted + self.rejected
+
+    @property
+    def average_rate(self):
+        if not self.rated_reviews:
+            return None
+        return float(self.rate_sum) / self.rated_reviews
+
+    @property
+    def average_load(self):
+        if not self.reviewers:
+            return None
+        return float(self.reviewer_assignments) / self.reviewers
+
+class Job(models.Model):
+    """
+    A unit of background work (closing an event, importing users or events,
+    building an event archive) run by the run_jobs worker, see
+    conference/jobs.py.
+    """
+    kind = models.CharField(max_length=50)
+    args = models.TextField(default="{}")
+    event = models.ForeignKey(Event, null=True, blank=True, related_name='jobs')
+
+    # equal to the idempotency key while the job is queued or running, so
+    # enqueueing the same work twice returns the pending job
+    active_key = models.CharField(max_length=200, null=True, blank=True, unique=True)
+    key = models.CharField(max_length=200, blank=True, db_index=True)
+
+    QUEUED, RUNNING, DONE, FAILED = range(4)
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+    status = models.IntegerField(choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+
+    progress = models.IntegerField(default=0)
+    message = models.CharField(max_length=250, blank=True)
+    error = models.TextField(blank=True)
+
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    # refreshed by every progress report, a running job that stops
+    # reporting is considered abandoned by its worker
+    heartbeat = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        index_together = (('status', 'run_after'),)
+
+    def __str__(self):
+        return "%s #%s (%s)" % (self.kind, self.pk, self.get_status_display())
+
+    @property
+    def is_pending(self):
+        return self.status in (Job.QUEUED, Job.RUNNING)
+
+    def report(self, progress=None, message=None):
+        """
+        Records the progress (0-100) and status message of the running job.
+        """
+        updates = {'heartbeat': timezone.now()}
+        if progress is not None:
+            self.progress = updates['progress'] = max(0, min(100, int(progress)))
+        if message is not None:
+            self.message = updates['message'] = message[:250]
+        Job.objects.filter(pk=self.pk).update(**updates)
 
 class Profile(models.Model):
     user = models.OneToOneField(User, unique=True)
-    first_name = models.CharField(max_length=250)
-    last_name = models.CharField(max_length=250)
+    # prefix searched by the user lookup, see conference/lookup.py
+    first_name = models.CharField(max_length=250, db_index=True)
+    last_name = models.CharField(max_length=250, db_index=True)
 
     NONE, FEMALE, MALE = range(3)
     SEX_CHOICES = (
@@ -194,3 +356,72 @@ def create_profile(sender, instance, created, **kwargs):
         profile, created = Profile.objects.get_or_create(user=instance)
 
 post_save.connect(create_profile, sender=User)
+
+
+# Review-completion tracker: keeps Paper.reviewer_count and Paper.review_count
+# in step with the Reviewer and Review rows and moves the paper between
+# UNDER_REVIEW and AWAITING_DECISION as soon as the counts match (or stop
+# matching), so reading the event page never has to write.
+
+def track_review_completion(paper_id):
+    reviews_complete = Q(reviewer_count__gt=0, review_count=F('reviewer_count'))
+    papers = Paper.objects.filter(pk=paper_id)
+    if papers.filter(reviews_complete, status=Paper.UNDER_REVIEW).update(status=Paper.AWAITING_DECISION):
+        old, new = Paper.UNDER_REVIEW, Paper.AWAITING_DECISION
+    elif papers.filter(status=Paper.AWAITING_DECISION).exclude(reviews_complete).update(status=Paper.UNDER_REVIEW):
+        old, new = Paper.AWAITING_DECISION, Paper.UNDER_REVIEW
+    else:
+        return
+    event_id = papers.values_list('event_id', flat=True)[0]
+    paper_status_changed.send(sender=Paper, paper_id=paper_id, event_id=event_id, old=old, new=new)
+
+def rebuild_review_counters(papers=None):
+    if papers is None:
+        papers = Paper.objects.all()
+    papers = papers.annotate(num_reviewers=Count('reviewers', distinct=True),
+                             num_reviews=Count('review', distinct=True))
+    for paper_id, num_reviewers, num_reviews in papers.values_list('id', 'num_reviewers', 'num_reviews'):
+        Paper.objects.filter(pk=paper_id).update(reviewer_count=num_reviewers, review_count=num_reviews)
+        track_review_completion(paper_id)
+
+def update_event_readiness(event_id):
+    totals = Paper.objects.filter(event_id=event_id).aggregate(
+        papers=Count('id'),
+        locked=Sum(Case(When(locked=True, then=1), default=0, output_field=IntegerField())),
+    )
+    ready = totals['papers'] > 0 and totals['locked'] == totals['papers']
+    Event.objects.filter(pk=event_id).update(ready_to_be_closed=ready)
+
+def reviewer_added(sender, instance, created, **kwargs):
+    if created:
+        Paper.objects.filter(pk=instance.paper_id).update(reviewer_count=F('reviewer_count') + 1)
+        track_review_completion(instance.paper_id)
+
+def reviewer_removed(sender, instance, **kwargs):
+    Paper.objects.filter(pk=instance.paper_id).update(reviewer_count=F('reviewer_count') - 1)
+    track_review_completion(instance.paper_id)
+
+def review_added(sender, instance, created, **kwargs):
+    if created:
+        Paper.objects.filter(pk=instance.paper_id).update(review_count=F('review_count') + 1)
+        track_review_completion(instance.paper_id)
+
+def review_removed(sender, instance, **kwargs):
+    Paper.objects.filter(pk=instance.paper_id).update(review_count=F('review_count') - 1)
+    track_review_completion(instance.paper_id)
+
+def paper_saved(sender, instance, **kwargs):
+    # a cancelled decision goes straight back to AWAITING_DECISION when all
+    # reviews are in
+    track_review_completion(instance.pk)
+    update_event_readiness(instance.event_id)
+
+def paper_deleted(sender, instance, **kwargs):
+    update_event_readiness(instance.event_id)
+
+post_save.connect(reviewer_added, sender=Reviewer)
+post_delete.connect(reviewer_removed, sender=Reviewer)
+post_save.connect(review_added, sender=Review)
+post_delete.connect(review_removed, sender=Review)
+post_save.connect(paper_saved, sender=Paper)
+post_delete.connect(paper_deleted, sender=Paper)
@@ -0,0 +1,161 @@
+"""
+Cache of the rendered ``<body>`` fragment of uploaded papers.
+
+PaperReview used to parse the paper HTML on every request. The sanitized
+body is now read from the rendition built at upload time (see
+conference/rendition.py) and kept in memory under a key made of the paper
+id and the mtime and size of its file, so replacing the file on disk
+invalidates the entry without any bookkeeping.
+
+The backend is chosen with the PAPER_CACHE setting::
+
+    PAPER_CACHE = {
+        'BACKEND': 'lru',               # or 'django'
+        'MAX_BYTES': 64 * 1024 * 1024,  # budget of the 'lru' backend
+        'CACHE_ALIAS': 'default',       # cache used by the 'django' backend
+        'TIMEOUT': None,
+    }
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from conference import rendition
+
+
+DEFAULTS = {
+    'BACKEND': 'lru',
+    'MAX_BYTES': 64 * 1024 * 1024,
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': None,
+}
+
+
+class LRUByteCache(object):
+    """
+    In-process LRU cache that evicts the least recently used entries once
+    the total size of the cached values exceeds ``max_bytes``.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is not None:
+                self._entries[key] = value
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class DjangoCacheBackend(object):
+    """
+    Stores the fragments in one of the caches configured in CACHES. That
+    cache holds other entries too (roles, fragments, user lookups), so the
+    fragments are stored under the cache version kept at GENERATION_KEY
+    and clear() moves to a new one instead of clearing the whole cache.
+    """
+    GENERATION_KEY = "paper-body:generation"
+
+    def __init__(self, alias, timeout):
+        self.alias = alias
+        self.timeout = timeout
+
+    def generation(self):
+        cache = caches[self.alias]
+        generation = cache.get(self.GENERATION_KEY)
+        if generation is None:
+            # an evicted generation must not come back as an old one
+            cache.add(self.GENERATION_KEY, int(time.time() * 1000), None)
+            generation = cache.get(self.GENERATION_KEY)
+        return generation
+
+    def get(self, key):
+        return caches[self.alias].get(key, version=self.generation())
+
+    def set(self, key, value):
+        caches[self.alias].set(key, value, self.timeout, version=self.generation())
+
+    def clear(self):
+        cache = caches[self.alias]
+        try:
+            cache.incr(self.GENERATION_KEY)
+        except ValueError:
+            cache.set(self.GENERATION_KEY, int(time.time() * 1000), None)
+
+
+_backend = None
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        config = dict(DEFAULTS, **getattr(settings, 'PAPER_CACHE', {}))
+        if config['BACKEND'] == 'django':
+            _backend = DjangoCacheBackend(config['CACHE_ALIAS'], config['TIMEOUT'])
+        elif config['BACKEND'] == 'lru':
+            _backend = LRUByteCache(config['MAX_BYTES'])
+        else:
+            raise ValueError("Unknown PAPER_CACHE backend: %r" % config['BACKEND'])
+    return _backend
+
+def reset_backend():
+    global _backend
+    _backend = None
+
+
+def render_body(path):
+    body, _ = rendition.get_rendition(path)
+    return body
+
+def cache_key(paper_id, path):
+    stat = os.stat(path)
+    return "paper-body:%s:%r:%d" % (paper_id, stat.st_mtime, stat.st_size)
+
+def get_body(paper_id, path):
+    backend = get_backend()
+    key = cache_key(paper_id, path)
+    body = backend.get(key)
+    if body is None:
+        body = render_body(path)
+        backend.set(key, body)
+    return body
+
+def get_paper_body(paper):
+    """
+    Returns the rendered body of ``paper``, parsing its file only on a miss.
+    """
+    return get_body(paper.pk, paper.paper_file.path)
+
+def get_paper_meta(paper):
+    """
+    Returns the title, section and word counts of ``paper``'s rendition.
+    """
+    return rendition.load_meta(paper.paper_file.path)
+
+def warm_paper_body(paper):
+    # builds the rendition of a new upload and keeps its body in memory
+    get_paper_body(paper)
@@ -0,0 +1,261 @@
+"""
+Request profiling: the wall time, number and time of SQL queries and
+response size of every request, aggregated per URL name into fixed-bucket
+histograms in every process.
+
+ProfilingMiddleware goes first in MIDDLEWARE_CLASSES so the time includes
+the other middleware. Queries are counted by wrapping the cursors of every
+connection for the duration of the request, without the SQL formatting and
+logging of the DEBUG cursor. Queries run while a streaming response is
+consumed happen after the middleware and aren't counted, nor is the size of
+such responses.
+
+A request over the query or time budget of its view is logged as a
+warning on the ``conference.profiling`` logger and counted as over budget.
+Every LOG_INTERVAL seconds the summary of each view is logged; see stats()
+and the staff-only ``/profiling/`` endpoint for the numbers themselves.
+
+    PROFILING = {
+        'ENABLED': True,
+        'DEFAULT_BUDGET': {'queries': 50, 'time': 1000},
+        'BUDGETS': {'event_detail': {'queries': 30}},
+        'LOG_INTERVAL': 300,
+    }
+
+Budget times are in milliseconds; None disables a budget.
+"""
+import bisect
+import logging
+import threading
+import time
+from functools import partial
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'DEFAULT_BUDGET': {'queries': 50, 'time': 1000},
+    'BUDGETS': {},
+    'LOG_INTERVAL': 300,
+}
+
+# upper bounds of the histogram buckets, the last bucket is unbounded
+BUCKETS = {
+    'time': (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+    'sql_time': (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000),
+    'queries': (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+    'size': (1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+}
+
+_views = {}
+_lock = threading.Lock()
+_last_log = [time.time()]
+
+
+def get_setting(name):
+    return getattr(settings, 'PROFILING', {}).get(name, DEFAULTS[name])
+
+def get_budget(view_name):
+    budget = dict(get_setting('DEFAULT_BUDGET'))
+    budget.update(get_setting('BUDGETS').get(view_name, {}))
+    return budget
+
+
+class Histogram(object):
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction):
+        """
+        Returns the upper bound of the bucket holding the ``fraction``
+        percentile, or the maximum for the last bucket.
+        """
+        if not self.count:
+            return 0
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'mean': float(self.total) / self.count if self.count else 0,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'buckets': [[bound, count] for bound, count in zip(list(self.bounds) + [None], self.buckets)],
+        }
+
+
+class ViewStats(object):
+
+    def __init__(self):
+        self.requests = 0
+        self.over_budget = 0
+        self.histograms = dict((name, Histogram(bounds)) for name, bounds in BUCKETS.items())
+
+
+def record(view_name, sample, over_budget=False):
+    """
+    Adds ``sample`` (a dict of the BUCKETS measures, 'size' may be missing)
+    to the histograms of ``view_name``.
+    """
+    with _lock:
+        view = _views.get(view_name)
+        if view is None:
+            view = _views[view_name] = ViewStats()
+        view.requests += 1
+        view.over_budget += over_budget
+        for name, value in sample.items():
+            view.histograms[name].add(value)
+
+def stats():
+    """
+    Returns ``{url name: {'requests': n, 'over_budget': n, 'time': {...},
+    'sql_time': {...}, 'queries': {...}, 'size': {...}}}`` for this
+    process, times in milliseconds and sizes in bytes.
+    """
+    with _lock:
+        result = {}
+        for name, view in _views.items():
+            result[name] = dict((measure, histogram.as_dict()) for measure, histogram in view.histograms.items())
+            result[name].update({'requests': view.requests, 'over_budget': view.over_budget})
+        return result
+
+def reset():
+    with _lock:
+        _views.clear()
+
+
+def log_summary():
+    for name, view in sorted(stats().items()):
+        logger.info("%s: %d requests (%d over budget), time p50 %s p95 %s ms, queries p50 %s p95 %s",
+                    name, view['requests'], view['over_budget'], view['time']['p50'], view['time']['p95'],
+                    view['queries']['p50'], view['queries']['p95'])
+
+def maybe_log_summary():
+    interval = get_setting('LOG_INTERVAL')
+    if not interval:
+        return
+    now = time.time()
+    with _lock:
+        if now - _last_log[0] < interval:
+            return
+        _last_log[0] = now
+    log_summary()
+
+
+class QueryCounter(object):
+
+    def __init__(self):
+        self.queries = 0
+        self.time = 0.0
+
+
+class CountingCursorWrapper(CursorWrapper):
+
+    def __init__(self, cursor, db, counter):
+        super(CountingCursorWrapper, self).__init__(cursor, db)
+        self.counter = counter
+
+    def timed(self, method, *args):
+        start = time.time()
+        try:
+            return method(*args)
+        finally:
+            self.counter.queries += 1
+            self.counter.time += time.time() - start
+
+    def execute(self, sql, params=None):
+        return self.timed(super(CountingCursorWrapper, self).execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self.timed(super(CountingCursorWrapper, self).executemany, sql, param_list)
+
+
+def start_counting(connection, counter):
+    """
+    Counts the queries of ``connection`` into ``counter`` until the returned
+    function is called. Calls nest, the DEBUG query log keeps working.
+    """
+    base = connection.make_debug_cursor if connection.queries_logged else connection.make_cursor
+    saved = (connection.__dict__.get('make_debug_cursor'), connection.force_debug_cursor)
+    connection.make_debug_cursor = lambda cursor: CountingCursorWrapper(base(cursor), connection, counter)
+    connection.force_debug_cursor = True
+    return partial(stop_counting, connection, saved)
+
+def stop_counting(connection, saved):
+    make_debug_cursor, connection.force_debug_cursor = saved
+    if make_debug_cursor is None:
+        del connection.make_debug_cursor
+    else:
+        connection.make_debug_cursor = make_debug_cursor
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return "<unresolved>"
+    return match.url_name or match.view_name or "<unnamed>"
+
+
+class ProfilingMiddleware(object):
+
+    def process_request(self, request):
+        if not get_setting('ENABLED'):
+            return
+        counter = QueryCounter()
+        stops = [start_counting(connection, counter) for connection in connections.all()]
+        request._profiling = (time.time(), counter, stops)
+
+    def process_response(self, request, response):
+        profiling = getattr(request, '_profiling', None)
+        if profiling is None:
+            return response
+        del request._profiling
+        start, counter, stops = profiling
+        for stop in stops:
+            stop()
+
+        name = view_name(request)
+        sample = {
+            'time': (time.time() - start) * 1000,
+            'sql_time': counter.time * 1000,
+            'queries': counter.queries,
+        }
+        if not response.streaming:
+            sample['size'] = len(response.content)
+        budget = get_budget(name)
+        over = [measure for measure in ('queries', 'time')
+                if budget.get(measure) is not None and sample[measure] > budget[measure]]
+        record(name, sample, bool(over))
+
+        line = "%s %s [%s] %d: %.1f ms, %d queries in %.1f ms, %s bytes" % (
+            request.method, request.path, name, response.status_code, sample['time'],
+            sample['queries'], sample['sql_time'], sample.get('size', "?"))
+        if over:
+            logger.warning("over %s budget: %s", " and ".join(over), line)
+        else:
+            logger.debug(line)
+        maybe_log_summary()
+        return response
@@ -0,0 +1,164 @@
+"""
+Sanitized rendition of uploaded papers, built once at upload time.
+
+The paper HTML is parsed, its ``<body>`` is stripped of scripts, event
+handler attributes, ``javascript:`` links, frames, embedded objects and
+forms, and the result is written compactly next to the original file
+(``<file>.rendition.html``, or ``.rendition.html.gz`` when RENDITION_GZIP
+is set) together with ``<file>.rendition.json``::
+
+    {"title": ..., "sections": 12, "words": 5321, "size": 80123,
+     "source_mtime": ..., "source_size": ..., "gzip": false}
+
+The source mtime and size recorded in the metadata tell whether the
+rendition still matches the paper file; a stale or missing rendition is
+rebuilt on first use. Existing papers can be processed in bulk with the
+``process_papers`` management command.
+"""
+import gzip
+import io
+import json
+import os
+import re
+import stat
+import tempfile
+
+from django.conf import settings
+from lxml import etree as et
+from lxml import html
+from lxml.html.clean import Cleaner
+
+
+cleaner = Cleaner(
+    scripts=True,
+    javascript=True,
+    embedded=True,
+    frames=True,
+    forms=True,
+    comments=True,
+    processing_instructions=True,
+    # RASH papers rely on their own elements, attributes and styles
+    style=False,
+    links=False,
+    meta=False,
+    page_structure=False,
+    remove_unknown_tags=False,
+    safe_attrs_only=False,
+)
+
+
+word_re = re.compile(r"\w+", re.UNICODE)
+
+
+def body_path(path, compressed):
+    return path + (".rendition.html.gz" if compressed else ".rendition.html")
+
+def meta_path(path):
+    return path + ".rendition.json"
+
+
+def write_atomically(path, data):
+    # readers never see a half written file
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        if os.path.exists(path):
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode))
+        os.rename(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def extract(path):
+    """
+    Parses the paper at ``path`` and returns its sanitized body and its
+    metadata.
+    """
+    # papers are UTF-8, libxml2 would read a file without a charset
+    # declaration as Latin-1
+    root = html.parse(path, html.HTMLParser(encoding="utf-8")).getroot()
+    title = root.findtext("head/title") or root.findtext(".//h1") or ""
+    body = root.find("body")
+    if body is None:
+        body = html.Element("body")
+    body = cleaner.clean_html(body)
+    text = " ".join(body.itertext())
+    meta = {
+        "title": " ".join(title.split()),
+        "sections": len(body.findall(".//section")),
+        "words": len(word_re.findall(text)),
+    }
+    return et.tostring(body, method="html", encoding="utf-8"), meta
+
+
+def build_rendition(path, compressed=None):
+    """
+    Builds the rendition of the paper at ``path`` and returns its metadata.
+    """
+    if compressed is None:
+        compressed = getattr(settings, 'RENDITION_GZIP', False)
+    source = os.stat(path)
+    body, meta = extract(path)
+    meta.update({
+        "size": len(body),
+        "source_mtime": source.st_mtime,
+        "source_size": source.st_size,
+        "gzip": compressed,
+    })
+    if compressed:
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode="wb") as f:
+            f.write(body)
+        body = buf.getvalue()
+    write_atomically(body_path(path, compressed), body)
+    # the metadata goes last, it's what marks the rendition as complete
+    write_atomically(meta_path(path), json.dumps(meta).encode("utf-8"))
+    return meta
+
+
+def load_meta(path):
+    """
+    Returns the metadata of the rendition of ``path``, or None if there is
+    no rendition or the paper file changed since it was built.
+    """
+    try:
+        with open(meta_path(path), "rb") as f:
+            meta = json.loads(f.read().decode("utf-8"))
+        source = os.stat(path)
+    except (IOError, OSError, ValueError):
+        return None
+    if meta.get("source_mtime") != source.st_mtime or meta.get("source_size") != source.st_size:
+        return None
+    return meta
+
+
+def load_body(path, meta):
+    with open(body_path(path, meta["gzip"]), "rb") as f:
+        body = f.read()
+    if meta["gzip"]:
+        with gzip.GzipFile(fileobj=io.BytesIO(body)) as f:
+            body = f.read()
+    return body
+
+
+def get_rendition(path):
+    """
+    Returns ``(body, meta)`` of the paper at ``path``, building the
+    rendition first if it's missing or stale.
+    """
+    meta = load_meta(path)
+    if meta is not None:
+        try:
+            return load_body(path, meta), meta
+        except (IOError, OSError):
+            pass
+    build_rendition(path)
+    meta = load_meta(path)
+    return load_body(path, meta), meta
+
+
+def is_fresh(path):
+    return load_meta(path) is not None
@@ -0,0 +1,113 @@
+"""
+Answers "is this user a chair / PC member of this event, a reviewer /
+author of this paper" without loading whole relations.
+
+All the memberships of a user are read with a single query the first time
+they're needed and kept on the user object for the rest of the request.
+When ROLE_CACHE_TIMEOUT is non-zero and the default cache is shared by
+every process (see conference/caching.py) they are also kept in the cache
+across requests; changes to Chair, PC_Member, Reviewer and Author rows
+invalidate the cached entry of their user.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models.signals import post_save, post_delete
+
+from conference.caching import is_shared
+from conference.models import Chair, PC_Member, Reviewer, Author
+
+
+ROLE_TABLES = (
+    ('chair', Chair, 'event_id'),
+    ('pc_member', PC_Member, 'event_id'),
+    ('reviewer', Reviewer, 'paper_id'),
+    ('author', Author, 'paper_id'),
+)
+
+
+def cache_key(user_id):
+    return "roles:%s" % user_id
+
+def cache_timeout():
+    if not is_shared():
+        return 0
+    return getattr(settings, 'ROLE_CACHE_TIMEOUT', 0)
+
+
+def load_roles(user_id):
+    """
+    Returns a dict mapping every role to the ids of the events or papers
+    ``user_id`` holds it for.
+    """
+    qn = connection.ops.quote_name
+    sql = " UNION ALL ".join(
+        "SELECT '%s', %s FROM %s WHERE %s = %%s" % (role, qn(column), qn(model._meta.db_table), qn('user_id'))
+        for role, model, column in ROLE_TABLES
+    )
+    roles = dict((role, set()) for role, _, _ in ROLE_TABLES)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id] * len(ROLE_TABLES))
+        for role, object_id in cursor.fetchall():
+            roles[role].add(object_id)
+    return roles
+
+
+def object_id(obj):
+    return getattr(obj, 'pk', obj)
+
+
+class Roles(object):
+
+    def __init__(self, user):
+        self.user = user
+        self._roles = None
+
+    @property
+    def roles(self):
+        if self._roles is None:
+            if not self.user.is_authenticated():
+                self._roles = dict((role, set()) for role, _, _ in ROLE_TABLES)
+            else:
+                timeout = cache_timeout()
+                roles = cache.get(cache_key(self.user.pk)) if timeout else None
+                if roles is None:
+                    roles = load_roles(self.user.pk)
+                    if timeout:
+                        cache.set(cache_key(self.user.pk), roles, timeout)
+                self._roles = roles
+        return self._roles
+
+    def is_chair(self, event):
+        return object_id(event) in self.roles['chair']
+
+    def is_pc_member(self, event):
+        return object_id(event) in self.roles['pc_member']
+
+    def is_reviewer(self, paper):
+        return object_id(paper) in self.roles['reviewer']
+
+    def is_author(self, paper):
+        return object_id(paper) in self.roles['author']
+
+
+def get_roles(user):
+    """
+    Returns the Roles of ``user``, shared by everything that asks about the
+    same user object (i.e. request.user during a request).
+    """
+    if not hasattr(user, '_roles'):
+        user._roles = Roles(user)
+    return user._roles
+
+
+def invalidate_roles(user_ids):
+    cache.delete_many([cache_key(user_id) for user_id in set(user_ids)])
+
+
+def membership_changed(sender, instance, **kwargs):
+    invalidate_roles([instance.user_id])
+
+for _, model, _ in ROLE_TABLES:
+    post_save.connect(membership_changed, sender=model, dispatch_uid="roles_%s_saved" % model.__name__)
+    post_delete.connect(membership_changed, sender=model, dispatch_uid="roles_%s_deleted" % model.__name__)
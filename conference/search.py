@@ -0,0 +1,389 @@
+"""
+Full-text search over papers (title and abstract, and the text of the paper
+file), reviews and annotations.
+
+Everything searchable is a row of the ``conference_search`` table: its
+kind, the id of the object, the paper it belongs to, an optional title and
+the text. On SQLite the table is an FTS5 index ranked with bm25(); on
+PostgreSQL it's a plain table with a weighted tsvector column, a GIN index
+and ts_rank_cd(). Either way a query returns ranked hits with highlighted
+snippets and the title and event of their paper in a single SQL statement.
+
+Rows are written by the save/delete signals of Paper, Review and
+Annotation. The text of a paper file is indexed from its sanitized
+rendition by an ``index_paper_text`` background job (see
+conference/jobs.py), queued when a paper is created or gets a new file and
+for every batch of imported papers, since building a rendition means
+parsing the whole paper. The table is created after ``migrate``;
+``manage.py rebuild_search_index`` fills it from the existing data.
+
+SQLite builds without FTS5 have no search: supported() is False, nothing is
+indexed and search() finds nothing.
+"""
+from django.db import DatabaseError, connection
+from django.db.models.signals import post_save, pre_delete, post_delete, post_migrate
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from lxml import html
+
+from annotation.models import Annotation, annotations_bulk_created
+from conference import rendition
+from conference.models import Paper, Review
+
+
+TABLE = "conference_search"
+
+PAPER, PAPER_TEXT, REVIEW, ANNOTATION = "paper", "paper_text", "review", "annotation"
+KIND_CHOICES = (
+    (PAPER, "Paper"),
+    (PAPER_TEXT, "Paper text"),
+    (REVIEW, "Review"),
+    (ANNOTATION, "Annotation"),
+)
+# only the chairs of an event (and staff) see these
+RESTRICTED_KINDS = (PAPER_TEXT, REVIEW, ANNOTATION)
+
+# snippet highlight markers, replaced by <mark> once the text is escaped
+START, STOP = u"\x02", u"\x03"
+
+SCHEMA = {
+    # FTS5 rows can only be found quickly by rowid, the key table gives
+    # every (kind, object_id) its rowid
+    'sqlite': [
+        "CREATE TABLE IF NOT EXISTS %s_key (id integer PRIMARY KEY, kind varchar(16) NOT NULL, "
+        "object_id varchar(64) NOT NULL, UNIQUE (kind, object_id))" % TABLE,
+        "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5("
+        "kind UNINDEXED, object_id UNINDEXED, paper_id UNINDEXED, title, body, "
+        "tokenize = 'porter unicode61')" % TABLE,
+        # titles weigh ten times the text; ORDER BY rank lets FTS5 sort the
+        # hits itself, so snippets are only built for the rows returned
+        "INSERT INTO %s (%s, rank) VALUES ('rank', 'bm25(0, 0, 0, 10.0, 1.0)')" % (TABLE, TABLE),
+    ],
+    'postgresql': [
+        "CREATE TABLE IF NOT EXISTS %s (kind varchar(16) NOT NULL, object_id varchar(64) NOT NULL, "
+        "paper_id integer, title text NOT NULL, body text NOT NULL, document tsvector NOT NULL, "
+        "PRIMARY KEY (kind, object_id))" % TABLE,
+        "CREATE INDEX IF NOT EXISTS %s_document ON %s USING gin (document)" % (TABLE, TABLE),
+    ],
+}
+
+TABLES = {
+    'sqlite': [TABLE, TABLE + "_key"],
+    'postgresql': [TABLE],
+}
+
+INSERT = {
+    'sqlite': "INSERT INTO %s (rowid, kind, object_id, paper_id, title, body) "
+              "VALUES (%%s, %%s, %%s, %%s, %%s, %%s)" % TABLE,
+    'postgresql': "INSERT INTO %s (kind, object_id, paper_id, title, body, document) "
+                  "VALUES (%%s, %%s, %%s, %%s, %%s, "
+                  "setweight(to_tsvector('english', %%s), 'A') || setweight(to_tsvector('english', %%s), 'B'))" % TABLE,
+}
+
+# params: query, filters, limit; %(restrict)s is filled in by search()
+QUERY = {
+    'sqlite': "SELECT s.kind, s.object_id, s.paper_id, p.title, p.slug, p.event_id, "
+              "snippet(%(table)s, 4, '\x02', '\x03', '...', 16), s.rank "
+              "FROM %(table)s s LEFT JOIN conference_paper p ON p.id = s.paper_id "
+              "WHERE %(table)s MATCH %%s%(restrict)s ORDER BY s.rank LIMIT %%s",
+    'postgresql': "SELECT s.kind, s.object_id, s.paper_id, p.title, p.slug, p.event_id, "
+                  "ts_headline('english', s.body, q, 'StartSel=\x02, StopSel=\x03, MaxWords=30, MinWords=10'), "
+                  "-ts_rank_cd(s.document, q) AS score "
+                  "FROM %(table)s s LEFT JOIN conference_paper p ON p.id = s.paper_id, "
+                  "plainto_tsquery('english', %%s) q "
+                  "WHERE s.document @@ q%(restrict)s ORDER BY score LIMIT %%s",
+}
+
+
+# whether the SQLite library of this process has FTS5, by connection alias
+_fts5 = {}
+
+
+def has_fts5():
+    if connection.alias not in _fts5:
+        with connection.cursor() as cursor:
+            try:
+                cursor.execute("CREATE VIRTUAL TABLE temp.%s_probe USING fts5(body)" % TABLE)
+            except DatabaseError:
+                _fts5[connection.alias] = False
+            else:
+                cursor.execute("DROP TABLE temp.%s_probe" % TABLE)
+                _fts5[connection.alias] = True
+    return _fts5[connection.alias]
+
+
+def supported():
+    if connection.vendor == 'sqlite':
+        return has_fts5()
+    return connection.vendor in SCHEMA
+
+
+def create_index():
+    if not supported():
+        return
+    with connection.cursor() as cursor:
+        for statement in SCHEMA[connection.vendor]:
+            cursor.execute(statement)
+
+
+def drop_index():
+    if not supported():
+        return
+    with connection.cursor() as cursor:
+        for table in TABLES[connection.vendor]:
+            cursor.execute("DROP TABLE IF EXISTS %s" % table)
+
+
+def delete_rows(cursor, keys, create=False):
+    """
+    Deletes the documents ``keys`` (``(kind, object_id)`` pairs). On SQLite
+    returns their rowids, allocated first if ``create`` is set.
+    """
+    if connection.vendor != 'sqlite':
+        cursor.executemany("DELETE FROM %s WHERE kind = %%s AND object_id = %%s" % TABLE, keys)
+        return []
+    if create:
+        cursor.executemany("INSERT OR IGNORE INTO %s_key (kind, object_id) VALUES (%%s, %%s)" % TABLE, keys)
+    found = {}
+    by_kind = {}
+    for kind, object_id in keys:
+        by_kind.setdefault(kind, []).append(object_id)
+    for kind, object_ids in by_kind.items():
+        # below SQLite's limit of bound variables
+        for start in range(0, len(object_ids), 500):
+            chunk = object_ids[start:start + 500]
+            cursor.execute("SELECT object_id, id FROM %s_key WHERE kind = %%s AND object_id IN (%s)" % (
+                TABLE, ", ".join(["%s"] * len(chunk))), [kind] + chunk)
+            found.update(((kind, object_id), rowid) for object_id, rowid in cursor.fetchall())
+    rowids = [found[key] for key in keys if key in found]
+    if rowids:
+        cursor.executemany("DELETE FROM %s WHERE rowid = %%s" % TABLE, [(rowid,) for rowid in rowids])
+    return rowids
+
+
+def index_documents(rows):
+    """
+    (Re)indexes ``rows`` of ``(kind, object_id, paper_id, title, body)``.
+    """
+    if not supported() or not rows:
+        return
+    rows = [(kind, str(object_id), paper_id, title or "", body or "")
+            for kind, object_id, paper_id, title, body in rows]
+    with connection.cursor() as cursor:
+        rowids = delete_rows(cursor, [row[:2] for row in rows], create=True)
+        if connection.vendor == 'sqlite':
+            params = [(rowid,) + row for rowid, row in zip(rowids, rows)]
+        else:
+            params = [row + row[3:] for row in rows]
+        cursor.executemany(INSERT[connection.vendor], params)
+
+
+def remove_documents(kind, object_ids):
+    if not supported():
+        return
+    keys = [(kind, str(object_id)) for object_id in object_ids]
+    with connection.cursor() as cursor:
+        delete_rows(cursor, keys)
+        if connection.vendor == 'sqlite':
+            cursor.executemany("DELETE FROM %s_key WHERE kind = %%s AND object_id = %%s" % TABLE, keys)
+
+
+# documents
+
+def paper_document(paper):
+    return (PAPER, paper.pk, paper.pk, paper.title, paper.abstract)
+
+def paper_text(paper):
+    """
+    Returns the text of the paper file of ``paper``, empty if it's missing.
+    """
+    try:
+        body, _ = rendition.get_rendition(paper.paper_file.path)
+    except (IOError, OSError, ValueError):
+        return ""
+    if not body.strip():
+        return ""
+    text = html.fromstring(body, parser=html.HTMLParser(encoding="utf-8")).text_content()
+    return " ".join(text.split())
+
+def paper_text_document(paper):
+    return (PAPER_TEXT, paper.pk, paper.pk, "", paper_text(paper))
+
+def review_document(review):
+    return (REVIEW, review.pk, review.paper_id, "", review.comment)
+
+def annotation_document(annotation):
+    return (ANNOTATION, annotation.pk, annotation.paper_id, "", "%s\n%s" % (annotation.text, annotation.quote))
+
+
+# queries
+
+def match_expression(query):
+    """
+    Turns free text into an FTS5 expression matching all of its words, so
+    user input can't be read as query syntax.
+    """
+    words = rendition.word_re.findall(query)
+    return " ".join('"%s"' % word for word in words)
+
+
+def highlight(snippet):
+    return mark_safe(escape(snippet or "").replace(START, "<mark>").replace(STOP, "</mark>"))
+
+
+def search(query, limit=20, event_id=None, kinds=None, chair_events=None):
+    """
+    Returns the ``limit`` best hits for ``query`` as dicts with kind,
+    kind_label, object_id, paper_id, paper_title, paper_slug, event_id,
+    snippet (safe HTML) and score (lower is better). Hits of
+    RESTRICTED_KINDS are limited to the events in ``chair_events`` unless
+    it is None.
+    """
+    if not supported():
+        return []
+    if connection.vendor == 'sqlite':
+        query = match_expression(query)
+    if not query.strip():
+        return []
+    restrict, params = [], [query]
+    if event_id is not None:
+        restrict.append("p.event_id = %s")
+        params.append(event_id)
+    if kinds:
+        restrict.append("s.kind IN (%s)" % ", ".join(["%s"] * len(kinds)))
+        params.extend(kinds)
+    if chair_events is not None:
+        allowed = ["s.kind NOT IN (%s)" % ", ".join(["%s"] * len(RESTRICTED_KINDS))]
+        params.extend(RESTRICTED_KINDS)
+        if chair_events:
+            allowed.append("p.event_id IN (%s)" % ", ".join(["%s"] * len(chair_events)))
+            params.extend(sorted(chair_events))
+        restrict.append("(%s)" % " OR ".join(allowed))
+    params.append(limit)
+    sql = QUERY[connection.vendor] % {
+        'table': TABLE,
+        'restrict': "".join(" AND " + condition for condition in restrict),
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    labels = dict(KIND_CHOICES)
+    return [{
+        'kind': kind,
+        'kind_label': labels.get(kind, kind),
+        'object_id': object_id,
+        'paper_id': paper_id,
+        'paper_title': paper_title,
+        'paper_slug': paper_slug,
+        'event_id': paper_event_id,
+        'snippet': highlight(snippet),
+        'score': score,
+    } for kind, object_id, paper_id, paper_title, paper_slug, paper_event_id, snippet, score in rows]
+
+
+def index_paper_text(paper_ids, progress=None, batch_size=20):
+    """
+    Indexes the text of the files of ``paper_ids``, building their
+    renditions if needed. ``progress(done, total)`` is called after every
+    batch.
+    """
+    papers = list(Paper.objects.filter(pk__in=paper_ids).order_by('pk'))
+    for start in range(0, len(papers), batch_size):
+        index_documents([paper_text_document(paper) for paper in papers[start:start + batch_size]])
+        if progress:
+            progress(min(start + batch_size, len(papers)), len(papers))
+
+
+def queue_paper_text(paper_ids):
+    """
+    Queues the indexing of the text of ``paper_ids`` as a background job.
+    """
+    # the job queue imports the importer, which imports this module
+    from conference import jobs
+    paper_ids = sorted(paper_ids)
+    if not supported() or not paper_ids:
+        return
+    key = "index_paper_text:%s" % paper_ids[0] if len(paper_ids) == 1 else None
+    jobs.enqueue('index_paper_text', key=key, paper_ids=paper_ids)
+
+
+def rebuild(batch_size=500):
+    """
+    Recreates the index from every paper, review and annotation and returns
+    the number of documents indexed.
+    """
+    drop_index()
+    create_index()
+    count = 0
+    sources = (
+        (Paper.objects.order_by('pk'), lambda paper: [paper_document(paper), paper_text_document(paper)]),
+        (Review.objects.order_by('pk'), lambda review: [review_document(review)]),
+        (Annotation.objects.exclude(paper=None).order_by('pk'), lambda annotation: [annotation_document(annotation)]),
+    )
+    for queryset, documents in sources:
+        batch = []
+        for obj in queryset.iterator():
+            batch.extend(documents(obj))
+            if len(batch) >= batch_size:
+                index_documents(batch)
+                count += len(batch)
+                batch = []
+        index_documents(batch)
+        count += len(batch)
+    return count
+
+
+# handlers
+
+def paper_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    index_documents([paper_document(instance)])
+    if update_fields is not None and 'paper_file' not in update_fields:
+        return
+    if created or instance.paper_file.name != getattr(instance, '_loaded_paper_file', None):
+        queue_paper_text([instance.pk])
+        instance._loaded_paper_file = instance.paper_file.name
+
+def paper_deleting(sender, instance, **kwargs):
+    # the annotations outlive the paper, only losing their link to it
+    remove_documents(ANNOTATION, instance.annotations.values_list('pk', flat=True))
+
+def paper_deleted(sender, instance, **kwargs):
+    remove_documents(PAPER, [instance.pk])
+    remove_documents(PAPER_TEXT, [instance.pk])
+
+def review_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_documents([review_document(instance)])
+
+def review_deleted(sender, instance, **kwargs):
+    remove_documents(REVIEW, [instance.pk])
+
+def annotation_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if instance.paper_id is None:
+        remove_documents(ANNOTATION, [instance.pk])
+    else:
+        index_documents([annotation_document(instance)])
+
+def annotation_deleted(sender, instance, **kwargs):
+    remove_documents(ANNOTATION, [instance.pk])
+
+def annotations_created(sender, annotations, **kwargs):
+    index_documents([annotation_document(annotation) for annotation in annotations if annotation.paper_id])
+
+def create_index_after_migrate(sender, **kwargs):
+    if sender.name == 'conference':
+        create_index()
+
+post_save.connect(paper_saved, sender=Paper, dispatch_uid="search_paper_saved")
+pre_delete.connect(paper_deleting, sender=Paper, dispatch_uid="search_paper_deleting")
+post_delete.connect(paper_deleted, sender=Paper, dispatch_uid="search_paper_deleted")
+post_save.connect(review_saved, sender=Review, dispatch_uid="search_review_saved")
+post_delete.connect(review_deleted, sender=Review, dispatch_uid="search_review_deleted")
+post_save.connect(annotation_saved, sender=Annotation, dispatch_uid="search_annotation_saved")
+post_delete.connect(annotation_deleted, sender=Annotation, dispatch_uid="search_annotation_deleted")
+annotations_bulk_created.connect(annotations_created, sender=Annotation, dispatch_uid="search_annotations_created")
+post_migrate.connect(create_index_after_migrate, dispatch_uid="search_create_index")
@@ -0,0 +1,87 @@
+// Wires every .user-lookup picker to the user lookup endpoint, see
+// templates/conference/user_lookup.html.
+(function () {
+  function setup(picker) {
+    if (picker.getAttribute("data-ready")) {
+      return;
+    }
+    picker.setAttribute("data-ready", "1");
+    var input = picker.querySelector("input");
+    var results = picker.querySelector(".user-lookup-results");
+    var more = picker.querySelector(".user-lookup-more");
+    var next = null, timer = null, request = null;
+
+    function link(href, text, className) {
+      var a = document.createElement("a");
+      a.href = href;
+      a.textContent = text;
+      if (className) {
+        a.className = className;
+      }
+      return a;
+    }
+
+    function render(users) {
+      users.forEach(function (user) {
+        var li = document.createElement("li");
+        var name = (user.first_name + " " + user.last_name).trim();
+        var profile = picker.getAttribute("data-profile").replace("__username__", encodeURIComponent(user.username));
+        li.appendChild(link(profile, user.username));
+        if (name) {
+          li.appendChild(document.createTextNode(" (" + name + ") "));
+        }
+        if (picker.getAttribute("data-action")) {
+          var action = picker.getAttribute("data-action").replace(/\/0\/$/, "/" + user.id + "/");
+          li.appendChild(link(action, picker.getAttribute("data-action-label"), "label label-success"));
+        }
+        results.appendChild(li);
+      });
+    }
+
+    function load(cursor) {
+      var params = ["q=" + encodeURIComponent(input.value)];
+      if (cursor) {
+        params.push("cursor=" + encodeURIComponent(cursor));
+      }
+      if (picker.getAttribute("data-event")) {
+        params.push("event=" + picker.getAttribute("data-event"));
+      }
+      if (picker.getAttribute("data-paper")) {
+        params.push("paper=" + picker.getAttribute("data-paper"));
+      }
+      if (request) {
+        request.abort();
+      }
+      request = new XMLHttpRequest();
+      request.open("GET", picker.getAttribute("data-url") + "?" + params.join("&"));
+      request.onload = function () {
+        if (request.status !== 200) {
+          return;
+        }
+        var data = JSON.parse(request.responseText);
+        if (!cursor) {
+          results.innerHTML = "";
+        }
+        render(data.results);
+        next = data.next;
+        more.style.display = next ? "" : "none";
+      };
+      request.send();
+    }
+
+    input.addEventListener("input", function () {
+      clearTimeout(timer);
+      timer = setTimeout(function () { load(null); }, 200);
+    });
+    more.addEventListener("click", function (e) {
+      e.preventDefault();
+      load(next);
+    });
+    load(null);
+  }
+
+  var pickers = document.querySelectorAll(".user-lookup");
+  for (var i = 0; i < pickers.length; i++) {
+    setup(pickers[i]);
+  }
+})();
@@ -0,0 +1,122 @@
+"""
+Keeps the EventStats row of every event in step with its papers, reviews
+and reviewer assignments.
+
+Every change is applied as a relative UPDATE (``F('field') + 1``) of the
+single stats row, so the event and home pages read the numbers without
+looking at Paper or Review at all. Anything the handlers can't express as
+a delta (an edited review, a missing stats row, rows created with
+bulk_create) falls back to rebuild_event_stats(), which recomputes the row
+with a few aggregate queries.
+"""
+from django.db.models import Count, F, Sum, Case, When, IntegerField
+from django.db.models.signals import post_save, post_delete
+
+from conference.models import (Event, EventStats, Paper, Review, Reviewer,
+                               paper_status_changed)
+
+
+def count_if(**conditions):
+    return Sum(Case(When(then=1, **conditions), default=0, output_field=IntegerField()))
+
+
+def count_reviewers(event_id):
+    return Reviewer.objects.filter(paper__event_id=event_id).values('user').distinct().count()
+
+
+def rebuild_event_stats(event_id):
+    values = {}
+    for status, field in EventStats.STATUS_FIELDS.items():
+        values[field] = 0
+    for row in Paper.objects.filter(event_id=event_id).values('status').annotate(n=Count('id')):
+        values[EventStats.STATUS_FIELDS[row['status']]] = row['n']
+
+    reviews = Review.objects.filter(event_id=event_id).aggregate(
+        reviews=Count('id'),
+        rated_reviews=count_if(rate__gt=Review.NONE),
+        rate_sum=Sum('rate'),
+        **dict((field, count_if(decision=decision))
+               for decision, field in EventStats.DECISION_FIELDS.items())
+    )
+    values.update((field, n or 0) for field, n in reviews.items())
+
+    values['reviewer_assignments'] = Reviewer.objects.filter(paper__event_id=event_id).count()
+    values['reviewers'] = count_reviewers(event_id)
+
+    stats, _ = EventStats.objects.update_or_create(event_id=event_id, defaults=values)
+    return stats
+
+
+def rebuild_all_event_stats(events=None):
+    if events is None:
+        events = Event.objects.all()
+    for event_id in events.values_list('id', flat=True):
+        rebuild_event_stats(event_id)
+
+
+def bump(event_id, rebuild_if_missing=True, values=None, **deltas):
+    updates = dict((field, F(field) + n) for field, n in deltas.items() if n)
+    updates.update(values or {})
+    if not updates:
+        return
+    if not EventStats.objects.filter(event_id=event_id).update(**updates) and rebuild_if_missing:
+        rebuild_event_stats(event_id)
+
+
+def review_deltas(review, sign):
+    deltas = {'reviews': sign, EventStats.DECISION_FIELDS[review.decision]: sign}
+    if review.rate > Review.NONE:
+        deltas['rated_reviews'] = sign
+        deltas['rate_sum'] = sign * review.rate
+    return deltas
+
+
+def event_saved(sender, instance, created, **kwargs):
+    if created:
+        EventStats.objects.get_or_create(event=instance)
+
+def paper_added(sender, instance, created, **kwargs):
+    if created:
+        bump(instance.event_id, **{EventStats.STATUS_FIELDS[instance.status]: 1})
+
+def paper_removed(sender, instance, **kwargs):
+    # while an event is being deleted its stats row may already be gone
+    bump(instance.event_id, rebuild_if_missing=False, **{EventStats.STATUS_FIELDS[instance.status]: -1})
+
+def paper_moved(sender, event_id, old, new, **kwargs):
+    bump(event_id, **{EventStats.STATUS_FIELDS[old]: -1, EventStats.STATUS_FIELDS[new]: 1})
+
+def review_saved(sender, instance, created, **kwargs):
+    if created:
+        bump(instance.event_id, **review_deltas(instance, 1))
+    else:
+        # the previous decision and rate are unknown, edits are rare
+        rebuild_event_stats(instance.event_id)
+
+def review_removed(sender, instance, **kwargs):
+    bump(instance.event_id, rebuild_if_missing=False, **review_deltas(instance, -1))
+
+def reviewer_assignment_changed(instance, sign, rebuild_if_missing):
+    event_id = Paper.objects.filter(pk=instance.paper_id).values_list('event_id', flat=True).first()
+    if event_id is not None:
+        # the distinct reviewers are recounted, a user may review several
+        # papers of the event
+        bump(event_id, rebuild_if_missing, values={'reviewers': count_reviewers(event_id)},
+             reviewer_assignments=sign)
+
+def reviewer_added(sender, instance, created, **kwargs):
+    if created:
+        reviewer_assignment_changed(instance, 1, rebuild_if_missing=True)
+
+def reviewer_removed(sender, instance, **kwargs):
+    reviewer_assignment_changed(instance, -1, rebuild_if_missing=False)
+
+
+post_save.connect(event_saved, sender=Event, dispatch_uid="stats_event_saved")
+post_save.connect(paper_added, sender=Paper, dispatch_uid="stats_paper_saved")
+post_delete.connect(paper_removed, sender=Paper, dispatch_uid="stats_paper_deleted")
+paper_status_changed.connect(paper_moved, sender=Paper, dispatch_uid="stats_paper_status_changed")
+post_save.connect(review_saved, sender=Review, dispatch_uid="stats_review_saved")
+post_delete.connect(review_removed, sender=Review, dispatch_uid="stats_review_deleted")
+post_save.connect(reviewer_added, sender=Reviewer, dispatch_uid="stats_reviewer_saved")
+post_delete.connect(reviewer_removed, sender=Reviewer, dispatch_uid="stats_reviewer_deleted")
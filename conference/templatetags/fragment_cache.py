@@ -0,0 +1,49 @@
+from django import template
+
+from conference import fragment_cache
+
+register = template.Library()
+
+
+class CacheFragmentNode(template.Node):
+
+    def __init__(self, nodelist, name, namespaces, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.namespaces = namespaces
+        self.vary_on = vary_on
+
+    def render(self, context):
+        return fragment_cache.get_or_render(
+            self.name.resolve(context),
+            [namespace.resolve(context) for namespace in self.namespaces],
+            lambda: self.nodelist.render(context),
+            [value.resolve(context) for value in self.vary_on],
+        )
+
+
+@register.tag
+def cachefragment(parser, token):
+    """
+    Caches the enclosed fragment until one of its namespaces is bumped::
+
+        {% cachefragment "home_papers" "papers" "events" %} ... {% endcachefragment %}
+        {% cachefragment "event_papers" event|event_namespace vary_on request.user.pk %} ... {% endcachefragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError("%r takes a name and at least one namespace." % bits[0])
+    vary_on = []
+    if 'vary_on' in bits:
+        index = bits.index('vary_on')
+        bits, vary_on = bits[:index], bits[index + 1:]
+    nodelist = parser.parse(('endcachefragment',))
+    parser.delete_first_token()
+    return CacheFragmentNode(nodelist, parser.compile_filter(bits[1]),
+                             [parser.compile_filter(bit) for bit in bits[2:]],
+                             [parser.compile_filter(bit) for bit in vary_on])
+
+
+@register.filter
+def event_namespace(event):
+    return fragment_cache.event_namespace(getattr(event, 'pk', event))
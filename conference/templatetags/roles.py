@@ -0,0 +1,22 @@
+from django import template
+
+from conference.roles import get_roles
+
+register = template.Library()
+
+
+@register.filter
+def is_chair(user, event):
+    return get_roles(user).is_chair(event)
+
+@register.filter
+def is_pc_member(user, event):
+    return get_roles(user).is_pc_member(event)
+
+@register.filter
+def is_reviewer(user, paper):
+    return get_roles(user).is_reviewer(paper)
+
+@register.filter
+def is_author(user, paper):
+    return get_roles(user).is_author(paper)
@@ -1,3 +1,1020 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.client import RequestFactory
+from django.utils.http import http_date
+from django.utils.six import StringIO
+from django.test.utils import CaptureQueriesContext
+from lxml import html
+
+from annotation.models import Annotation, Range
+from conference import archive, fragment_cache, importer, jobs, paper_cache, profiling, rendition, search, stats, writeback
+from conference.roles import get_roles
+from conference.downloads import serve_stream
+from conference.models import Event, EventStats, Job, Paper, Profile, Review, Reviewer, Chair, PC_Member
+from parea.backends.sqlite3.base import DatabaseWrapper as SQLiteWrapper
+
+
+# the cross-request caches are only used with a backend every process shares
+SHARED_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                             'LOCATION': os.path.join(tempfile.gettempdir(), 'parea-test-cache')}}
+
+
+@override_settings(FRAGMENT_CACHE={'TIMEOUT': 0})
+class EventDetailViewTest(TestCase):
+
+    def setUp(self):
+        self.chair = User.objects.create_user("chair", password="secret", is_staff=True)
+        self.event = Event.objects.create(name="Test Event", acronym="TE")
+        Chair.objects.create(user=self.chair, event=self.event)
+        PC_Member.objects.create(user=self.chair, event=self.event)
+        self.client.login(username="chair", password="secret")
+
+    def add_paper(self, n):
+        paper = Paper.objects.create(title="Paper %s" % n, abstract="abstract", event=self.event,
+                                     submited_by=self.chair, paper_file="papers/paper%s.html" % n)
+        for i in range(2):
+            reviewer = User.objects.create_user("reviewer%s_%s" % (n, i))
+            Reviewer.objects.create(user=reviewer, paper=paper)
+            Review.objects.create(paper=paper, event=self.event, reviewer=reviewer, comment="ok")
+        return paper
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.event.get_absolute_url())
+        self.assertEqual(200, response.status_code)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_papers(self):
+        self.add_paper(0)
+        # warm up the role cache
+        self.count_queries()
+        baseline = self.count_queries()
+        for n in range(1, 6):
+            self.add_paper(n)
+        self.assertEqual(baseline, self.count_queries())
+
+    def test_event_page_does_not_write(self):
+        self.add_paper(0)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.event.get_absolute_url())
+        writes = [q['sql'] for q in ctx.captured_queries if not q['sql'].startswith('SELECT')]
+        self.assertEqual([], writes)
+
+
+class ReviewCompletionTrackerTest(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user("author")
+        self.event = Event.objects.create(name="Test Event", acronym="TE")
+        self.paper = Paper.objects.create(title="Paper", abstract="abstract", event=self.event,
+                                          submited_by=self.author, paper_file="papers/paper.html")
+
+    def refresh(self):
+        self.paper.refresh_from_db()
+        self.event.refresh_from_db()
+
+    def review(self, user):
+        return Review.objects.create(paper=self.paper, event=self.event, reviewer=user, comment="ok")
+
+    def test_status_follows_review_counts(self):
+        first, second = User.objects.create_user("first"), User.objects.create_user("second")
+        Reviewer.objects.create(user=first, paper=self.paper)
+        Reviewer.objects.create(user=second, paper=self.paper)
+        self.review(first)
+        self.refresh()
+        self.assertEqual((2, 1), (self.paper.reviewer_count, self.paper.review_count))
+        self.assertEqual(Paper.UNDER_REVIEW, self.paper.status)
+
+        second_review = self.review(second)
+        self.refresh()
+        self.assertEqual(Paper.AWAITING_DECISION, self.paper.status)
+
+        second_review.delete()
+        self.refresh()
+        self.assertEqual(1, self.paper.review_count)
+        self.assertEqual(Paper.UNDER_REVIEW, self.paper.status)
+
+        Reviewer.objects.filter(user=second).delete()
+        self.refresh()
+        self.assertEqual(Paper.AWAITING_DECISION, self.paper.status)
+
+    def test_stale_instance_does_not_overwrite_counters(self):
+        stale = Paper.objects.get(pk=self.paper.pk)
+        Reviewer.objects.create(user=self.author, paper=self.paper)
+        stale.title = "Renamed"
+        stale.save()
+        self.refresh()
+        self.assertEqual(1, self.paper.reviewer_count)
+
+    def test_event_ready_to_be_closed_when_all_papers_locked(self):
+        self.assertFalse(self.event.ready_to_be_closed)
+        self.paper.set_accepted()
+        self.paper.save()
+        self.refresh()
+        self.assertTrue(self.event.ready_to_be_closed)
+
+        Paper.objects.create(title="Other", abstract="abstract", event=self.event,
+                             submited_by=self.author, paper_file="papers/other.html")
+        self.refresh()
+        self.assertFalse(self.event.ready_to_be_closed)
+
+
+class EventStatsTest(TestCase):
+
+    FIELDS = ('under_review', 'awaiting_decision', 'accepted', 'rejected', 'reviews', 'rated_reviews',
+              'rate_sum', 'not_sure', 'accept', 'reject', 'reviewer_assignments', 'reviewers')
+
+    def setUp(self):
+        self.author = User.objects.create_user("author")
+        self.event = Event.objects.create(name="Test Event", acronym="TE")
+        self.papers = [Paper.objects.create(title="Paper %d" % i, abstract="abstract", event=self.event,
+                                            submited_by=self.author, paper_file="papers/%d.html" % i)
+                       for i in range(2)]
+
+    def current(self):
+        row = EventStats.objects.get(event=self.event)
+        return dict((field, getattr(row, field)) for field in self.FIELDS)
+
+    def assertMatchesRebuild(self):
+        current = self.current()
+        self.assertEqual(current, dict((field, getattr(stats.rebuild_event_stats(self.event.pk), field))
+                                       for field in self.FIELDS))
+        return current
+
+    def test_incremental_updates_match_rebuild(self):
+        first, second = User.objects.create_user("first"), User.objects.create_user("second")
+        for paper in self.papers:
+            Reviewer.objects.create(user=first, paper=paper)
+        Reviewer.objects.create(user=second, paper=self.papers[0])
+        current = self.assertMatchesRebuild()
+        self.assertEqual((2, 3, 2), (current['under_review'], current['reviewer_assignments'],
+                                     current['reviewers']))
+
+        Review.objects.create(paper=self.papers[1], event=self.event, reviewer=first, comment="ok",
+                              decision=Review.ACCEPT, rate=Review.STAR4)
+        review = Review.objects.create(paper=self.papers[0], event=self.event, reviewer=first,
+                                       comment="ok", decision=Review.REJECT, rate=Review.NONE)
+        current = self.assertMatchesRebuild()
+        self.assertEqual((1, 1, 2, 1, 4), (current['under_review'], current['awaiting_decision'],
+                                           current['reviews'], current['rated_reviews'], current['rate_sum']))
+
+        paper = Paper.objects.get(pk=self.papers[1].pk)
+        paper.set_accepted()
+        paper.save()
+        review.rate = Review.STAR2
+        review.save()
+        Reviewer.objects.filter(user=first, paper=self.papers[0]).delete()
+        current = self.assertMatchesRebuild()
+        self.assertEqual((1, 2, 2), (current['accepted'], current['reviewer_assignments'], current['reviewers']))
+
+        self.papers[0].delete()
+        current = self.assertMatchesRebuild()
+        self.assertEqual((0, 0, 1, 1), (current['under_review'], current['awaiting_decision'],
+                                        current['accepted'], current['reviews']))
+
+    def test_event_pages_read_stats_without_aggregating(self):
+        cache.clear()
+        staff = User.objects.create_user("staff", password="secret", is_staff=True)
+        self.client.login(username="staff", password="secret")
+        url = reverse("event_detail", kwargs={"pk": self.event.pk, "slug": self.event.slug})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertContains(response, "for 0 reviewers")
+        self.assertFalse([q for q in queries if "conference_review" in q["sql"] and "COUNT" in q["sql"]])
+        self.assertContains(self.client.get(reverse("home")), "2 papers, 0 reviews")
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class FragmentCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        fragment_cache.reset_counters()
+        self.chair = User.objects.create_user("chair", password="secret")
+        self.user = User.objects.create_user("user", password="secret")
+        self.event = Event.objects.create(name="Test Event", acronym="TE")
+        Chair.objects.create(user=self.chair, event=self.event)
+        self.add_paper("First")
+
+    def add_paper(self, title):
+        return Paper.objects.create(title=title, abstract="abstract", event=self.event,
+                                    submited_by=self.chair, paper_file="papers/%s.html" % title)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        return response, len(queries)
+
+    def test_home_listings_are_cached_until_a_model_changes(self):
+        self.client.login(username="user", password="secret")
+        first, misses = self.get(reverse("home"))
+        second, hits = self.get(reverse("home"))
+        self.assertLess(hits, misses)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual({'hits': 1, 'misses': 1}, fragment_cache.counters()['home_papers'])
+
+        self.add_paper("Second")
+        response, _ = self.get(reverse("home"))
+        self.assertContains(response, "Second")
+        self.assertContains(response, "2 papers, 0 reviews")
+
+    def test_event_papers_table_is_cached_per_user(self):
+        url = self.event.get_absolute_url()
+        self.client.login(username="chair", password="secret")
+        self.assertContains(self.get(url)[0], "Waiting for Reviews")
+        self.client.login(username="user", password="secret")
+        self.assertNotContains(self.get(url)[0], "Waiting for Reviews")
+        self.assertEqual({'hits': 0, 'misses': 2}, fragment_cache.counters()['event_papers'])
+
+        PC_Member.objects.create(user=self.user, event=self.event)
+        Review.objects.create(paper=Paper.objects.get(), event=self.event, reviewer=self.chair,
+                              comment="ok", decision=Review.ACCEPT)
+        self.assertContains(self.get(url)[0], "Accept by")
+
+        # reviewers are listed by username
+        Reviewer.objects.create(user=self.chair, paper=Paper.objects.get())
+        self.assertContains(self.get(url)[0], "<p>chair </p>")
+        self.chair.username = "renamed"
+        self.chair.save()
+        self.assertContains(self.get(url)[0], "<p>renamed </p>")
+
+    def test_logins_keep_the_fragments(self):
+        self.client.login(username="user", password="secret")
+        self.get(reverse("home"))
+        self.client.login(username="user", password="secret")
+        self.get(reverse("home"))
+        self.assertEqual({'hits': 1, 'misses': 1}, fragment_cache.counters()['home_papers'])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_process_local_cache_is_not_used(self):
+        self.client.login(username="user", password="secret")
+        self.get(reverse("home"))
+        self.get(reverse("home"))
+        self.assertNotIn('home_papers', fragment_cache.counters())
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class UserLookupTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user("staff", password="secret", is_staff=True)
+        self.event = Event.objects.create(name="Test Event", acronym="TE")
+        for username, first_name, last_name in (("alice", "Alice", "Smith"), ("bob", "Robert", "Alison"),
+                                                ("carol", "Carol", "Jones"), ("alfred", "Fred", "Doe")):
+            user = User.objects.create_user(username)
+            Profile.objects.filter(user=user).update(first_name=first_name, last_name=last_name)
+        self.client.login(username="staff", password="secret")
+
+    def lookup(self, **params):
+        response = self.client.get(reverse("user_lookup"), params)
+        self.assertEqual(200, response.status_code)
+        return json.loads(response.content.decode("utf-8"))
+
+    def usernames(self, data):
+        return [user["username"] for user in data["results"]]
+
+    def test_prefix_search_over_username_and_names(self):
+        self.assertEqual(["alfred", "alice", "bob"], self.usernames(self.lookup(q="AL")))
+        self.assertEqual(["bob"], self.usernames(self.lookup(q="rob")))
+        self.assertEqual({"id": User.objects.get(username="carol").pk, "username": "carol",
+                          "first_name": "Carol", "last_name": "Jones"}, self.lookup(q="jon")["results"][0])
+
+    def test_keyset_pages(self):
+        first = self.lookup(q="al", limit=2)
+        self.assertEqual(["alfred", "alice"], self.usernames(first))
+        second = self.lookup(q="al", limit=2, cursor=first["next"])
+        self.assertEqual(["bob"], self.usernames(second))
+        self.assertIsNone(second["next"])
+        self.assertEqual(400, self.client.get(reverse("user_lookup"), {"cursor": "%%%"}).status_code)
+
+    def test_restricted_to_event_pc_members(self):
+        PC_Member.objects.create(user=User.objects.get(username="alice"), event=self.event)
+        self.assertEqual(["alice"], self.usernames(self.lookup(q="al", event=self.event.pk)))
+        self.assertEqual(["alice"], self.usernames(self.lookup(event=self.event.pk)))
+
+    def test_reviewers_of_the_paper_are_left_out(self):
+        paper = Paper.objects.create(title="Paper", abstract="abstract", event=self.event,
+                                     submited_by=self.staff, paper_file="papers/paper.html")
+        self.assertEqual(["alfred", "alice", "bob"], self.usernames(self.lookup(q="al", paper=paper.pk)))
+        Reviewer.objects.create(user=User.objects.get(username="alice"), paper=paper)
+        self.assertEqual(["alfred", "bob"], self.usernames(self.lookup(q="al", paper=paper.pk)))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_process_local_cache_is_not_used(self):
+        self.lookup(q="car")
+        with CaptureQueriesContext(connection) as queries:
+            self.lookup(q="car")
+        self.assertTrue([q for q in queries if "auth_user" in q["sql"] and "LIKE" in q["sql"]])
+
+    def test_results_are_cached_until_profiles_change(self):
+        self.lookup(q="car")
+        with CaptureQueriesContext(connection) as queries:
+            self.lookup(q="car")
+        self.assertFalse([q for q in queries if "auth_user" in q["sql"] and "LIKE" in q["sql"]])
+        profile = Profile.objects.get(user__username="carol")
+        profile.first_name = "Caroline"
+        profile.save()
+        self.assertEqual("Caroline", self.lookup(q="car")["results"][0]["first_name"])
+
+    def test_event_page_does_not_embed_users(self):
+        response = self.client.get(self.event.get_absolute_url())
+        self.assertContains(response, 'class="user-lookup"')
+        self.assertNotContains(response, "carol")
+
+
+class PaperCacheTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "paper.html")
+        paper_cache.get_backend().clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, text, mtime):
+        with open(self.path, 'w') as f:
+            f.write("<html><body><p>%s</p></body></html>" % text)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_rewritten_file_invalidates_entry(self):
+        self.write("first", 1000)
+        self.assertIn(b"first", paper_cache.get_body(1, self.path))
+        self.write("second", 2000)
+        self.assertIn(b"second", paper_cache.get_body(1, self.path))
+
+    def test_django_backend_only_clears_paper_bodies(self):
+        backend = paper_cache.DjangoCacheBackend('default', None)
+        cache.set("roles:1", "chair")
+        backend.set("paper-body:1", b"<body/>")
+        self.assertEqual(b"<body/>", backend.get("paper-body:1"))
+        backend.clear()
+        self.assertIsNone(backend.get("paper-body:1"))
+        self.assertEqual("chair", cache.get("roles:1"))
+        backend.set("paper-body:1", b"<body>new</body>")
+        self.assertEqual(b"<body>new</body>", backend.get("paper-body:1"))
+
+    def test_lru_evicts_to_byte_budget(self):
+        cache = paper_cache.LRUByteCache(max_bytes=10)
+        cache.set("a", "12345")
+        cache.set("b", "12345")
+        cache.get("a")
+        cache.set("c", "12345")
+        self.assertEqual("12345", cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(10, cache.size)
+
+
+class RenditionTest(TestCase):
+
+    PAPER = ("<html><head><title>A  Paper</title><script>alert(1)</script></head><body>"
+             "<section role=\"doc-abstract\"><h1>Abstract</h1><p onclick=\"steal()\">Some words here.</p></section>"
+             "<section><p>More <a href=\"javascript:steal()\">text</a>.</p><script>steal()</script>"
+             "<iframe src=\"http://example.com\"></iframe></section></body></html>")
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "paper.html")
+        with open(self.path, "w") as f:
+            f.write(self.PAPER)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_body_is_sanitized_and_described(self):
+        meta = rendition.build_rendition(self.path)
+        self.assertEqual({"title": "A Paper", "sections": 2, "words": 6},
+                         dict((key, meta[key]) for key in ("title", "sections", "words")))
+        body, _ = rendition.get_rendition(self.path)
+        for unsafe in (b"script", b"onclick", b"javascript:", b"iframe"):
+            self.assertNotIn(unsafe, body)
+        self.assertIn(b'role="doc-abstract"', body)
+
+    def test_utf8_without_charset_declaration(self):
+        with io.open(self.path, "w", encoding="utf-8") as f:
+            f.write(u"<html><head><title>Caf\u00e9</title></head><body><p>na\u00efve r\u00e9sum\u00e9</p></body></html>")
+        meta = rendition.build_rendition(self.path)
+        self.assertEqual(u"Caf\u00e9", meta["title"])
+        self.assertIn(u"na\u00efve r\u00e9sum\u00e9".encode("utf-8"), rendition.get_rendition(self.path)[0])
+
+    def test_gzip_rendition_and_staleness(self):
+        rendition.build_rendition(self.path, compressed=True)
+        self.assertTrue(os.path.exists(self.path + ".rendition.html.gz"))
+        self.assertIn(b"Some words here.", rendition.get_rendition(self.path)[0])
+
+        with open(self.path, "w") as f:
+            f.write("<html><body><p>Rewritten</p></body></html>")
+        os.utime(self.path, (1000, 1000))
+        self.assertFalse(rendition.is_fresh(self.path))
+        self.assertIn(b"Rewritten", rendition.get_rendition(self.path)[0])
+        self.assertTrue(rendition.is_fresh(self.path))
+
+
+class WriteBackTest(TestCase):
+
+    PAPER = ("<html><head><title>Paper</title></head><body><section><h1>Intro</h1>"
+             "<p>Hello <em>big</em> world <!-- note --> and more.</p><p>Second paragraph</p></section></body></html>")
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+        os.mkdir(os.path.join(self.media_root, "papers"))
+        self.path = os.path.join(self.media_root, "papers", "paper.html")
+        with open(self.path, "w") as f:
+            f.write(self.PAPER)
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def annotation(self, id, *ranges):
+        return {'id': id, 'quote': "", 'text': "comment %s" % id, 'user': "reviewer", 'ranges': list(ranges)}
+
+    def written(self):
+        with open(writeback.output_path(self.path), "rb") as f:
+            return f.read()
+
+    def test_overlapping_ranges_across_inline_elements(self):
+        annotations = [
+            self.annotation("a1", ("/section[1]/p[1]", 3, "/section[1]/p[1]", 12)),
+            self.annotation("a2", ("/section[1]/p[1]/em[1]", 0, "/section[1]/p[2]", 6),
+                            ("/section[1]/p[9]", 0, "/section[1]/p[9]", 1)),
+        ]
+        self.assertEqual((2, 1), writeback.write_back(self.path, annotations, "Accepted", []))
+        paper = self.written()
+        # the comment isn't part of the rendition the ranges were recorded on
+        self.assertIn(b'Hel<span class="parea-annotation" data-annotation-ids="a1">lo </span>'
+                      b'<em><span class="parea-annotation" data-annotation-ids="a1 a2">big</span></em>'
+                      b'<span class="parea-annotation" data-annotation-ids="a1 a2"> wo</span>'
+                      b'<span class="parea-annotation" data-annotation-ids="a2">rld  and more.</span>', paper)
+        self.assertIn(b'<p><span class="parea-annotation" data-annotation-ids="a2">Second</span> paragraph</p>', paper)
+        self.assertIn(b'<section id="parea-annotations">', paper)
+        self.assertIn(b"Decision: Accepted", paper)
+
+    def test_utf8_paper_is_not_double_encoded(self):
+        with io.open(self.path, "w", encoding="utf-8") as f:
+            f.write(u"<html><body><section><p>Caf\u00e9 cr\u00e8me</p></section></body></html>")
+        annotations = [self.annotation("a1", ("/section[1]/p[1]", 0, "/section[1]/p[1]", 4))]
+        self.assertEqual((1, 0), writeback.write_back(self.path, annotations, "Accepted", []))
+        self.assertIn(u'data-annotation-ids="a1">Caf\u00e9</span> cr\u00e8me'.encode("utf-8"), self.written())
+
+    def test_ranges_resolve_against_the_rendition(self):
+        with open(self.path, "w") as f:
+            f.write("<html><body><script>track()</script><form><p>Sign up</p><input name=q></form>"
+                    "<iframe src=x></iframe><section><p>Results</p></section></body></html>")
+        body = html.fromstring(rendition.get_rendition(self.path)[0])
+        self.assertEqual("Results", body.xpath("./section[1]/p[1]")[0].text)
+        annotations = [self.annotation("a1", ("/section[1]/p[1]", 0, "/section[1]/p[1]", 7))]
+        self.assertEqual((1, 0), writeback.write_back(self.path, annotations, "Accepted", []))
+        self.assertIn(b'data-annotation-ids="a1">Results</span>', self.written())
+        self.assertNotIn(b"track()", self.written())
+
+    def test_paper_file_is_left_alone(self):
+        annotations = [self.annotation("a1", ("/section[1]/p[2]", 0, "/section[1]/p[2]", 6))]
+        writeback.write_back(self.path, annotations, "Accepted", [])
+        first = self.written()
+        with open(self.path) as f:
+            self.assertEqual(self.PAPER, f.read())
+        writeback.write_back(self.path, annotations, "Accepted", [])
+        self.assertEqual(first, self.written())
+        self.assertEqual(1, first.count(b'id="parea-reviews"'))
+
+    def test_event_papers_are_written_back(self):
+        user = User.objects.create_user("reviewer")
+        event = Event.objects.create(name="Test Event", acronym="TE")
+        paper = Paper.objects.create(title="Paper", abstract="abstract", event=event, submited_by=user,
+                                     paper_file="papers/paper.html")
+        Review.objects.create(paper=paper, event=event, reviewer=user, comment="Well written")
+        uri = "http://example.com" + reverse("paper_review", kwargs={"pk": paper.pk})
+        annotation = Annotation.objects.create(uri=uri, user_id=user.pk,
+                                               user_username="reviewer", quote="Second", text="Why?")
+        Range.objects.create(annotation=annotation, start="/section[1]/p[2]", startOffset=0,
+                             end="/section[1]/p[2]", endOffset=6)
+        progress = []
+        results = writeback.write_back_event(event, workers=1, progress=lambda *args: progress.append(args))
+        self.assertEqual({self.path: (1, 0)}, results)
+        self.assertEqual([(1, 1)], progress)
+        paper = self.written()
+        for text in (b'data-annotation-ids="%s"' % str(annotation.pk).encode("ascii"), b"Why?", b"Well written"):
+            self.assertIn(text, paper)
+
+
+class SearchTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+        os.mkdir(os.path.join(self.media_root, "papers"))
+        with open(os.path.join(self.media_root, "papers", "paper.html"), "w") as f:
+            f.write("<html><body><section><p>Crystallography of zeolite frameworks.</p></section></body></html>")
+        self.chair = User.objects.create_user("chair", password="secret")
+        self.author = User.objects.create_user("author", password="secret")
+        self.event = Event.objects.create(name="Test Event", acronym="TE")
+        Chair.objects.create(user=self.chair, event=self.event)
+        self.paper = Paper.objects.create(title="Zeolite synthesis", abstract="Porous minerals", event=self.event,
+                                          submited_by=self.author, slug="zeolite", paper_file="papers/paper.html")
+        self.other = Paper.objects.create(title="Graph drawing", abstract="About zeolite graphs", event=self.event,
+                                          submited_by=self.author, slug="graphs", paper_file="papers/missing.html")
+        self.review = Review.objects.create(paper=self.paper, event=self.event, reviewer=self.chair,
+                                            comment="The <b>methodology</b> is sound")
+        self.run_jobs()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def run_jobs(self):
+        while jobs.run_next():
+            pass
+
+    def hits(self, query, **kwargs):
+        return [(hit['kind'], hit['paper_id']) for hit in search.search(query, **kwargs)]
+
+    def test_ranking_covers_every_kind(self):
+        self.assertEqual((search.PAPER, self.paper.pk), self.hits("zeolite")[0])
+        self.assertEqual(set([(search.PAPER, self.paper.pk), (search.PAPER, self.other.pk),
+                              (search.PAPER_TEXT, self.paper.pk)]), set(self.hits("zeolite")))
+        self.assertEqual([(search.PAPER_TEXT, self.paper.pk)], self.hits("crystallography frameworks"))
+        annotation = Annotation.objects.create(
+            uri="http://example.com" + reverse("paper_review", kwargs={"pk": self.paper.pk}),
+            user_id=self.chair.pk, quote="zeolite frameworks", text="Cite the atlas")
+        self.assertEqual([(search.ANNOTATION, self.paper.pk)], self.hits("atlas"))
+        annotation.delete()
+        self.assertEqual([], self.hits("atlas"))
+
+    def test_index_follows_changes(self):
+        self.review.comment = "Needs more experiments"
+        self.review.save()
+        self.assertEqual([], self.hits("methodology"))
+        self.assertEqual([(search.REVIEW, self.paper.pk)], self.hits("experiment"))
+        self.review.delete()
+        self.assertEqual([], self.hits("experiments"))
+        self.other.delete()
+        self.assertEqual([(search.PAPER, self.paper.pk), (search.PAPER_TEXT, self.paper.pk)],
+                         sorted(self.hits("zeolite")))
+
+    def test_new_paper_file_is_reindexed(self):
+        with open(os.path.join(self.media_root, "papers", "revised.html"), "w") as f:
+            f.write("<html><body><p>Mesoporous silica \xc3\xa9tudes</p></body></html>")
+        self.paper.title = "Zeolite synthesis, revised"
+        self.paper.save()
+        self.assertFalse(Job.objects.filter(kind='index_paper_text', status=Job.QUEUED).exists())
+        self.paper = Paper.objects.get(pk=self.paper.pk)
+        self.paper.paper_file = "papers/revised.html"
+        self.paper.save()
+        self.assertEqual([(search.PAPER_TEXT, self.paper.pk)], self.hits("crystallography"))
+        self.run_jobs()
+        self.assertEqual([], self.hits("crystallography"))
+        self.assertEqual([(search.PAPER_TEXT, self.paper.pk)], self.hits("mesoporous"))
+        hit, = search.search("mesoporous")
+        self.assertIn(u"\xe9tudes", hit['snippet'])
+
+    def test_without_fts5(self):
+        self.assertTrue(search.has_fts5())
+        search._fts5[connection.alias] = False
+        try:
+            self.assertFalse(search.supported())
+            Paper.objects.create(title="Zeolite catalysis", event=self.event, submited_by=self.author,
+                                 slug="catalysis", paper_file="papers/paper.html")
+            self.assertEqual([], search.search("zeolite"))
+            self.assertFalse(Job.objects.filter(kind='index_paper_text').exclude(status=Job.DONE).exists())
+        finally:
+            search._fts5[connection.alias] = True
+
+    def test_snippets_are_escaped_and_highlighted(self):
+        hit, = search.search("methodology")
+        self.assertIn("&lt;b&gt;<mark>methodology</mark>&lt;/b&gt;", hit['snippet'])
+        self.assertEqual([], search.search('" OR *'))
+
+    def test_reviews_only_shown_to_chairs(self):
+        self.assertEqual([], self.hits("methodology", chair_events=set()))
+        self.assertEqual(1, len(self.hits("methodology", chair_events=set([self.event.pk]))))
+        self.client.login(username="author", password="secret")
+        response = self.client.get(reverse("full_text_search"), {"q": "zeolite methodology"})
+        self.assertContains(response, "Nothing found")
+        response = self.client.get(reverse("full_text_search"), {"q": "porous"})
+        self.assertContains(response, "<mark>Porous</mark>")
+        self.client.login(username="chair", password="secret")
+        self.assertContains(self.client.get(reverse("full_text_search"), {"q": "methodology"}), "Review")
+
+
+class ServeStreamTest(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.content = b"0123456789" * 10000
+        self.mtime = 1000000000
+
+    def read(self, start, end):
+        yield self.content[start:end + 1]
+
+    def get(self, **headers):
+        return serve_stream(self.factory.get("/", **headers), self.read, len(self.content), self.mtime,
+                            "application/tar")
+
+    def test_streams_everything(self):
+        response = self.get()
+        self.assertTrue(response.streaming)
+        self.assertEqual("100000", response["Content-Length"])
+        self.assertEqual(self.content, b"".join(response.streaming_content))
+
+    def test_range(self):
+        response = self.get(HTTP_RANGE="bytes=5-14")
+        self.assertEqual(206, response.status_code)
+        self.assertEqual("bytes 5-14/100000", response["Content-Range"])
+        self.assertEqual(b"5678901234", b"".join(response.streaming_content))
+
+        response = self.get(HTTP_RANGE="bytes=-3")
+        self.assertEqual(b"789", b"".join(response.streaming_content))
+
+        response = self.get(HTTP_RANGE="bytes=200000-")
+        self.assertEqual(416, response.status_code)
+
+    def test_if_range(self):
+        response = self.get(HTTP_RANGE="bytes=5-14", HTTP_IF_RANGE=http_date(self.mtime))
+        self.assertEqual(206, response.status_code)
+        response = self.get(HTTP_RANGE="bytes=5-14", HTTP_IF_RANGE=http_date(self.mtime - 10))
+        self.assertEqual(200, response.status_code)
+
+    def test_not_modified(self):
+        response = self.get(HTTP_IF_MODIFIED_SINCE=http_date(self.mtime + 10))
+        self.assertEqual(304, response.status_code)
+
+
+class EventArchiveTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+        os.makedirs(os.path.join(self.media_root, "papers"))
+        self.author = User.objects.create_user("author")
+        self.event = Event.objects.create(name="Test Event", acronym="TE")
+        self.papers = []
+        for n in range(2):
+            with open(os.path.join(self.media_root, "papers", "paper%d.html" % n), 'w') as f:
+                f.write("<html><body><p>paper %d</p></body></html>" % n)
+            self.papers.append(Paper.objects.create(title="Paper %d" % n, abstract="abstract", event=self.event,
+                                                    submited_by=self.author, paper_file="papers/paper%d.html" % n))
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_rebuild_only_repacks_changed_papers(self):
+        self.assertEqual(2, archive.build_event_archive(self.event)['packed'])
+        self.assertEqual(0, archive.build_event_archive(self.event)['packed'])
+        Review.objects.create(paper=self.papers[1], event=self.event, reviewer=self.author, comment="ok")
+        manifest = archive.build_event_archive(self.event)
+        self.assertEqual(1, manifest['packed'])
+        self.assertEqual(2, len(os.listdir(archive.segment_dir(self.event))) - 1)
+
+    def test_stream_is_a_valid_tar(self):
+        manifest = archive.build_event_archive(self.event)
+        data = b"".join(archive.stream_event_archive(self.event, manifest))
+        self.assertEqual(archive.archive_size(self.event, manifest), len(data))
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            names = tar.getnames()
+            paper = tar.extractfile("TE/papers/%d/paper0.html" % self.papers[0].pk).read()
+        self.assertIn("TE/event.json", names)
+        self.assertIn("TE/papers/%d/reviews.json" % self.papers[1].pk, names)
+        self.assertIn(b"paper 0", paper)
+        # the paper files aren't copied into the segments
+        self.assertLessEqual(manifest['papers'][str(self.papers[0].pk)]['segment_size'], 4 * tarfile.BLOCKSIZE)
+
+    def test_any_range_of_the_stream(self):
+        manifest = archive.build_event_archive(self.event)
+        data = b"".join(archive.stream_event_archive(self.event, manifest))
+        for start, end in ((0, 0), (511, 1024), (700, len(data) - 1), (len(data) - 1, len(data) - 1)):
+            self.assertEqual(data[start:end + 1],
+                             b"".join(archive.stream_event_archive(self.event, manifest, start, end)))
+
+    def test_written_back_copy_is_archived(self):
+        writeback.write_back_event(self.event, workers=1)
+        manifest = archive.build_event_archive(self.event)
+        data = b"".join(archive.stream_event_archive(self.event, manifest))
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            paper = tar.extractfile("TE/papers/%d/paper0.html.annotated.html" % self.papers[0].pk).read()
+        self.assertIn(b'id="parea-reviews"', paper)
+
+    def test_changed_paper_file_makes_the_manifest_stale(self):
+        manifest = archive.build_event_archive(self.event)
+        self.assertTrue(archive.is_current(self.event, manifest))
+        with open(self.papers[0].paper_file.path, 'a') as f:
+            f.write("more")
+        self.assertFalse(archive.is_current(self.event, manifest))
+
+
+class JobQueueTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root, JOB_RETRY_DELAY=60)
+        self.settings.enable()
+        self.chair = User.objects.create_user("chair", password="secret")
+        self.event = Event.objects.create(name="Test Event", acronym="TE")
+        Chair.objects.create(user=self.chair, event=self.event)
+        self.calls = []
+
+        @jobs.handler('test_flaky')
+        def flaky(job, fail):
+            self.calls.append(job.pk)
+            job.report(50, "halfway")
+            if fail:
+                raise RuntimeError("boom")
+
+    def tearDown(self):
+        jobs.HANDLERS.pop('test_flaky')
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_idempotency_key_returns_pending_job(self):
+        first = jobs.enqueue('test_flaky', key="k", fail=False)
+        self.assertEqual(first.pk, jobs.enqueue('test_flaky', key="k", fail=False).pk)
+        self.assertEqual(first.pk, jobs.run_next())
+        job = Job.objects.get(pk=first.pk)
+        self.assertEqual((Job.DONE, 100, "halfway"), (job.status, job.progress, job.message))
+        self.assertIsNone(jobs.run_next())
+        self.assertNotEqual(first.pk, jobs.enqueue('test_flaky', key="k", fail=False).pk)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        job = jobs.enqueue('test_flaky', key="k", max_attempts=2, fail=True)
+        jobs.run_next()
+        job.refresh_from_db()
+        self.assertEqual((Job.QUEUED, 1), (job.status, job.attempts))
+        self.assertIn("RuntimeError: boom", job.error)
+        self.assertIsNone(jobs.run_next())
+
+        Job.objects.filter(pk=job.pk).update(run_after=job.created)
+        jobs.run_next()
+        job.refresh_from_db()
+        self.assertEqual((Job.FAILED, 2, None), (job.status, job.attempts, job.active_key))
+        self.assertEqual([job.pk, job.pk], self.calls)
+
+    def test_stale_running_job_is_requeued(self):
+        job = jobs.enqueue('test_flaky', fail=False)
+        self.assertEqual(job.pk, jobs.claim())
+        Job.objects.filter(pk=job.pk).update(heartbeat=job.created - timedelta(hours=1))
+        self.assertEqual(1, jobs.requeue_stale())
+        job.refresh_from_db()
+        self.assertEqual((Job.QUEUED, 1), (job.status, job.attempts))
+        Job.objects.filter(pk=job.pk).update(run_after=job.created)
+        self.assertEqual(job.pk, jobs.run_next())
+
+    def test_heartbeat_keeps_a_quiet_job_running(self):
+        job = jobs.enqueue('test_flaky', fail=False)
+        jobs.claim()
+        Job.objects.filter(pk=job.pk).update(heartbeat=job.created - timedelta(hours=1))
+        jobs.heartbeat([job.pk])
+        self.assertEqual(0, jobs.requeue_stale())
+        self.assertEqual(Job.RUNNING, Job.objects.get(pk=job.pk).status)
+
+    def test_job_killing_its_worker_fails_after_max_attempts(self):
+        job = jobs.enqueue('test_flaky', key="k", max_attempts=2, fail=False)
+        for status in (Job.QUEUED, Job.FAILED):
+            Job.objects.filter(pk=job.pk).update(run_after=job.created)
+            self.assertEqual(job.pk, jobs.claim())
+            self.assertEqual(status, jobs.process_exited(job.pk, -9))
+        job.refresh_from_db()
+        self.assertEqual((Job.FAILED, 2, None), (job.status, job.attempts, job.active_key))
+        self.assertIn("-9", job.error)
+        # a job that recorded its own outcome is left alone
+        self.assertIsNone(jobs.process_exited(job.pk, 0))
+
+    def test_closing_an_event_queues_the_work(self):
+        self.client.login(username="chair", password="secret")
+        response = self.client.get(reverse("event_close", kwargs={"pk": self.event.pk}))
+        self.assertEqual(302, response.status_code)
+        self.assertFalse(os.path.exists(archive.manifest_path(self.event)))
+        self.assertContains(self.client.get(self.event.get_absolute_url()), "Queued")
+
+        jobs.run_next()
+        job = Job.objects.get(event=self.event)
+        self.assertEqual((Job.DONE, 100), (job.status, job.progress))
+        self.assertTrue(os.path.exists(archive.manifest_path(self.event)))
+        self.assertContains(self.client.get(self.event.get_absolute_url()), "Done")
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ImporterTest(TestCase):
+
+    def test_iter_json_small_chunks(self):
+        document = u'{"a <a@x.com>": {"n": 1}, "b <b@x.com>": [1, 22, 333], "c": 4444}'
+        self.assertEqual([("a <a@x.com>", {"n": 1}), ("b <b@x.com>", [1, 22, 333]), ("c", 4444)],
+                         list(importer.iter_json(io.StringIO(document), chunk_size=3)))
+        self.assertEqual([1, {"x": "]"}], list(importer.iter_json(io.StringIO(u' [1, {"x": "]"}] '), 2)))
+
+    def test_import_is_idempotent(self):
+        for _ in range(2):
+            importer.Importer(batch_size=3).import_users(importer.default_path("users"))
+            importer.Importer(batch_size=1).import_events(importer.default_path("events"))
+        jessica = User.objects.get(email="jessica.jones@alias.com")
+        self.assertEqual(Profile.FEMALE, jessica.profile.sex)
+        self.assertTrue(jessica.check_password("jessica.jones"))
+        self.assertEqual(2, Event.objects.count())
+        self.assertEqual(1, Chair.objects.filter(user=jessica).count())
+        paper = Paper.objects.get(paper_file="papers/wade-savesd2016.html")
+        self.assertEqual(2, paper.reviewer_count)
+        self.assertEqual(paper.reviewer_count, paper.reviewers.count())
+        self.assertEqual(User.objects.count(), Profile.objects.count())
+
+    def test_truncated_usernames_are_unique(self):
+        local = "a" * 40
+        User.objects.create_user(local[:30])
+        emails = [local + "@one.example.com", local + "@two.example.com", local + "@three.example.com"]
+        users = importer.Importer().resolve_users([("Some One", email, {}) for email in emails])
+        self.assertEqual(["a" * 28 + "-2", "a" * 28 + "-3", "a" * 28 + "-4"],
+                         [users[email].username for email in emails])
+
+
+@override_settings(ROLE_CACHE_TIMEOUT=300, CACHES=SHARED_CACHES)
+class RolesTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("member")
+        self.event = Event.objects.create(name="Test Event", acronym="TE")
+        self.paper = Paper.objects.create(title="Paper", abstract="abstract", event=self.event,
+                                          submited_by=self.user, paper_file="papers/paper.html")
+        Chair.objects.create(user=self.user, event=self.event)
+        cache.clear()
+
+    def test_one_query_per_request(self):
+        with self.assertNumQueries(2):
+            roles = get_roles(User.objects.get(pk=self.user.pk))
+            self.assertTrue(roles.is_chair(self.event))
+            self.assertFalse(roles.is_pc_member(self.event))
+            self.assertFalse(roles.is_reviewer(self.paper))
+        with self.assertNumQueries(1):
+            # the next request only loads the user, roles come from the cache
+            self.assertTrue(get_roles(User.objects.get(pk=self.user.pk)).is_chair(self.event.pk))
+
+    def test_membership_change_invalidates_cache(self):
+        self.assertFalse(get_roles(User.objects.get(pk=self.user.pk)).is_reviewer(self.paper))
+        Reviewer.objects.create(user=self.user, paper=self.paper)
+        self.assertTrue(get_roles(User.objects.get(pk=self.user.pk)).is_reviewer(self.paper))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_process_local_cache_is_not_used(self):
+        get_roles(User.objects.get(pk=self.user.pk)).is_chair(self.event)
+        with self.assertNumQueries(2):
+            self.assertTrue(get_roles(User.objects.get(pk=self.user.pk)).is_chair(self.event))
+
+
+class MembershipViewsTest(TestCase):
+
+    def setUp(self):
+        self.chair = User.objects.create_user("chair", password="secret", is_staff=True)
+        self.member = User.objects.create_user("member")
+        self.event = Event.objects.create(name="Test Event", acronym="TE")
+        self.paper = Paper.objects.create(title="Paper", abstract="abstract", event=self.event,
+                                          submited_by=self.chair, paper_file="papers/paper.html")
+        Chair.objects.create(user=self.chair, event=self.event)
+        cache.clear()
+        self.client.login(username="chair", password="secret")
+
+    def picked(self, name, pk, **params):
+        # the URL user_lookup.js builds from a lookup result
+        user, = json.loads(self.client.get(reverse("user_lookup"), params).content.decode("utf-8"))["results"]
+        return reverse(name, kwargs={"pk": pk, "user_id": 0}).replace("/0/", "/%d/" % user["id"])
+
+    def test_add_and_remove_are_idempotent(self):
+        # profiles bulk created by the importer don't share the pk of their user
+        Profile.objects.filter(user=self.member).update(id=self.member.pk + 100)
+        add = self.picked("add_reviewer", self.paper.pk, q="member")
+        remove = reverse("remove_reviewer", kwargs={"pk": self.paper.pk, "user_id": self.member.pk})
+        for _ in range(2):
+            self.assertEqual(302, self.client.get(add).status_code)
+        self.assertEqual(1, Reviewer.objects.filter(paper=self.paper, user=self.member).count())
+        self.assertEqual(1, Paper.objects.get(pk=self.paper.pk).reviewer_count)
+        for _ in range(2):
+            self.assertEqual(302, self.client.get(remove).status_code)
+        self.assertFalse(Reviewer.objects.filter(paper=self.paper).exists())
+        self.assertEqual(0, Paper.objects.get(pk=self.paper.pk).reviewer_count)
+
+        add = self.picked("add_pc_member", self.event.pk, q="member")
+        for _ in range(2):
+            self.client.get(add)
+        self.assertEqual(1, PC_Member.objects.filter(event=self.event, user=self.member).count())
+
+
+class SQLiteBackendTest(SimpleTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "db.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def connect(self):
+        settings_dict = dict(connection.settings_dict, ENGINE="parea.backends.sqlite3", NAME=self.path,
+                             OPTIONS={"timeout": 0})
+        return SQLiteWrapper(settings_dict, alias="sqlite_backend_test")
+
+    def test_wal_and_immediate_transactions(self):
+        writer, other = self.connect(), self.connect()
+        try:
+            with writer.cursor() as cursor:
+                cursor.execute("PRAGMA journal_mode")
+                self.assertEqual("wal", cursor.fetchone()[0])
+            writer._start_transaction_under_autocommit()
+            # the write lock is taken when the transaction starts
+            with self.assertRaises(OperationalError):
+                other._start_transaction_under_autocommit()
+            with other.cursor() as cursor:
+                cursor.execute("SELECT 1")
+        finally:
+            writer.close()
+            other.close()
+
+
+class ProfilingTest(TestCase):
+
+    def setUp(self):
+        profiling.reset()
+        self.staff = User.objects.create_user("staff", password="secret", is_staff=True)
+        self.user = User.objects.create_user("user", password="secret")
+
+    def test_requests_are_profiled_per_url_name(self):
+        self.client.login(username="user", password="secret")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("events"))
+        stats = profiling.stats()["events"]
+        self.assertEqual(1, stats["requests"])
+        self.assertEqual(len(queries), stats["queries"]["max"])
+        self.assertEqual(len(response.content), stats["size"]["max"])
+        self.assertGreater(stats["time"]["max"], 0)
+        # the DEBUG cursor is left as it was
+        self.assertEqual(len(queries), len(connection.queries))
+
+    @override_settings(PROFILING={'DEFAULT_BUDGET': {'queries': 0, 'time': None}})
+    def test_requests_over_budget_are_flagged(self):
+        self.client.login(username="user", password="secret")
+        self.client.get(reverse("events"))
+        self.assertEqual(1, profiling.stats()["events"]["over_budget"])
+
+    def test_stats_are_staff_only(self):
+        self.client.login(username="user", password="secret")
+        self.assertEqual(403, self.client.get(reverse("profiling_stats")).status_code)
+        self.client.login(username="staff", password="secret")
+        stats = json.loads(self.client.get(reverse("profiling_stats")).content.decode("utf-8"))
+        # the denied request, the current one is recorded after its response
+        self.assertEqual(1, stats["profiling_stats"]["requests"])
+
+    def test_histogram_percentiles(self):
+        histogram = profiling.Histogram((10, 100, 1000))
+        for value in [5] * 90 + [50] * 8 + [5000] * 2:
+            histogram.add(value)
+        self.assertEqual(10, histogram.percentile(0.5))
+        self.assertEqual(100, histogram.percentile(0.95))
+        self.assertEqual(5000, histogram.percentile(1))
+
+
+class BenchmarkTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_benchmark_runs_every_scenario_and_compares(self):
+        output = os.path.join(self.tmpdir, "results.json")
+        call_command("benchmark", events=2, papers=2, reviewers=2, annotations=5, paper_size=4, repeat=2,
+                     output=output, stdout=StringIO())
+        with open(output) as f:
+            results = json.load(f)
+        scenarios = results["scenarios"]
+        self.assertEqual({"200": 2}, scenarios["paper review"]["status"])
+        self.assertEqual({"201": 2}, scenarios["annotation create"]["status"])
+        self.assertEqual({"200": 2}, scenarios["annotation update"]["status"])
+        self.assertEqual({"204": 2}, scenarios["annotation delete"]["status"])
+        self.assertEqual({"200": 2}, scenarios["event download"]["status"])
+        self.assertGreater(scenarios["event detail"]["queries"]["max"], 0)
+        # everything generated is rolled back
+        self.assertFalse(Event.objects.exists())
+
+        results["scenarios"]["home"]["queries"]["max"] = 0
+        previous = os.path.join(self.tmpdir, "previous.json")
+        with open(previous, "w") as f:
+            json.dump(results, f)
+        out = StringIO()
+        call_command("benchmark", events=1, papers=1, reviewers=1, annotations=1, paper_size=4, repeat=1,
+                     compare=previous, threshold=1000, stdout=out)
+        self.assertIn("REGRESSION home: queries 0 ->", out.getvalue())
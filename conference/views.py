@@ -1,5 +1,5 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import HttpResponseForbidden, HttpResponse, HttpResponseRedirect
+from django.http import HttpResponseForbidden, HttpResponse, HttpResponseRedirect, JsonResponse
 from django.views.generic import ListView, DetailView, CreateView, UpdateView
 from django.views.generic.edit import FormMixin
 from django.conf import settings
@@ -8,35 +8,40 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
 from django.contrib.auth.views import login
 from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
 from django.core.urlresolvers import reverse_lazy
 from django.core.urlresolvers import reverse
 from django.utils.text import slugify
 
 from conference.models import Event, Paper, Profile, Reviewer, Chair, Review, PC_Member
-from conference.forms import EventForm, PaperForm, UserProfileForm, ReviewForm
+from conference.forms import EventForm, PaperForm, UserProfileForm, ReviewForm, UserLookupForm, SearchForm
+from conference import fragment_cache, profiling, search
+from conference.lookup import lookup_users
+from conference.paper_cache import get_paper_body, get_paper_meta, warm_paper_body
+from conference.downloads import serve_stream
+from conference.importer import default_path
+from conference import jobs
+from conference.roles import get_roles
+from conference.archive import archive_size, is_current, load_manifest, stream_event_archive
 from annotation.models import Annotation
-from wsgiref.util import FileWrapper
-from utils import import_users_from_json, import_events_from_json, close_event_jsonify
 
-from lxml import etree as et
-
-import os
 
 class StaticMixin(object):
        def get_context_data(self, **kwargs):
            context = super(StaticMixin, self).get_context_data(**kwargs)
-           context['papers'] = Paper.objects.all()[:20]
-           context['users'] = Profile.objects.all()
+           # only evaluated when the cached fragment showing them is stale
+           context['papers'] = Paper.objects.select_related('event')[:20]
            return context
 
 class HomeListView(StaticMixin, ListView):
     model = Event
-    queryset = Event.objects.filter(event_status__exact=0)
+    queryset = Event.objects.filter(event_status__exact=0).select_related('stats')
     paginate_by = 5
 
     def get_context_data(self, **kwargs):
         context = super(HomeListView, self).get_context_data(**kwargs)
-        context['closed_events'] = Event.objects.filter(event_status__exact=1)
+        context['closed_events'] = Event.objects.filter(event_status__exact=1).select_related('stats')
         return context
 
 class EventCreateView(CreateView):
@@ -51,35 +56,25 @@ class EventCreateView(CreateView):
 
 class EventDetailView(DetailView):
     model = Event
+    queryset = Event.objects.select_related('stats')
     success_url = reverse_lazy('event_detail')
 
     def get_context_data(self, **kwargs):
         context = super(EventDetailView, self).get_context_data(**kwargs)
-        # which users should be available to be chosen as Chair?
-        context['users'] = Profile.objects.all().order_by('id')
-        event = Event.objects.get(pk=self.object.pk)
-        context['chairs'] = event.chairs.all()
-        context['pc_members'] = event.pc_members.all()
-        context['papers'] = Paper.objects.filter(event=self.object)
-        for paper in context['papers']:
-            numberof_paper_reviewers = paper.get_reviewers().count()
-            number_review_for_paper = Review.objects.filter(paper__exact=paper).count()
-            if numberof_paper_reviewers > 0 :
-                if number_review_for_paper == numberof_paper_reviewers and not paper.status == 2 and not paper.status == 3:
-                    paper.wait_for_decision()
-                    paper.save()
-                    # print number_review_for_paper, numberof_paper_reviewers
-                    # print("%s is ready for decision making process" %paper)
-                else:
-                    pass
-                    # print("%s is NOT ready for decision making process" %paper)
-        for paper in context['papers']:
-            if paper.locked:
-                context['ready_to_be_closed'] = True
-            else:
-                context['ready_to_be_closed'] = False
-                break
-        context['general_reviews'] = Review.objects.filter(event__exact=event)
+        event = self.object
+        # PC members are picked with the user lookup, see UserLookupView
+        context['chairs'] = list(event.chairs.all())
+        context['pc_members'] = list(event.pc_members.all())
+        context['jobs'] = event.jobs.order_by('-id')[:5]
+        # the reviewers and reviews of every paper come from two prefetch
+        # queries, so the number of queries does not grow with the number of
+        # papers. Paper status and event readiness are kept up to date by the
+        # review-completion tracker, this page only reads them. The papers
+        # table is a cached fragment, so they're only loaded when it's stale.
+        context['papers'] = Paper.objects.filter(event=event).prefetch_related(
+            'reviewers',
+            Prefetch('review_set', queryset=Review.objects.select_related('reviewer__profile')),
+        ).order_by('id')
         return context
 
 class EventUpdateView(UpdateView):
@@ -96,7 +91,9 @@ class PaperCreateView(CreateView):
         f.slug = slugify(f.title)
         f.submited_by = self.request.user
         f.save()
-        return super(PaperCreateView, self).form_valid(form)
+        response = super(PaperCreateView, self).form_valid(form)
+        warm_paper_body(self.object)
+        return response
 
     def get_context_data(self, **kwargs):
         context = super(PaperCreateView, self).get_context_data(**kwargs)
@@ -115,11 +112,9 @@ class PaperDetailView(FormMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super(PaperDetailView, self).get_context_data(**kwargs)
         paper = Paper.objects.get(pk=self.object.pk)
-        event = paper.event
 
+        # reviewers are picked among the PC members with the user lookup
         context['reviewers'] = paper.reviewers.all()
-        context['chairs'] = event.chairs.all()
-        context['pcmembers'] = event.pc_members.all()
         context['general_reviews'] = Review.objects.filter(paper__exact=paper)
         did_general_review = False
         try:
@@ -130,9 +125,7 @@ class PaperDetailView(FormMixin, DetailView):
             did_general_review = False
         context['did_general_review'] = did_general_review
 
-        # change in production!
-        uri = "%s/%s/" %(settings.BASE_URL, self.object.pk)
-        context['annotations'] = Annotation.objects.filter(uri=uri)
+        context['annotations'] = Annotation.objects.filter(paper=paper)
         return context
 
     def post(self, request, *args, **kwargs):
@@ -171,7 +164,7 @@ def SetPaperStatus(request, pk, status):
     user = request.user
     next_redirect = get_next(request, paper)
 
-    if user in event.chairs.all():
+    if get_roles(user).is_chair(event):
         if not paper.locked:
             if status == "2":
                 paper.set_accepted()
@@ -200,17 +193,13 @@ def PaperReview(request, pk):
     # body = html.find('body')
     # paper_file.close()
 
-    if not ( request.user in paper.event.pc_members.all() or request.user in paper.event.chairs.all() ):
+    roles = get_roles(request.user)
+    if not ( roles.is_pc_member(paper.event_id) or roles.is_chair(paper.event_id) ):
         raise PermissionDenied
 
-    htmlparser = et.HTMLParser()
-    tree = et.parse(paper.paper_file.path, htmlparser)
-    body = tree.xpath("body")
-    parsed = et.tostring(body[0], method="html", pretty_print=True)
+    parsed = get_paper_body(paper)
 
-    chairs = paper.event.chairs.all()
-    reviewers = paper.reviewers.all()
-    context = {'body':body, 'paper':paper, 'parsed':parsed, 'chairs': chairs, 'reviewers':reviewers}
+    context = {'paper':paper, 'parsed':parsed, 'meta':get_paper_meta(paper)}
 
     return render(request, 'conference/paper_review.html', context)
 
@@ -237,53 +226,64 @@ class UserProfileEditView(UpdateView):
     def get_success_url(self):
         return reverse("profile", kwargs={'slug': self.request.user})
 
+def add_membership(model, **fields):
+    """
+    Inserts a Chair/PC_Member/Reviewer/Author row, relying on its unique
+    constraint instead of looking it up first. Returns False if it already
+    existed.
+    """
+    try:
+        with transaction.atomic():
+            model.objects.create(**fields)
+    except IntegrityError:
+        return False
+    return True
+
+def remove_membership(model, **fields):
+    deleted, _ = model.objects.filter(**fields).delete()
+    return deleted > 0
+
 def AddReviewerView(request, pk, user_id):
     paper = get_object_or_404(Paper, pk=pk)
-    user = get_object_or_404(Profile, pk=user_id).user
+    user = get_object_or_404(User, pk=user_id)
     next = get_next(request, paper)
 
-    if request.user in paper.event.chairs.all():
-        if user not in paper.reviewers.all():
-            if not paper.locked:
-                m = Reviewer(user=user, paper=paper)
-                m.save()
+    if get_roles(request.user).is_chair(paper.event_id):
+        if not paper.locked:
+            if add_membership(Reviewer, user=user, paper=paper):
                 messages.success(request, "You've added a reviewer to this paper!")
             else:
-                messages.warning(request, "Paper is closed now. You'd better not edit reviewers!")
+                messages.warning(request, "This user is already in reviewers!")
         else:
-            messages.warning(request, "This user is already in reviewers!")
+            messages.warning(request, "Paper is closed now. You'd better not edit reviewers!")
         return HttpResponseRedirect(next)
     else:
         raise PermissionDenied
 
 def RemoveReviewerView(request, pk, user_id):
     paper = get_object_or_404(Paper, pk=pk)
-    user = get_object_or_404(Profile, pk=user_id).user
+    user = get_object_or_404(User, pk=user_id)
     next = get_next(request, paper)
 
-    if request.user in paper.event.chairs.all():
-        if user in paper.reviewers.all():
-            if not paper.locked:
-                m = Reviewer.objects.get(user=user, paper=paper)
-                m.delete()
+    if get_roles(request.user).is_chair(paper.event_id):
+        if not paper.locked:
+            if remove_membership(Reviewer, user=user, paper=paper):
                 messages.success(request, "You've removed a reviewer from this paper!")
             else:
-                messages.warning(request, "Paper is closed now. You'd better not edit reviewers!")
+                messages.warning(request, "This user is not in reviewers!")
         else:
-            messages.warning(request, "This user is not in reviewers!")
+            messages.warning(request, "Paper is closed now. You'd better not edit reviewers!")
         return HttpResponseRedirect(next)
     else:
         raise PermissionDenied
 
 def AddChair(request, pk, user_id):
     event = get_object_or_404(Event, pk=pk)
-    user = get_object_or_404(Profile, pk=user_id).user
+    user = get_object_or_404(User, pk=user_id)
     next = get_next(request, event)
 
     if request.user.is_staff:
-        if not user in event.chairs.all():
-            m = Chair(user=user, event=event)
-            m.save()
+        if add_membership(Chair, user=user, event=event):
             messages.success(request, "You've added a chair to this event!")
         return HttpResponseRedirect(next)
     else:
@@ -291,13 +291,11 @@ def AddChair(request, pk, user_id):
 
 def RemoveChair(request, pk, user_id):
     event = get_object_or_404(Event, pk=pk)
-    user = get_object_or_404(Profile, pk=user_id).user
+    user = get_object_or_404(User, pk=user_id)
     next = get_next(request, event)
 
     if request.user.is_staff:
-        if user in event.chairs.all():
-            m = Chair.objects.get(user=user, event=event)
-            m.delete()
+        if remove_membership(Chair, user=user, event=event):
             messages.warning(request, "You've removed a chair from this event!")
         return HttpResponseRedirect(next)
     else:
@@ -305,13 +303,11 @@ def RemoveChair(request, pk, user_id):
 
 def AddPCMember(request, pk, user_id):
     event = get_object_or_404(Event, pk=pk)
-    user = get_object_or_404(Profile, pk=user_id).user
+    user = get_object_or_404(User, pk=user_id)
     next = get_next(request, event)
 
     if request.user.is_staff:
-        if not user in event.pc_members.all():
-            m = PC_Member(user=user, event=event)
-            m.save()
+        if add_membership(PC_Member, user=user, event=event):
             messages.success(request, "You've added a PC Member to this event!")
         return HttpResponseRedirect(next)
     else:
@@ -319,13 +315,11 @@ def AddPCMember(request, pk, user_id):
 
 def RemovePCMember(request, pk, user_id):
     event = get_object_or_404(Event, pk=pk)
-    user = get_object_or_404(Profile, pk=user_id).user
+    user = get_object_or_404(User, pk=user_id)
     next = get_next(request, event)
 
     if request.user.is_staff:
-        if user in event.pc_members.all():
-            m = PC_Member.objects.get(user=user, event=event)
-            m.delete()
+        if remove_membership(PC_Member, user=user, event=event):
             messages.warning(request, "You've removed a PC Member to this event!")
         return HttpResponseRedirect(next)
     else:
@@ -335,9 +329,10 @@ def CloseEventView(request, pk):
     event = get_object_or_404(Event, pk=pk)
     next = get_next(request, event)
 
-    if request.user in event.chairs.all() or request.user.is_staff:
+    if get_roles(request.user).is_chair(event) or request.user.is_staff:
         event.close()
-        close_event_jsonify(event.id)
+        # writing the paper files and the archive runs in the job queue
+        jobs.enqueue('close_event', key=jobs.close_event_key(event), event=event, event_id=event.pk)
         messages.warning(request, "You've just closed this event! Only a PAREA staff can reopen it now.")
         return HttpResponseRedirect(next)
     else:
@@ -357,37 +352,68 @@ def ReopenEventView(request, pk):
 
 def DownloadEventZippedView(request, pk):
     event = get_object_or_404(Event, pk=pk)
-    next = get_next(request, event)
 
-    if request.user in event.chairs.all() or request.user.is_staff:
+    if get_roles(request.user).is_chair(event) or request.user.is_staff:
         is_chair_or_head = True
     else:
         is_chair_or_head = False
 
     if is_chair_or_head:
-        event_path = os.path.join(settings.MEDIA_ROOT, event.acronym)
-        event_zip_path = os.path.join(event_path, event.acronym)
-        zip_file = os.path.join(event_zip_path + ".tar")
-        print event_path
-        print event_zip_path
-        print zip_file
-        opened_zip = open(zip_file, 'rb')
-        resp = HttpResponse(opened_zip, content_type="application/tar")
-        resp['Content-Disposition'] = 'attachment; filename=%s' % zip_file
-        opened_zip.close()
-
-        return resp
+        manifest = load_manifest(event)
+        if manifest is None or not is_current(event, manifest):
+            jobs.enqueue('build_archive', key=jobs.archive_key(event), event=event, event_id=event.pk)
+            messages.info(request, "The archive of this event is being built, try again in a moment.")
+            return redirect(event)
+        return serve_stream(request, lambda start, end: stream_event_archive(event, manifest, start, end),
+                            archive_size(event, manifest), manifest['built'], "application/tar",
+                            filename=event.acronym + ".tar")
     else:
         return HttpResponseForbidden()
 
 def ImportUsersView(request):
-    import_users_from_json()
+    if not request.user.is_staff:
+        raise PermissionDenied
+    jobs.enqueue('import_users', key='import_users', path=default_path('users'))
+    messages.info(request, "Importing users in the background, they will show up in a moment.")
     return redirect('home')
 
 def ImportEventsView(request):
-    import_events_from_json()
+    if not request.user.is_staff:
+        raise PermissionDenied
+    jobs.enqueue('import_events', key='import_events', path=default_path('events'))
+    messages.info(request, "Importing events in the background, they will show up in a moment.")
     return redirect('home')
 
+def UserLookupView(request):
+    form = UserLookupForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    data = form.cleaned_data
+    results, next_cursor = lookup_users(data['q'], data['cursor'], data['limit'], data['event'], data['paper'])
+    return JsonResponse({'results': results, 'next': next_cursor})
+
+def SearchView(request):
+    form = SearchForm(request.GET or None)
+    results = None
+    if form.is_valid():
+        data = form.cleaned_data
+        # staff see everything, others the reviews, annotations and paper
+        # text of the events they chair
+        chair_events = None if request.user.is_staff else get_roles(request.user).roles['chair']
+        results = search.search(data['q'], limit=getattr(settings, 'SEARCH_RESULTS', 50),
+                                event_id=data['event'], kinds=data['kind'], chair_events=chair_events)
+    return render(request, 'conference/search.html', {'form': form, 'results': results})
+
+def FragmentCacheStatsView(request):
+    if not request.user.is_staff:
+        raise PermissionDenied
+    return JsonResponse(fragment_cache.counters())
+
+def ProfilingStatsView(request):
+    if not request.user.is_staff:
+        raise PermissionDenied
+    return JsonResponse(profiling.stats())
+
 def get_next(request, item):
     if 'next' in request.GET:
         next = request.GET['next']
@@ -402,9 +428,7 @@ def get_next(request, item):
 
 def EventsView(request):
     events = Event.objects.all().order_by('-create_date')
-    open_events = Event.objects.filter(event_status__exact=0)
-    closed_events = Event.objects.filter(event_status__exact=1)
-    context = {'events':events, 'open_events':open_events, 'closed_events':closed_events}
+    context = {'events':events}
     return render(request, 'conference/events.html', context)
 
 def custom_login(request):
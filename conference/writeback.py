@@ -0,0 +1,312 @@
+"""
+Writes the annotations, reviews and decision of every paper of a closed
+event into a copy of its RASH file, ``<file>.annotated.html`` next to it.
+
+Annotator ranges are an XPath to an element (relative to the paper body,
+``#paper-body`` in paper_review.html, e.g. ``/section[2]/p[3]``) and a character offset into the text content of
+that element. Reviewers annotate the sanitized rendition of the paper (see
+conference/rendition.py), so the body is run through the same cleaner
+before the ranges are resolved. Each paper is parsed once, every distinct XPath is evaluated
+once, and all the text of the body is numbered in a single walk, so every
+range boundary becomes a global character offset. The boundaries are then
+sorted and swept together with the text nodes in document order, which
+splits each text node at most once per boundary it contains: highlighting
+n annotations costs O(text + n log n) instead of one tree walk per range.
+
+Highlighted text is wrapped in ``<span class="parea-annotation"
+data-annotation-ids="...">`` (overlapping annotations share spans), and
+the annotations and reviews are appended as ``parea-annotations`` and
+``parea-reviews`` sections. The paper file itself is never changed, so the
+review page and the ranges of a reopened event stay the same and closing
+it again rewrites the copy from the same text.
+
+Papers are processed in parallel, one paper per worker process, and every
+copy is written atomically.
+"""
+import multiprocessing
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection
+from lxml import etree as et
+from lxml import html
+
+from annotation.models import Annotation
+from conference.models import Paper, Review
+from conference.rendition import cleaner, write_atomically
+
+
+HIGHLIGHT_CLASS = "parea-annotation"
+ANNOTATIONS_ID = "parea-annotations"
+REVIEWS_ID = "parea-reviews"
+
+
+def output_path(path):
+    return path + ".annotated.html"
+
+
+def number_text(body):
+    """
+    Returns the text slots of ``body`` in document order as ``(element,
+    'text' or 'tail', global offset, text)``, and the ``(start, end)``
+    global offsets of the text content of every element.
+    """
+    slots = []
+    bounds = {}
+    offset = 0
+    # (element, entering) pairs, the tail of an element follows its end
+    stack = [(body, True)]
+    while stack:
+        element, entering = stack.pop()
+        if entering:
+            start = offset
+            # comments and processing instructions aren't text content
+            if not callable(element.tag) and element.text:
+                slots.append((element, 'text', offset, element.text))
+                offset += len(element.text)
+            stack.append((element, False))
+            bounds[element] = [start, None]
+            for child in reversed(element):
+                stack.append((child, True))
+        else:
+            bounds[element][1] = offset
+            if element is not body and element.tail:
+                slots.append((element, 'tail', offset, element.tail))
+                offset += len(element.tail)
+    return slots, bounds
+
+
+def resolve(body, xpath, elements):
+    if xpath not in elements:
+        try:
+            found = body.xpath("." + xpath) if xpath else [body]
+        except et.XPathError:
+            found = []
+        # the path may select text or attributes, only elements have offsets
+        elements[xpath] = found[0] if found and hasattr(found[0], 'tag') else None
+    return elements[xpath]
+
+
+def global_offset(bounds, element, offset):
+    if element is None or element not in bounds:
+        return None
+    start, end = bounds[element]
+    if not 0 <= offset <= end - start:
+        return None
+    return start + offset
+
+
+def split_slots(slots, intervals):
+    """
+    Yields every text slot that intersects an interval, with its text cut
+    into ``(text, annotation ids)`` pieces.
+    """
+    starts, ends = defaultdict(list), defaultdict(list)
+    for start, end, annotation_id in intervals:
+        starts[start].append(annotation_id)
+        ends[end].append(annotation_id)
+    points = sorted(set(starts) | set(ends))
+    active = Counter()
+
+    def apply(point):
+        for annotation_id in ends[point]:
+            active[annotation_id] -= 1
+            if not active[annotation_id]:
+                del active[annotation_id]
+        for annotation_id in starts[point]:
+            active[annotation_id] += 1
+
+    i = 0
+    for slot in slots:
+        _, _, start, text = slot
+        end = start + len(text)
+        while i < len(points) and points[i] <= start:
+            apply(points[i])
+            i += 1
+        if not active and (i == len(points) or points[i] >= end):
+            continue
+        pieces, cut = [], start
+        while i < len(points) and points[i] < end:
+            pieces.append((text[cut - start:points[i] - start], tuple(sorted(active))))
+            apply(points[i])
+            cut = points[i]
+            i += 1
+        pieces.append((text[cut - start:], tuple(sorted(active))))
+        yield slot, pieces
+
+
+def merge_pieces(pieces):
+    merged = []
+    for text, ids in pieces:
+        if not text:
+            continue
+        if not text.strip():
+            # like Annotator, whitespace only text is never highlighted
+            ids = ()
+        if merged and merged[-1][1] == ids:
+            merged[-1] = (merged[-1][0] + text, ids)
+        else:
+            merged.append((text, ids))
+    return merged
+
+
+def highlight(slot, pieces):
+    element, kind, _, _ = slot
+    pieces = merge_pieces(pieces)
+    if not any(ids for _, ids in pieces):
+        return
+    lead = pieces[0][0] if not pieces[0][1] else ""
+    if kind == 'text':
+        element.text = lead
+        parent, index = element, 0
+    else:
+        element.tail = lead
+        parent = element.getparent()
+        index = parent.index(element) + 1
+    span = None
+    for text, ids in pieces[1 if lead else 0:]:
+        if not ids:
+            span.tail = text
+            continue
+        span = html.Element("span")
+        span.set("class", HIGHLIGHT_CLASS)
+        span.set("data-annotation-ids", " ".join(ids))
+        span.text = text
+        parent.insert(index, span)
+        index += 1
+
+
+def section(section_id, title):
+    element = html.Element("section")
+    element.set("id", section_id)
+    heading = et.SubElement(element, "h1")
+    heading.text = title
+    return element
+
+
+def paragraph(parent, text, css_class=None):
+    p = et.SubElement(parent, "p")
+    if css_class:
+        p.set("class", css_class)
+    p.text = text
+    return p
+
+
+def append_annotations(body, annotations):
+    notes = section(ANNOTATIONS_ID, "Annotations")
+    for annotation in annotations:
+        note = et.SubElement(notes, "div")
+        note.set("id", "%s-%s" % (HIGHLIGHT_CLASS, annotation['id']))
+        note.set("class", "parea-annotation-note")
+        paragraph(note, annotation['quote'], "quote")
+        paragraph(note, annotation['text'])
+        paragraph(note, annotation['user'], "author")
+    body.append(notes)
+
+
+def append_reviews(body, decision, reviews):
+    element = section(REVIEWS_ID, "Reviews")
+    paragraph(element, "Decision: %s" % decision, "decision")
+    for review in reviews:
+        div = et.SubElement(element, "div")
+        div.set("class", "parea-review")
+        paragraph(div, "%s: %s, %s" % (review['reviewer'], review['decision'], review['rate']))
+        paragraph(div, review['comment'])
+    body.append(element)
+
+
+def write_back(path, annotations, decision, reviews):
+    """
+    Embeds ``annotations`` (dicts with id, quote, text, user and ranges of
+    ``(start, startOffset, end, endOffset)``) and the reviews into the
+    sanitized body of the paper at ``path`` and writes it to
+    ``output_path(path)``. Returns ``(highlighted ranges, unresolved
+    ranges)``.
+    """
+    # papers are UTF-8, libxml2 would read a file without a charset
+    # declaration as Latin-1 and write it back double-encoded
+    tree = html.parse(path, html.HTMLParser(encoding="utf-8"))
+    body = tree.getroot().find("body")
+    if body is None:
+        body = html.Element("body")
+        tree.getroot().append(body)
+    # the DOM the ranges were recorded against
+    cleaner(body)
+
+    slots, bounds = number_text(body)
+    elements = {}
+    intervals, unresolved = [], 0
+    for annotation in annotations:
+        for start, start_offset, end, end_offset in annotation['ranges']:
+            start = global_offset(bounds, resolve(body, start, elements), start_offset)
+            end = global_offset(bounds, resolve(body, end, elements), end_offset)
+            if start is None or end is None or end < start:
+                unresolved += 1
+            elif end > start:
+                intervals.append((start, end, str(annotation['id'])))
+
+    for slot, pieces in list(split_slots(slots, intervals)):
+        highlight(slot, pieces)
+    append_annotations(body, annotations)
+    append_reviews(body, decision, reviews)
+
+    write_atomically(output_path(path), et.tostring(tree, method="html", encoding="utf-8"))
+    return len(intervals), unresolved
+
+
+def write_back_job(job):
+    path, annotations, decision, reviews = job
+    return (path,) + write_back(path, annotations, decision, reviews)
+
+
+def event_jobs(event):
+    papers = list(Paper.objects.filter(event=event).order_by('id'))
+    annotations = defaultdict(list)
+    annotated = Annotation.objects.filter(paper__event=event).prefetch_related('ranges').order_by('created', 'id')
+    for annotation in annotated:
+        annotations[annotation.paper_id].append({
+            'id': str(annotation.pk),
+            'quote': annotation.quote,
+            'text': annotation.text,
+            'user': annotation.user_username or "",
+            'ranges': [(r.start, r.startOffset, r.end, r.endOffset) for r in annotation.ranges.all()],
+        })
+    reviews = defaultdict(list)
+    for review in Review.objects.filter(paper__event=event).select_related('reviewer').order_by('id'):
+        reviews[review.paper_id].append({
+            'reviewer': review.reviewer.username,
+            'decision': review.get_decision_display(),
+            'rate': review.get_rate_display(),
+            'comment': review.comment,
+        })
+    return [(paper.paper_file.path, annotations[paper.pk], paper.get_status_display(), reviews[paper.pk])
+            for paper in papers]
+
+
+def write_back_event(event, workers=None, progress=None):
+    """
+    Writes back every paper of ``event`` using ``workers`` processes (all
+    cores by default) and returns ``{path: (highlighted, unresolved)}``.
+    ``progress(done, total)`` is called after every paper.
+    """
+    jobs = event_jobs(event)
+    workers = workers or getattr(settings, 'WRITEBACK_WORKERS', None) or multiprocessing.cpu_count()
+    results = {}
+    if workers == 1 or len(jobs) < 2:
+        outcomes = (write_back_job(job) for job in jobs)
+        pool = None
+    else:
+        # the workers only touch files, they must not share the connection
+        connection.close()
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        outcomes = pool.imap_unordered(write_back_job, jobs)
+    try:
+        for path, highlighted, unresolved in outcomes:
+            results[path] = (highlighted, unresolved)
+            if progress:
+                progress(len(results), len(jobs))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return results
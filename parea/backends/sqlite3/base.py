@@ -0,0 +1,25 @@
+"""
+SQLite backend tuned for concurrent requests.
+
+* New connections run the pragmas in SQLITE_PRAGMAS, WAL journaling by
+  default so page views keep reading while an annotation is written.
+* Transactions start with BEGIN IMMEDIATE. A plain BEGIN reads under a
+  shared lock and fails at once with "database is locked" when it later
+  needs to write while another connection holds the write lock; taking
+  the write lock up front makes writers queue on the busy timeout instead.
+"""
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_new_connection(self, conn_params):
+        conn = super(DatabaseWrapper, self).get_new_connection(conn_params)
+        if not self.is_in_memory_db(self.settings_dict['NAME']):
+            for name, value in getattr(settings, 'SQLITE_PRAGMAS', ()):
+                conn.execute("PRAGMA %s = %s" % (name, value))
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute("BEGIN IMMEDIATE")
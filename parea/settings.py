@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/1.9/ref/settings/
 """
 
 import os
+from django.core.exceptions import ImproperlyConfigured
 from django.core.urlresolvers import reverse_lazy
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -56,6 +57,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE_CLASSES = [
+    'conference.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -91,12 +93,54 @@ WSGI_APPLICATION = 'parea.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/1.9/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# PAREA_DB selects the database profile: 'sqlite' (the default) or
+# 'postgresql', configured by the PAREA_DB_* environment variables.
+# Connections are kept open for PAREA_DB_CONN_MAX_AGE seconds.
+DATABASE_PROFILE = os.environ.get('PAREA_DB', 'sqlite')
+CONN_MAX_AGE = int(os.environ.get('PAREA_DB_CONN_MAX_AGE', 60))
+# milliseconds a single query may run on PostgreSQL, 0 for no limit
+STATEMENT_TIMEOUT = int(os.environ.get('PAREA_DB_STATEMENT_TIMEOUT', 30000))
+
+if DATABASE_PROFILE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql_psycopg2',
+            'NAME': os.environ.get('PAREA_DB_NAME', 'parea'),
+            'USER': os.environ.get('PAREA_DB_USER', ''),
+            'PASSWORD': os.environ.get('PAREA_DB_PASSWORD', ''),
+            'HOST': os.environ.get('PAREA_DB_HOST', ''),
+            'PORT': os.environ.get('PAREA_DB_PORT', ''),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'OPTIONS': {
+                'options': '-c statement_timeout=%d' % STATEMENT_TIMEOUT,
+            },
+        }
     }
-}
+elif DATABASE_PROFILE == 'sqlite':
+    DATABASES = {
+        'default': {
+            # WAL pragmas and write transactions, see parea/backends/sqlite3
+            'ENGINE': 'parea.backends.sqlite3',
+            'NAME': os.environ.get('PAREA_DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'OPTIONS': {
+                # seconds a writer waits for the database lock
+                'timeout': 20,
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured("Unknown PAREA_DB profile %r" % DATABASE_PROFILE)
+
+# Pragmas run on every new SQLite connection, see parea/backends/sqlite3.
+# WAL lets page views read while an annotation is being written.
+SQLITE_PRAGMAS = [
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -32000),
+    ('temp_store', 'MEMORY'),
+    ('mmap_size', 128 * 1024 * 1024),
+]
 
 
 # Password validation
@@ -144,3 +188,82 @@ PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 STATIC_URL = '/static/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL='/media/'
+
+# Rendered paper bodies shown by PaperReview, see conference/paper_cache.py
+PAPER_CACHE = {
+    'BACKEND': 'lru',
+    'MAX_BYTES': 64 * 1024 * 1024,
+}
+
+# Seconds a user's chair/PC/reviewer/author memberships stay in the cache
+# between requests, 0 reads them once per request, see conference/roles.py.
+# Only used when CACHES points at a backend shared by every process
+# (memcached, redis, database), see conference/caching.py
+ROLE_CACHE_TIMEOUT = 300
+
+# Event archive downloads, see conference/downloads.py
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Page size of the annotation search endpoint (Annotator `limit` parameter)
+ANNOTATION_SEARCH_DEFAULT_LIMIT = 20
+ANNOTATION_SEARCH_MAX_LIMIT = 1000
+
+# Keyset pages of the annotations index, and the chunk size of ?stream=1
+ANNOTATION_INDEX_PAGE_SIZE = 100
+ANNOTATION_INDEX_MAX_PAGE_SIZE = 1000
+ANNOTATION_STREAM_CHUNK_SIZE = 500
+
+# Operations accepted by one request to the annotation batch endpoint
+ANNOTATION_BATCH_MAX_SIZE = 1000
+
+# Cached listing fragments, versioned by model signals, see
+# conference/fragment_cache.py. A TIMEOUT of 0 disables them, so does a
+# CACHE_ALIAS that isn't shared by every process (the default LocMemCache)
+FRAGMENT_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 600,
+}
+
+# User lookup endpoint of the PC member / reviewer pickers, see
+# conference/lookup.py. A cache timeout of 0 disables the result cache,
+# which is only used when the cache is shared by every process
+USER_LOOKUP_PAGE_SIZE = 20
+USER_LOOKUP_MAX_PAGE_SIZE = 100
+USER_LOOKUP_CACHE_TIMEOUT = 60
+
+# Store the sanitized paper renditions gzip-compressed, see
+# conference/rendition.py
+RENDITION_GZIP = False
+
+# Background job queue run by `manage.py run_jobs`, see conference/jobs.py
+JOB_WORKERS = 2
+JOB_POLL_INTERVAL = 1.0
+JOB_MAX_ATTEMPTS = 3
+# seconds before the first retry, doubled for every further attempt
+JOB_RETRY_DELAY = 30
+# run_jobs refreshes the heartbeat of the jobs whose process is alive this
+# often; a running job without a heartbeat for JOB_STALE_AFTER seconds lost
+# its run_jobs and counts as a failed attempt
+JOB_HEARTBEAT_INTERVAL = 60
+JOB_STALE_AFTER = 600
+
+# Processes writing annotations and reviews back into the papers of a closed
+# event, see conference/writeback.py; None uses every core
+WRITEBACK_WORKERS = None
+
+# Hits shown by the full-text search page, see conference/search.py
+SEARCH_RESULTS = 50
+
+# Per-view request profiling and query / time (ms) budgets, see
+# conference/profiling.py
+PROFILING = {
+    'ENABLED': True,
+    'DEFAULT_BUDGET': {'queries': 50, 'time': 1000},
+    'BUDGETS': {
+        'home': {'queries': 20},
+        'event_detail': {'queries': 30},
+        'index_create': {'queries': 20, 'time': 250},
+        'full_text_search': {'queries': 5, 'time': 500},
+    },
+    'LOG_INTERVAL': 300,
+}
@@ -13,7 +13,9 @@ from conference.views import PaperCreateView, PaperDetailView, PaperReview
 from conference.views import AddReviewerView, RemoveReviewerView
 from conference.views import AddChair, RemoveChair, AddPCMember, RemovePCMember
 from conference.views import RemoveGeneralReview, custom_login
-from conference.views import SetPaperStatus, ImportUsersView, ImportEventsView
+from conference.views import SetPaperStatus, ImportUsersView, ImportEventsView, FragmentCacheStatsView
+from conference.views import ProfilingStatsView
+from conference.views import UserLookupView, SearchView
 
 from django.contrib.flatpages import views
 
@@ -59,6 +61,10 @@ urlpatterns = [
 
     url(r'^import-users/$', ImportUsersView, name='import_users'),
     url(r'^import-events/$', ImportEventsView, name='import_events'),
+    url(r'^fragment-cache/$', FragmentCacheStatsView, name='fragment_cache_stats'),
+    url(r'^profiling/$', ProfilingStatsView, name='profiling_stats'),
+    url(r'^users/lookup/$', auth(UserLookupView), name='user_lookup'),
+    url(r'^find/$', auth(SearchView), name='full_text_search'),
 
     url(r'^about-us/$', views.flatpage, {'url': '/about-us/'}, name='about'),
     url(r'^help/$', views.flatpage, {'url': '/help/'}, name='help'),